@@ -28,10 +28,14 @@ memColour = "black"
 chMemColour = "red"
 bpColour = "grey"
 errColour = "pink"
+uncovColour = "khaki1"  # Code coverage: line not executed
+partcovColour = "light yellow"  # Code coverage: branch only went one way
 indent = 4
 iportColour = "royal blue"
 oportColour = "green3"
 ioportColour = "aquamarine4"  # "cyan4"#"PaleTurquoise4"
+clockRate = 10000  # Emulated CPU clock (cycles per second) for timed IO devices
+frameRate = 25  # IO port display refreshes per second
 
 highlights = {
     "blue": [
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# CdM8 IDE and emulator
+# (c) M L Walters and A Shafarenko June-July 2018
+
+####### CDM8 co-simulation protocol and stand-in simulator
+# V1.0 Binary bus transaction protocol between cdm8_dev.Bridge and an
+#      external simulator, over a pipe or a local socket. Run this module
+#      as a stand-in simulator (a latch per address) for tests
+
+
+# Python3 and 2
+from __future__ import absolute_import, division, print_function
+
+import struct
+
+# Transactions, emulator to simulator: op, address, value, cycle (low 32 bits)
+RECORD = struct.Struct(">BBBI")
+WRITE = ord("W")  # No reply
+READ = ord("R")  # Reply: value, interrupt (bit 7 request, bits 0-1 vector)
+CLOSE = ord("C")  # No reply, end of session
+REPLY = struct.Struct(">BB")
+INTREQ = 0b10000000
+
+
+class Simulator:
+    """
+    Stand-in for an external circuit simulator: each address is a latch,
+    reads return the last value written. Subclass and override read() and
+    write() to model other circuits. Set self.interrupt to a vector to
+    request an interrupt with the next read reply.
+    """
+
+    def __init__(self):
+        self.latches = [0] * 256
+        self.interrupt = None
+        self.writes = 0
+        self.reads = 0
+
+    def write(self, adr, val, cycle):
+        self.latches[adr] = val
+        self.writes += 1
+
+    def read(self, adr, cycle):
+        self.reads += 1
+        return self.latches[adr]
+
+    def reply(self, adr, cycle):
+        val = self.read(adr, cycle)
+        irq = 0
+        if self.interrupt is not None:
+            irq = INTREQ | self.interrupt
+            self.interrupt = None
+        return REPLY.pack(val, irq)
+
+
+def readFull(stream, size):
+    # Read exactly size bytes, or fewer at end of file
+    data = b""
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def serve(infile, outfile, sim=None):
+    # Run sim on the transactions read from binary stream infile, replies to
+    # outfile, until CLOSE or end of file. Returns the simulator
+    sim = sim or Simulator()
+    while True:
+        data = readFull(infile, RECORD.size)
+        if len(data) < RECORD.size:
+            break
+        op, adr, val, cycle = RECORD.unpack(data)
+        if op == WRITE:
+            sim.write(adr, val, cycle)
+        elif op == READ:
+            outfile.write(sim.reply(adr, cycle))
+            outfile.flush()
+        elif op == CLOSE:
+            break
+    return sim
+
+
+def listen(port, sim=None, host="127.0.0.1"):
+    # Serve one connection on a local socket
+    import socket
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(1)
+    conn, addr = server.accept()
+    stream = conn.makefile("rwb")
+    try:
+        return serve(stream, stream, sim)
+    finally:
+        stream.close()
+        conn.close()
+        server.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="CdM-8 Stand-in Simulator v1.0")
+    parser.add_argument(
+        "--port", type=int, help="Listen on a local socket, else stdin/stdout"
+    )
+    args = parser.parse_args()
+    if args.port:
+        sim = listen(args.port)
+    else:
+        sim = serve(sys.stdin.buffer, sys.stdout.buffer)
+    print("%d writes, %d reads" % (sim.writes, sim.reads), file=sys.stderr)
@@ -0,0 +1,1127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# CdM8 IDE and emulator
+# (c) M L Walters and A Shafarenko June-July 2018
+
+####### CDM8 IO device models
+# V1.0 Headless models of the cdm8_io ports: registers, address map and
+#      interrupts, no Tk. The cdm8_io ports are views of these models
+# V1.1 Scripted input: InputScript plays (cycle, value) events into a device
+#      on the emulator's clock. Keyboard and buttons queue input in a FIFO
+#      until the program reads it
+# V1.2 DMA controller: block copies within and between memory pages,
+#      charged in cycles, completion interrupt
+# V1.3 Terminal: data and status ports, buffered output to views or a
+#      stream (stdout, file), input from Tk keys, a stream (stdin) or script
+# V1.4 Framebuffer: 32x32 mono or 16x16 16 colour pixels, changed rows
+#      tracked for views, PNG and NumPy export
+# V1.5 Bridge: forwards an IO address range to an external simulator,
+#      batched bus transactions (cdm8_cosim protocol)
+# V1.6 MemMgr: memory manager, port writes remap logical memory pages
+# V1.7 ast only imported to read input scripts (toolchain import time)
+
+
+# Python3 and 2
+from __future__ import absolute_import, division, print_function
+
+from collections import deque
+import struct
+import zlib
+
+import cdm8_asm as cf  # Configuration and defaults file
+import cdm8_cosim as cosim
+
+
+class Device:
+    """
+    Memory mapped IO device model. attach(emu) maps its addresses into the
+    emulator's port tables (CDM8Emu.mapPort()): loads from input addresses
+    return self.portIPvals[adr] then call getIPval(), stores to output
+    addresses call setOPval(adr, val).
+
+    Views (or scripts) subscribe(func) to be called as func(device) after
+    the device changes. onError(message) is called for run time errors
+    returned by setOPval().
+
+    Subclasses set the address map in setAddress(adr), for span()
+    addresses from adr. An address that would put a port past 0xFF is
+    rejected (see fits()).
+    """
+
+    name = "Device"
+
+    def __init__(self, portAdr=0xF0, emu=None):
+        self.portAdr = portAdr
+        self.portIPvals = {}  # Input port {address: value}
+        self.portOPvals = {}  # Output port {address: value}
+        self.views = []
+        self.onError = None
+        self.emu = None  # Emulator the device is attached to
+        self.mapped = []  # Addresses mapped in self.emu
+        if not self.fits(portAdr):
+            raise ValueError(
+                "%s needs %d ports from %02X, past FF"
+                % (self.name, self.span(), portAdr)
+            )
+        self.setAddress(portAdr)
+        if emu:
+            self.attach(emu)
+
+    def span(self):
+        # Number of port addresses from the base address
+        return 1
+
+    def fits(self, adr, span=None):
+        # All the device's ports, from base address adr, are within 0-0xFF
+        return 0 <= adr and adr + (span or self.span()) <= 0x100
+
+    def setAddress(self, adr):
+        # Move the device to base address adr. Returns False, and the
+        # device stays where it is, if its ports would not fit
+        if not self.fits(adr):
+            return False
+        self.portAdr = adr
+        self.remap()
+        self.changed()
+        return True
+
+    def getIPadr(self):
+        return list(self.portIPvals.keys())
+
+    def getOPadr(self):
+        return list(self.portOPvals.keys())
+
+    def subscribe(self, func):
+        self.views.append(func)
+
+    def unsubscribe(self, func):
+        if func in self.views:
+            self.views.remove(func)
+
+    def changed(self):
+        for func in self.views:
+            func(self)
+
+    def attach(self, emu):
+        # Map the device's addresses into emulator emu's port tables
+        self.detach()
+        self.emu = emu
+        self.remap()
+
+    def detach(self):
+        self.unmap()
+        self.emu = None
+
+    def unmap(self):
+        # Remove the device's addresses from the emulator's port tables,
+        # it stays attached (see remap())
+        if self.emu:
+            for adr in self.mapped:
+                if self.emu.inPorts[adr] == self.readPort:
+                    self.emu.unmapPort(adr)
+                elif self.emu.outPorts[adr] == self.writePort:
+                    self.emu.unmapPort(adr)
+        self.mapped = []
+
+    def remap(self):
+        # Update the emulator's port tables if the addresses changed
+        if not self.emu:
+            return
+        ipadrs = self.getIPadr()
+        opadrs = self.getOPadr()
+        if self.mapped != ipadrs + opadrs:
+            emu = self.emu
+            self.unmap()
+            self.mapped = ipadrs + opadrs
+            for adr in set(self.mapped):
+                emu.mapPort(
+                    adr,
+                    read=self.readPort if adr in ipadrs else None,
+                    write=self.writePort if adr in opadrs else None,
+                )
+
+    def readPort(self, adr):
+        # Load from an input port address by the emulator
+        val = self.portIPvals.get(adr, 0)
+        self.getIPval()  # Device actions on read, e.g. reset on read
+        return val
+
+    def writePort(self, adr, val):
+        # Store to an output port address by the emulator
+        errormsg = self.setOPval(adr, val)
+        if errormsg and self.onError:
+            self.onError(errormsg)
+
+    def getIPval(self):
+        return self.portIPvals.values()
+
+    def setOPval(self, adr=None, val=0):
+        if adr == None:
+            adr = self.portAdr
+        if adr in self.portOPvals:
+            self.portOPvals[adr] = val
+            self.changed()
+
+    def resetPort(self):
+        for adr in self.portOPvals:
+            self.portOPvals[adr] = 0
+        self.changed()
+
+    def setInterrupt(self, vector=0):
+        # Hardware interrupt request, serviced after the current instruction
+        if self.emu:
+            self.emu.intc.request(vector)
+
+    def input(self, value):
+        # Scripted input event, see InputScript
+        return None
+
+    def play(self, script):
+        # Play an input script (see readScript()) into the device. Returns
+        # the InputScript
+        player = InputScript(self, script)
+        player.start()
+        return player
+
+
+class LEDs8x1(Device):
+    # 8 LEDs, one output port. Bit n lights LED n
+    name = "LEDs8x1"
+
+    def setAddress(self, adr):
+        self.portOPvals = {adr: 0x00}
+        self.portIPvals = {}
+        Device.setAddress(self, adr)
+
+
+class Keybd7Bit(Device):
+    # 16 character keyboard buffer on one input port: the next character,
+    # or bit 7 set if empty. Reading removes the character. Return and
+    # Ctrl+C raise interrupts
+    name = "Keybd7Bit"
+    bufSize = 16
+
+    def __init__(self, portAdr=0xF0, emu=None):
+        self.keybBuffer = []  # Character buffer
+        self.fifo = deque()  # Scripted input waiting for room in the buffer
+        self.retVector = 0
+        self.ctrlcVector = 1
+        Device.__init__(self, portAdr, emu)
+
+    def setAddress(self, adr):
+        self.portOPvals = {}
+        self.portIPvals = {adr: 0}
+        Device.setAddress(self, adr)
+        self.update()
+
+    def update(self):
+        # Input port value (the next character)
+        if self.keybBuffer:
+            self.portIPvals[self.portAdr] = self.keybBuffer[0]
+        else:
+            self.portIPvals[self.portAdr] = 0b10000000
+        self.changed()
+
+    def returnKey(self):
+        self.setInterrupt(self.retVector)
+
+    def key(self, asc):
+        # A character typed, limited to 7 bits. Returns False if not buffered
+        asc &= 0x7F
+        if asc == 3:  # Ctrl C Interrupt
+            self.setInterrupt(self.ctrlcVector)
+            return False
+        if len(self.keybBuffer) >= self.bufSize:
+            return False
+        self.keybBuffer.append(asc)
+        self.update()
+        return True
+
+    def type(self, text):
+        # Type a string, "\n" as the Return key. Characters that do not fit
+        # in the buffer wait in the FIFO, so none are lost
+        for char in text:
+            self.fifo.append(char)
+        self.fill()
+
+    def fill(self):
+        # Move input from the FIFO to the buffer, while there is room
+        while self.fifo and len(self.keybBuffer) < self.bufSize:
+            char = self.fifo.popleft()
+            if char == "\n":
+                self.returnKey()
+            else:
+                self.key(ord(char))
+
+    def input(self, value):
+        # A string is typed, a number is one character code
+        if isinstance(value, int):
+            value = chr(value)
+        self.type(value)
+
+    def resetPort(self):
+        self.fifo.clear()
+
+    def getIPval(self):
+        ret = Device.getIPval(self)
+        if self.keybBuffer:
+            del self.keybBuffer[0]
+        self.fill()
+        self.update()
+        return ret
+
+
+class Timer(Device):
+    # Count down timer on one input/output port. Writing N > 0 starts it,
+    # it counts down once per increment (msecs of emulated CPU time, on the
+    # emulator's virtual clock) and raises the interrupt at 0. Writing 0
+    # stops it. Reads return the count
+    name = "Timer"
+
+    def __init__(self, portAdr=0xF0, emu=None):
+        self.timerValue = 0
+        self.prevTimerValue = 0
+        self.timerInc = 100  # msecs, 0.1 Sec
+        self.vector = 0
+        self.running = False
+        self.event = None
+        Device.__init__(self, portAdr, emu)
+
+    def setAddress(self, adr):
+        self.portOPvals = {adr: 0}
+        self.portIPvals = {adr: self.timerValue}
+        Device.setAddress(self, adr)
+
+    def update(self):
+        self.portIPvals[self.portAdr] = self.timerValue
+        self.portOPvals[self.portAdr] = 0
+        self.changed()
+
+    def decrTimer(self):
+        if self.timerValue > 0 and self.emu:
+            self.timerValue -= 1
+            self.event = self.emu.schedule(
+                self.timerInc * cf.clockRate // 1000, self.decrTimer
+            )
+            self.running = True
+        else:  # self.timerValue <= 0
+            if self.running or self.timerValue <= 0:
+                self.setInterrupt(self.vector)
+            self.timerValue = 0
+            self.prevTimerValue = 0
+            self.running = False
+        self.update()
+
+    def setOPval(self, adr=None, val=0):
+        if val > 0:  # New timer setting
+            self.timerValue = val
+            self.prevTimerValue = val
+        if self.timerValue > 0 and not self.running:
+            # Only if timer not currenly running start it
+            self.decrTimer()
+        elif val == 0 and self.running:  # Cancel timer
+            if self.emu:
+                self.emu.cancelEvent(self.event)
+            self.timerValue = 0
+            self.running = False
+        self.update()
+
+    def resetPort(self):
+        self.setOPval(self.portAdr, 0)
+
+
+class Buttons8x1(Device):
+    # 8 push buttons on one input port, bit n = button n down. With
+    # resetOnRead reading the port releases all buttons
+    name = "Buttons8x1"
+
+    def __init__(self, portAdr=0xF0, emu=None):
+        self.resetOnRead = True
+        self.vector = None  # Interrupt on scripted input, None for no interrupt
+        self.fifo = deque()  # Scripted states waiting to be read
+        Device.__init__(self, portAdr, emu)
+
+    def setAddress(self, adr):
+        self.portOPvals = {}
+        self.portIPvals = {adr: 0x00}
+        Device.setAddress(self, adr)
+
+    def isDown(self, button):
+        return self.portIPvals[self.portAdr] & (1 << button) != 0
+
+    def push(self, button):
+        self.portIPvals[self.portAdr] |= 1 << button
+        self.changed()
+
+    def release(self, button):
+        self.portIPvals[self.portAdr] &= ~(1 << button)
+        self.changed()
+
+    def toggle(self, button):
+        if self.isDown(button):
+            self.release(button)
+        else:
+            self.push(button)
+
+    def releaseAll(self):
+        self.portIPvals[self.portAdr] = 0
+        self.changed()
+
+    def input(self, value):
+        # Set the buttons down to bit pattern value. With resetOnRead, a
+        # state not yet read is kept and the new one waits in the FIFO
+        value &= 0xFF
+        if self.resetOnRead and self.portIPvals[self.portAdr]:
+            self.fifo.append(value)
+        else:
+            self.portIPvals[self.portAdr] = value
+            self.changed()
+        if self.vector is not None:
+            self.setInterrupt(self.vector)
+
+    def resetPort(self):
+        self.fifo.clear()
+        self.releaseAll()
+
+    def getIPval(self):
+        val = self.portIPvals.values()
+        if self.resetOnRead:
+            if self.fifo:
+                self.portIPvals[self.portAdr] = self.fifo.popleft()
+                self.changed()
+            else:
+                self.releaseAll()
+        return val
+
+
+class Disp16xChr(Device):
+    # 16 character display on 16 output ports, 0 = blank
+    name = "Disp16xChr"
+
+    def span(self):
+        return 16
+
+    def setAddress(self, adr):
+        if not self.fits(adr):
+            return False
+        self.portOPvals = {}
+        self.portIPvals = {}
+        for n in range(16):
+            self.portOPvals[adr + n] = 0x00
+        return Device.setAddress(self, adr)
+
+    def text(self):
+        return "".join(chr(v) if v else " " for v in self.portOPvals.values())
+
+
+class SegDisps(Device):
+    # N (1 to 6) two digit displays on N output ports
+    name = "SegDisps"
+    digits = "0123456789ABCDEF"
+
+    def __init__(self, portAdr=0xF0, emu=None, noPorts=3):
+        self.noPorts = noPorts
+        Device.__init__(self, portAdr, emu)
+
+    def span(self):
+        return self.noPorts
+
+    def setAddress(self, adr):
+        if not self.fits(adr):
+            return False
+        self.portOPvals = {}
+        self.portIPvals = {}
+        for n in range(self.noPorts):
+            self.portOPvals[adr + n] = 0x00
+        return Device.setAddress(self, adr)
+
+    def setPorts(self, noPorts):
+        # Number of displays, 1 to 6. Returns False if out of range, or
+        # the ports would go past 0xFF
+        if not 1 <= noPorts <= 6 or not self.fits(self.portAdr, noPorts):
+            return False
+        if noPorts != self.noPorts:
+            self.noPorts = noPorts
+            self.setAddress(self.portAdr)
+        return True
+
+    def text(self):
+        # Displayed digits, high nibble first
+        return "".join(
+            self.digits[v >> 4] + self.digits[v & 0x0F]
+            for v in self.portOPvals.values()
+        )
+
+
+class DMA(Device):
+    """
+    DMA controller, five input/output ports from the base address:
+      +0 Source address       +1 Destination address
+      +2 Length (0 = 256)     +3 Pages: source bits 0-2, destination bits 4-6
+      +4 Control: bit 0 start, bit 1 interrupt on completion, bits 2-3 vector
+         Status (read): bit 7 busy, bit 6 done (cleared by reading)
+    A transfer runs alongside the CPU for setup + length * cyclesPerByte
+    cycles of the emulator's clock, then copies the block between the data
+    banks of the (memory mapped) pages with slice assignment. Addresses
+    wrap within a page. Writing the control register while busy is ignored
+    """
+
+    name = "DMA"
+    SRC, DST, LEN, PAGES, CTRL = range(5)
+    setup = 4  # cycles
+    cyclesPerByte = 2  # One read and one write
+
+    def __init__(self, portAdr=0xF0, emu=None):
+        self.regs = [0] * 5
+        self.busy = False
+        self.done = False
+        self.event = None
+        self.transfers = 0  # Completed transfers
+        self.bytes = 0  # and bytes copied
+        Device.__init__(self, portAdr, emu)
+
+    def span(self):
+        return 5
+
+    def setAddress(self, adr):
+        if not self.fits(adr):
+            return False
+        self.portOPvals = {}
+        self.portIPvals = {}
+        for n in range(5):
+            self.portOPvals[adr + n] = 0x00
+            self.portIPvals[adr + n] = 0x00
+        Device.setAddress(self, adr)
+        self.update()
+        return True
+
+    def update(self):
+        for n in range(4):
+            self.portIPvals[self.portAdr + n] = self.regs[n]
+        self.portIPvals[self.portAdr + self.CTRL] = self.busy << 7 | self.done << 6
+        self.changed()
+
+    def length(self):
+        return self.regs[self.LEN] or 256
+
+    def setOPval(self, adr=None, val=0):
+        if adr == None:
+            adr = self.portAdr
+        reg = adr - self.portAdr
+        if reg not in range(5) or self.busy:
+            return
+        self.regs[reg] = val
+        self.portOPvals[adr] = val
+        if reg == self.CTRL and val & 1:
+            self.start()
+        self.update()
+
+    def getIPval(self):
+        self.done = False  # Cleared by reading (any register)
+        self.update()
+
+    def start(self):
+        self.busy = True
+        self.done = False
+        if self.emu:
+            self.event = self.emu.schedule(
+                self.setup + self.length() * self.cyclesPerByte, self.complete
+            )
+
+    def complete(self):
+        self.copy()
+        self.busy = False
+        self.done = True
+        self.transfers += 1
+        self.bytes += self.length()
+        ctrl = self.regs[self.CTRL]
+        if ctrl & 0b10:
+            self.setInterrupt((ctrl >> 2) & 0b11)
+        self.update()
+
+    def copy(self):
+        # Copy the block, split where either address wraps round the page
+        emu = self.emu
+        pages = self.regs[self.PAGES]
+        spage = emu.mm[pages & 0b111]
+        dpage = emu.mm[(pages >> 4) & 0b111]
+        sbank = emu.memory[spage][emu.datamem[spage]]
+        dbank = emu.memory[dpage][emu.datamem[dpage]]
+        block = (sbank + sbank)[self.regs[self.SRC] :][: self.length()]
+        dst = self.regs[self.DST]
+        end = dst + len(block)
+        dbank[dst : min(end, 256)] = block[: 256 - dst]
+        if end > 256:
+            dbank[: end - 256] = block[256 - dst :]
+        emu.memChanged[dpage] += [(dst + n) % 256 for n in range(len(block))]
+
+    def detach(self):
+        # Abandon a transfer in progress, its completion event would copy
+        # with no emulator
+        if self.busy and self.emu:
+            self.emu.cancelEvent(self.event)
+        self.busy = False
+        Device.detach(self)
+        self.update()
+
+    def resetPort(self):
+        if self.busy and self.emu:
+            self.emu.cancelEvent(self.event)
+        self.regs = [0] * 5
+        self.busy = False
+        self.done = False
+        Device.resetPort(self)
+        self.update()
+
+
+class Terminal(Device):
+    """
+    Character terminal, two input/output ports from the base address:
+      +0 Data: write sends a character, read takes the next received one
+      +1 Status (read): bit 7 received character ready, bit 6 ready to send
+         Control (write): bit 7 interrupt when a character is received,
+         bits 0-1 vector
+    Sent characters are buffered: views take them with takeOutput(), or,
+    with setOutput(stream), they are written to the stream a line (or
+    bufSize characters) at a time. Received characters come from input()
+    (keys or an input script), or a line at a time from setInput(stream)
+    when the program reads an empty receive buffer.
+    """
+
+    name = "Terminal"
+    bufSize = 256
+
+    def __init__(self, portAdr=0xF0, emu=None):
+        self.rxBuffer = deque()  # Received characters
+        self.output = []  # Sent characters not yet taken or written
+        self.outStream = None
+        self.inStream = None
+        self.control = 0
+        self.clears = 0  # Count of clear screens, for views
+        Device.__init__(self, portAdr, emu)
+
+    def span(self):
+        return 2
+
+    def setAddress(self, adr):
+        if not self.fits(adr):
+            return False
+        self.portOPvals = {adr: 0, adr + 1: 0}
+        self.portIPvals = {adr: 0, adr + 1: 0}
+        Device.setAddress(self, adr)
+        self.update()
+        return True
+
+    def setOutput(self, stream):
+        self.flush()
+        self.outStream = stream
+
+    def setInput(self, stream):
+        self.inStream = stream
+
+    def update(self):
+        if self.rxBuffer:
+            self.portIPvals[self.portAdr] = self.rxBuffer[0]
+        else:
+            self.portIPvals[self.portAdr] = 0
+        self.portIPvals[self.portAdr + 1] = bool(self.rxBuffer) << 7 | 0b01000000
+        self.changed()
+
+    def readPort(self, adr):
+        if not self.rxBuffer and self.inStream:
+            line = self.inStream.readline()
+            if line:
+                self.receive(line)
+            else:  # End of file
+                self.inStream = None
+        val = self.portIPvals.get(adr, 0)
+        if adr == self.portAdr and self.rxBuffer:
+            self.rxBuffer.popleft()
+            self.update()
+        return val
+
+    def setOPval(self, adr=None, val=0):
+        if adr == None or adr == self.portAdr:  # Send
+            self.portOPvals[self.portAdr] = val
+            self.output.append(chr(val))
+            if self.outStream and (val == 10 or len(self.output) >= self.bufSize):
+                self.flush()
+            self.changed()
+        elif adr == self.portAdr + 1:
+            self.control = val
+            self.portOPvals[adr] = val
+
+    def takeOutput(self):
+        # Sent characters since the last call
+        text = "".join(self.output)
+        self.output = []
+        return text
+
+    def flush(self):
+        if self.outStream and self.output:
+            self.outStream.write(self.takeOutput())
+            self.outStream.flush()
+
+    def receive(self, text):
+        for char in text:
+            self.rxBuffer.append(ord(char) & 0xFF)
+        if self.control & 0b10000000:
+            self.setInterrupt(self.control & 0b11)
+        self.update()
+
+    def input(self, value):
+        # A string is received, a number is one character code
+        if isinstance(value, int):
+            value = chr(value)
+        self.receive(value)
+
+    def resetPort(self):
+        self.flush()
+        self.rxBuffer.clear()
+        self.output = []
+        self.control = 0
+        self.clears += 1
+        self.update()
+
+
+class Framebuffer(Device):
+    """
+    Pixel framebuffer of 128 bytes, three input/output ports from the base
+    address:
+      +0 Address: byte offset in the frame (0 to 127)
+      +1 Data: write stores the byte at the address, then increments the
+         address; read returns the byte at the address
+      +2 Mode: 0 = 32x32 monochrome, 4 bytes a row, bit 7 leftmost pixel
+               1 = 16x16 with the 16 colour palette, 8 bytes a row, high
+                   nibble leftmost pixel
+    Rows changed since the last takeRows() are kept for views.
+    """
+
+    name = "Framebuffer"
+    frameSize = 128
+    modes = ((32, 32, 1), (16, 16, 4))  # (width, height, bits per pixel)
+    palette = (
+        "#000000",
+        "#0000aa",
+        "#00aa00",
+        "#00aaaa",
+        "#aa0000",
+        "#aa00aa",
+        "#aa5500",
+        "#aaaaaa",
+        "#555555",
+        "#5555ff",
+        "#55ff55",
+        "#55ffff",
+        "#ff5555",
+        "#ff55ff",
+        "#ffff55",
+        "#ffffff",
+    )
+    mono = ("#000000", "#55ff55")  # Off, on
+
+    def __init__(self, portAdr=0xF0, emu=None):
+        self.frame = bytearray(self.frameSize)
+        self.address = 0
+        self.mode = 0
+        self.dirtyRows = set(range(32))
+        Device.__init__(self, portAdr, emu)
+
+    def span(self):
+        return 3
+
+    def setAddress(self, adr):
+        if not self.fits(adr):
+            return False
+        self.portOPvals = {adr: 0, adr + 1: 0, adr + 2: 0}
+        self.portIPvals = {adr: 0, adr + 1: 0, adr + 2: 0}
+        Device.setAddress(self, adr)
+        self.update()
+        return True
+
+    def update(self):
+        self.portIPvals[self.portAdr] = self.address
+        self.portIPvals[self.portAdr + 1] = self.frame[self.address]
+        self.portIPvals[self.portAdr + 2] = self.mode
+
+    def size(self):
+        # (width, height) in pixels
+        return self.modes[self.mode][:2]
+
+    def setOPval(self, adr=None, val=0):
+        if adr == None:
+            adr = self.portAdr
+        reg = adr - self.portAdr
+        if reg not in range(3):
+            return
+        self.portOPvals[adr] = val
+        if reg == 1:
+            self.frame[self.address] = val
+            self.dirtyRows.add(self.address * self.size()[1] // self.frameSize)
+            self.address = (self.address + 1) % self.frameSize
+        elif reg == 0:
+            self.address = val % self.frameSize
+        elif (val & 1) != self.mode:
+            self.mode = val & 1
+            self.dirtyRows = set(range(self.size()[1]))
+        else:
+            return
+        self.update()
+        self.changed()
+
+    def row(self, y):
+        # Pixel colour numbers of row y
+        width, height, bits = self.modes[self.mode]
+        rowBytes = self.frameSize // height
+        pixels = []
+        for byte in self.frame[y * rowBytes : (y + 1) * rowBytes]:
+            if bits == 1:
+                pixels += [(byte >> n) & 1 for n in range(7, -1, -1)]
+            else:
+                pixels += [byte >> 4, byte & 0x0F]
+        return pixels
+
+    def pixels(self):
+        return [self.row(y) for y in range(self.size()[1])]
+
+    def colours(self):
+        # Colour table for the current mode
+        return self.mono if self.mode == 0 else self.palette
+
+    def takeRows(self):
+        # Rows changed since the last call, sorted
+        rows = sorted(self.dirtyRows)
+        self.dirtyRows = set()
+        return rows
+
+    def rgb(self, scale=1):
+        # Rows of RGB bytes, each pixel scale x scale
+        colours = [bytes.fromhex(colour[1:]) for colour in self.colours()]
+        rows = []
+        for y in range(self.size()[1]):
+            line = b"".join(colours[pixel] * scale for pixel in self.row(y))
+            rows += [line] * scale
+        return rows
+
+    def png(self, scale=1):
+        # The frame as PNG file data (RGB, 8 bits)
+        width, height = self.size()
+        raw = b"".join(b"\0" + line for line in self.rgb(scale))
+
+        def chunk(kind, data):
+            return (
+                struct.pack(">I", len(data))
+                + kind
+                + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+            )
+
+        header = struct.pack(">IIBBBBB", width * scale, height * scale, 8, 2, 0, 0, 0)
+        return (
+            b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b"")
+        )
+
+    def savePNG(self, filename, scale=1):
+        with open(filename, "wb") as f:
+            f.write(self.png(scale))
+
+    def asArray(self):
+        # NumPy array of colour numbers, shape (height, width)
+        import numpy  # Optional, only needed for NumPy export
+
+        return numpy.array(self.pixels(), dtype=numpy.uint8)
+
+    def saveNumPy(self, filename):
+        import numpy
+
+        numpy.save(filename, self.asArray())
+
+    def resetPort(self):
+        self.frame = bytearray(self.frameSize)
+        self.address = 0
+        self.mode = 0
+        self.dirtyRows = set(range(self.size()[1]))
+        self.update()
+        self.changed()
+
+
+class Bridge(Device):
+    """
+    Co-simulation bridge: count input/output ports from the base address
+    are forwarded to an external simulator over a pipe or a local socket
+    (see cdm8_cosim for the protocol). Writes are buffered and sent in
+    batches without waiting. A read sends the batch with the read, then
+    waits for the value, so there is one round trip per read only. A read
+    reply can request an interrupt. Call flush() to send buffered writes
+    (views do every frame) and close() at the end.
+    """
+
+    name = "Bridge"
+    batchSize = 256  # Writes buffered before sending
+
+    def __init__(self, portAdr=0xF0, emu=None, count=4):
+        self.count = count
+        self.pending = bytearray()  # Buffered transactions
+        self.outStream = None  # to simulator
+        self.inStream = None  # from simulator
+        self.process = None
+        self.sock = None
+        self.transactions = 0
+        self.batches = 0
+        self.syncs = 0  # Round trips (reads)
+        Device.__init__(self, portAdr, emu)
+
+    def span(self):
+        return self.count
+
+    def setAddress(self, adr):
+        if not self.fits(adr):
+            return False
+        self.portOPvals = {}
+        self.portIPvals = {}
+        for n in range(self.count):
+            self.portOPvals[adr + n] = 0x00
+            self.portIPvals[adr + n] = 0x00
+        return Device.setAddress(self, adr)
+
+    def setPorts(self, count):
+        # Number of addresses, 1 to 16. Returns False if out of range, or
+        # the ports would go past 0xFF
+        if not 1 <= count <= 16 or not self.fits(self.portAdr, count):
+            return False
+        if count != self.count:
+            self.count = count
+            self.setAddress(self.portAdr)
+        return True
+        return True
+
+    def connect(self, target):
+        # target: a local socket port number or "host:port", else a command
+        # (string or list) that runs the simulator on its stdin/stdout
+        self.close()
+        if isinstance(target, int) or str(target).rpartition(":")[2].isdigit():
+            import socket
+
+            host, sep, port = str(target).rpartition(":")
+            self.sock = socket.create_connection((host or "127.0.0.1", int(port)))
+            self.outStream = self.inStream = self.sock.makefile("rwb")
+        else:
+            import subprocess
+            import shlex
+
+            if isinstance(target, str):
+                target = shlex.split(target)
+            self.process = subprocess.Popen(
+                target, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+            self.outStream = self.process.stdin
+            self.inStream = self.process.stdout
+        self.changed()
+
+    def connected(self):
+        return self.outStream is not None
+
+    def cycle(self):
+        return (self.emu.cycles if self.emu else 0) & 0xFFFFFFFF
+
+    def flush(self):
+        # Send the buffered transactions
+        if self.pending and self.outStream:
+            self.outStream.write(self.pending)
+            self.outStream.flush()
+            self.batches += 1
+        self.pending = bytearray()
+
+    def setOPval(self, adr=None, val=0):
+        if adr == None:
+            adr = self.portAdr
+        if adr not in self.portOPvals:
+            return
+        self.portOPvals[adr] = val
+        if self.outStream:
+            self.pending += cosim.RECORD.pack(cosim.WRITE, adr, val, self.cycle())
+            self.transactions += 1
+            if len(self.pending) >= self.batchSize * cosim.RECORD.size:
+                self.flush()
+        self.changed()
+
+    def readPort(self, adr):
+        if not self.outStream:
+            return self.portIPvals.get(adr, 0)
+        self.pending += cosim.RECORD.pack(cosim.READ, adr, 0, self.cycle())
+        self.transactions += 1
+        self.flush()
+        reply = cosim.readFull(self.inStream, cosim.REPLY.size)
+        self.syncs += 1
+        if len(reply) < cosim.REPLY.size:
+            self.close()
+            if self.onError:
+                self.onError("Run time Error!\nSimulator closed the connection")
+            return 0
+        val, irq = cosim.REPLY.unpack(reply)
+        if irq & cosim.INTREQ:
+            self.setInterrupt(irq & 0b11)
+        self.portIPvals[adr] = val
+        self.changed()
+        return val
+
+    def close(self):
+        if self.outStream:
+            try:
+                self.pending += cosim.RECORD.pack(cosim.CLOSE, 0, 0, self.cycle())
+                self.flush()
+            except (OSError, ValueError):
+                pass  # Simulator already gone
+        if self.process:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process.stdout.close()
+        if self.sock:
+            self.inStream.close()
+            self.sock.close()
+        self.process = self.sock = None
+        self.outStream = self.inStream = None
+        self.pending = bytearray()
+
+
+class MemMgr(Device):
+    """
+    Memory manager, one output port. Writing val maps logical page
+    val bits 0-2 to physical page val bits 4-6 (bits 3 and 7 must be 0),
+    with CDM8Emu.mapPage(). Detaching restores the identity map.
+    """
+
+    name = "MemMgr"
+
+    def __init__(self, portAdr=0xF0, emu=None):
+        self.map = list(range(8))  # Logical to physical page
+        Device.__init__(self, portAdr, emu)
+
+    def setAddress(self, adr):
+        self.portOPvals = {adr: 0x00}
+        self.portIPvals = {}
+        Device.setAddress(self, adr)
+
+    def attach(self, emu):
+        Device.attach(self, emu)
+        for page, physical in enumerate(self.map):
+            emu.mapPage(page, physical)
+
+    def detach(self):
+        if self.emu:
+            self.emu.resetPages()
+        Device.detach(self)
+
+    def mapPage(self, page, physical):
+        self.map[page] = physical
+        if self.emu:
+            self.emu.mapPage(page, physical)
+        self.changed()
+
+    def setOPval(self, adr=None, val=0):
+        if val & 0b10001000:
+            return (
+                "Run time Error!\nIllegal Memory Manager value\n"
+                " Bits 3 and 7 should be 0"
+            )
+        self.portOPvals[self.portAdr] = val
+        self.mapPage(val & 0b111, (val >> 4) & 0b111)
+
+    def resetPort(self):
+        self.portOPvals[self.portAdr] = 0
+        for page in range(8):
+            self.mapPage(page, page)
+
+
+class HexDisps(SegDisps):
+    name = "HexDisps"
+
+
+class DecDisps(SegDisps):
+    # Digits 0-9 and . - + * / = for nibbles 10-15
+    name = "DecDisps"
+    digits = "0123456789.-+*/="
+
+
+def readScript(source):
+    """
+    Input script as a list of (cycle, value) events, in cycle order. source
+    is a file name, an open file, or an iterable of (cycle, value) pairs.
+    Script file lines are "cycle value", value a number (0x41, 0b101, 65),
+    a quoted string ("hello\n") or a key name (Return, CtrlC). # comments
+    """
+    if isinstance(source, str):
+        with open(source) as f:
+            return readScript(f)
+    events = []
+    for n, line in enumerate(source):
+        if isinstance(line, str):
+            fields = line.split(None, 1)
+            if not fields or fields[0].startswith("#"):
+                continue
+            try:
+                line = (int(fields[0], 0), scriptValue(fields[1]))
+            except (ValueError, SyntaxError, IndexError):
+                raise ValueError("Input script line %d: %r" % (n + 1, line))
+        events.append(line)
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+KEYS = {"Return": "\n", "CtrlC": "\x03", "Space": " "}
+
+
+def scriptValue(text):
+    # Value of an input script field, with or without a trailing # comment
+    import ast
+
+    text = text.strip()
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        text = text.split("#")[0].strip()
+        if text in KEYS:
+            return KEYS[text]
+        return ast.literal_eval(text)
+
+
+class InputScript:
+    """
+    Plays an input script into a device: each (cycle, value) event calls
+    device.input(value) when the attached emulator's clock reaches cycle.
+    Events are scheduled one at a time on the emulator's event queue, so
+    fast-forward over idle loops stops for them.
+    """
+
+    def __init__(self, device, script):
+        self.device = device
+        self.events = deque(readScript(script))
+        self.event = None
+        self.played = 0
+
+    def start(self):
+        self.next()
+
+    def stop(self):
+        if self.device.emu:
+            self.device.emu.cancelEvent(self.event)
+        self.event = None
+
+    def done(self):
+        return not self.events
+
+    def next(self):
+        emu = self.device.emu
+        if self.events and emu:
+            cycle = self.events[0][0]
+            self.event = emu.schedule(max(0, cycle - emu.cycles), self.play)
+
+    def play(self):
+        cycle, value = self.events.popleft()
+        self.device.input(value)
+        self.played += 1
+        self.next()
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# CdM8 IDE and emulator
+# (c) M L Walters and A Shafarenko June-July 2018
+
+####### CDM8 whole image disassembler
+# V1.0 Disassembles a memory image from its entry points and interrupt
+#      vectors, builds basic blocks, the control flow and call graphs and
+#      writes reassemblable assembler (asect) source
+# V1.1 Instruction cycle costs (CYCLES) for timing analysis
+# V1.2 disassemble() cache keyed on the image bytes (no hashlib import)
+
+
+# Python3 and 2
+from __future__ import absolute_import, division, print_function
+
+VECTORS = 0xF0  # Interrupt vectors 0xF0-0xF7: (PC, PS) for vectors 0-3
+NUMVECTORS = 4
+CACHESIZE = 1024  # Disassemblies kept by disassemble(), oldest dropped
+
+# Control flow of each instruction
+NEXT = 0  # Falls through to the next instruction
+JUMP = 1  # br, unconditional branch
+COND = 2  # Conditional branch, target or next
+CALL = 3  # jsr, target then next (on return)
+RET = 4  # rts, rti, end of the routine
+HALT = 5  # halt
+SWITCH = 6  # crc, ioi, osix: control goes elsewhere, resumes at next
+BAD = 7  # Undefined opcode, decoding stops
+
+BINARY = ["move", "add", "addc", "sub", "and", "or", "xor", "cmp"]
+UNARY = ["not", "neg", "dec", "inc", "shr", "shla", "shra", "swan"]
+BRANCHES = [
+    "beq",
+    "bne",
+    "bhs",
+    "blo",
+    "bmi",
+    "bpl",
+    "bvs",
+    "bvc",
+    "bhi",
+    "bls",
+    "bge",
+    "blt",
+    "bgt",
+    "ble",
+    "br",
+    "noop",
+]
+ZEROOPS = {
+    0xCE: ("pushall", NEXT),
+    0xCF: ("popall", NEXT),
+    0xD4: ("halt", HALT),
+    0xD5: ("wait", NEXT),
+    0xD7: ("rts", RET),
+    0xD8: ("ioi", SWITCH),
+    0xD9: ("rti", RET),
+    0xDA: ("crc", SWITCH),
+}
+
+
+def decodeOp(op):
+    # (mnemonic, operand format, size, flow) of opcode op (CdM-8 mark 5).
+    # Operand formats: "" none, "rr" rs,rd, "r" rd, "ri" rd,imm,
+    # "i" imm, "t" branch/jsr target, "x" osix operand (no assembler syntax)
+    if op < 0x80:
+        return BINARY[op >> 4], "rr", 1, NEXT
+    if op < 0xA0:
+        return UNARY[(op >> 2) & 7], "r", 1, NEXT
+    if op < 0xC0:
+        return ["st", "ld"][(op >> 4) & 1], "rr", 1, NEXT
+    if op < 0xC8:
+        return ["push", "pop"][(op >> 2) & 1], "r", 1, NEXT
+    if op < 0xCC:
+        return "ldsa", "ri", 2, NEXT
+    if op == 0xCC or op == 0xCD:
+        return ["addsp", "setsp"][op & 1], "i", 2, NEXT
+    if op < 0xD4:
+        if op in ZEROOPS:
+            return ZEROOPS[op][0], "", 1, ZEROOPS[op][1]
+        return "ldi", "ri", 2, NEXT
+    if op == 0xD6:
+        return "jsr", "t", 2, CALL
+    if op == 0xDB:
+        return "osix", "x", 2, SWITCH
+    if op in ZEROOPS:
+        return ZEROOPS[op][0], "", 1, ZEROOPS[op][1]
+    if op < 0xE0:
+        return "", "", 1, BAD
+    if op < 0xF0:
+        if op == 0xEE:
+            return "br", "t", 2, JUMP
+        if op == 0xEF:
+            return "noop", "i", 2, NEXT  # Operand byte is not a target
+        return BRANCHES[op & 15], "t", 2, COND
+    return "ldc", "rr", 1, NEXT
+
+
+DECODE = [decodeOp(op) for op in range(256)]  # Decode table, by opcode
+
+# Memory accesses of the instructions that read or write data memory
+ACCESSES = {"ld": 1, "st": 1, "ldc": 1, "push": 1, "pop": 1}
+ACCESSES.update({"pushall": 4, "popall": 4, "jsr": 1, "rts": 1, "crc": 2})
+ACCESSES.update({"ioi": 4, "rti": 2, "osix": 4})
+
+
+def opCycles(op):
+    # Estimated clock cycles of opcode op: one per byte fetched plus one per
+    # data memory read or write (the ioi/osix frame and vector included).
+    # Change CYCLES to match other hardware
+    mnemonic, fmt, size, flow = DECODE[op]
+    return size + ACCESSES.get(mnemonic, 0)
+
+
+CYCLES = [opCycles(op) for op in range(256)]
+INTCYCLES = CYCLES[0xD8] - 1  # Hardware interrupt entry, no ioi fetched
+
+
+class Instr:
+    # One decoded instruction
+    __slots__ = ("adr", "op", "operand", "size", "mnemonic", "fmt", "flow")
+
+    def __init__(self, img, adr):
+        self.adr = adr
+        self.op = img[adr]
+        self.mnemonic, self.fmt, self.size, self.flow = DECODE[self.op]
+        self.operand = img[(adr + 1) % 256] if self.size == 2 else None
+
+    @property
+    def target(self):
+        # Branch or jsr target address, else None
+        if self.fmt == "t":
+            return self.operand
+        return None
+
+    def text(self, labels=None):
+        # Assembler source for the instruction, targets by label if known
+        op, fmt = self.op, self.fmt
+        if fmt == "rr":
+            return "%s r%d, r%d" % (self.mnemonic, (op >> 2) & 3, op & 3)
+        if fmt == "r":
+            return "%s r%d" % (self.mnemonic, op & 3)
+        if fmt == "ri":
+            return "%s r%d, 0x%02x" % (self.mnemonic, op & 3, self.operand)
+        if fmt == "i":
+            return "%s 0x%02x" % (self.mnemonic, self.operand)
+        if fmt == "t":
+            if labels and self.operand in labels:
+                return "%s %s" % (self.mnemonic, labels[self.operand])
+            return "%s 0x%02x" % (self.mnemonic, self.operand)
+        if fmt == "x":  # Not in the assembler, so as data
+            return "dc 0x%02x, 0x%02x  # osix 0x%02x" % (op, self.operand, self.operand)
+        if self.flow == BAD:
+            return "dc 0x%02x  # undefined opcode" % op
+        return self.mnemonic
+
+
+def decode(img, adr):
+    # Disassemble one instruction. Returns (text, size)
+    instr = Instr(img, adr % 256)
+    return instr.text(), instr.size
+
+
+class Block:
+    # Basic block: instruction addresses, successor blocks and call target
+    __slots__ = ("start", "instrs", "succs", "call")
+
+    def __init__(self, start):
+        self.start = start
+        self.instrs = []
+        self.succs = []
+        self.call = None  # jsr target, if the block ends with a jsr
+
+    @property
+    def end(self):
+        return self.instrs[-1]
+
+
+class Disassembly:
+    """
+    Disassembly of a 256 byte memory image. Decoding starts from address 0
+    and the interrupt vectors (0xF0-0xF7), and follows branches and jsr
+    calls. Results:
+        self.instrs   {address: Instr} every instruction reached
+        self.labels   {address: label} symbols, else generated labels
+        self.blocks   {start address: Block} basic blocks
+        self.routines {entry: [block starts]} for 0, vectors and jsr targets
+        self.calls    {entry: set of called entries}
+        self.vectors  {vector number: ISR address}
+        self.conflicts  targets inside another instruction (not decoded)
+    """
+
+    def __init__(self, img, symbols=None, entries=None):
+        self.img = (list(img) + [0] * 256)[:256]
+        self.symbols = symbols or {}
+        self.entries = [0]
+        self.vectors = {}
+        for vector in range(NUMVECTORS):
+            isr = self.img[VECTORS + vector * 2]
+            if isr or self.img[VECTORS + vector * 2 + 1]:  # Vector in use
+                self.vectors[vector] = isr
+                self.entries.append(isr)
+        for adr in entries or []:
+            self.entries.append(adr % 256)
+        self.instrs = {}
+        self.owner = [None] * 256  # Start address of the instruction at adr
+        self.conflicts = set()
+        self.walk()
+        self.buildBlocks()
+        self.makeLabels()
+
+    def walk(self):
+        todo = list(self.entries)
+        self.targets = set(self.entries)  # Entries, branch and jsr targets
+        self.leaders = set()  # Other block starts, after branches and calls
+        self.callees = set()
+        self.rtiJumps = {}  # {rti address: target} for ei/di style jumps
+        while todo:
+            adr = todo.pop()
+            while adr not in self.instrs:
+                if self.owner[adr] != None:  # Inside another instruction
+                    self.conflicts.add(adr)
+                    break
+                instr = Instr(self.img, adr)
+                if instr.size == 2 and self.owner[(adr + 1) % 256] != None:
+                    self.conflicts.add(adr)
+                    break
+                self.instrs[adr] = instr
+                for n in range(instr.size):
+                    self.owner[(adr + n) % 256] = adr
+                if instr.flow in (JUMP, COND, CALL):
+                    self.targets.add(instr.target)
+                    todo.append(instr.target)
+                    if instr.flow == CALL:
+                        self.callees.add(instr.target)
+                if instr.op == 0xD9 and self.rtiJump(adr) != None:
+                    self.targets.add(self.rtiJumps[adr])
+                    todo.append(self.rtiJumps[adr])
+                if instr.flow in (JUMP, RET, HALT, BAD):
+                    break
+                adr = (adr + instr.size) % 256
+                if instr.flow != NEXT:
+                    self.leaders.add(adr)
+
+    def rtiJump(self, adr):
+        # rti after "ldi rA, target; push rA; ldi rB, PS; push rB" (the ei
+        # and di macros) is a jump to target. Returns target or None
+        code = [self.img[(adr - n) % 256] for n in range(6, 0, -1)]
+        if (
+            code[0] & 0xFC == 0xD0
+            and code[2] == 0xC0 | (code[0] & 3)
+            and code[3] & 0xFC == 0xD0
+            and code[5] == 0xC0 | (code[3] & 3)
+            and all(self.owner[(adr - n) % 256] != None for n in (6, 4, 3, 1))
+        ):
+            self.rtiJumps[adr] = code[1]
+            return code[1]
+        return None
+
+    def buildBlocks(self):
+        self.blocks = {}
+        for start in sorted(self.instrs):
+            if (
+                start in self.targets
+                or start in self.leaders
+                or self.owner[(start - 1) % 256] == None
+            ):
+                block = Block(start)
+                self.blocks[start] = block
+                adr = start
+                while adr in self.instrs:
+                    instr = self.instrs[adr]
+                    block.instrs.append(adr)
+                    nxt = (adr + instr.size) % 256
+                    if instr.flow in (JUMP, COND):
+                        block.succs.append(instr.target)
+                    if adr in self.rtiJumps:
+                        block.succs.append(self.rtiJumps[adr])
+                    if instr.flow == CALL:
+                        block.call = instr.target
+                    if instr.flow in (NEXT, COND, CALL, SWITCH):
+                        if (
+                            instr.flow != NEXT
+                            or nxt in self.targets
+                            or nxt in self.leaders
+                        ):
+                            block.succs.append(nxt)
+                            break
+                    else:
+                        break
+                    adr = nxt
+        # Routines: blocks reached from each entry without following calls
+        self.routines = {}
+        self.calls = {}
+        for entry in sorted(set(self.entries) | self.callees):
+            if entry not in self.blocks:
+                continue
+            seen = []
+            todo = [entry]
+            while todo:
+                start = todo.pop()
+                if start in seen or start not in self.blocks:
+                    continue
+                seen.append(start)
+                todo += self.blocks[start].succs
+            self.routines[entry] = sorted(seen)
+            self.calls[entry] = set(
+                self.blocks[b].call for b in seen if self.blocks[b].call != None
+            )
+
+    def makeLabels(self):
+        # One name per address, each name used once (so toAsm() reassembles):
+        # symbols first, then generated names, suffixed with the address if
+        # already taken
+        self.labels = {}
+        symbols = {}
+        for adr, name in self.symbols.items():
+            symbols[adr % 256] = name
+        names = {}
+        used = set()
+
+        def addName(adr, label):
+            if adr in names:
+                return
+            if label in used:
+                label = "%s_%02x" % (label, adr)
+            while label in used:
+                label += "_"
+            names[adr] = label
+            used.add(label)
+
+        for adr in sorted(symbols):
+            addName(adr, symbols[adr])
+        addName(0, "start")
+        for vector, isr in sorted(self.vectors.items()):
+            addName(isr, "int%d" % vector)
+        for adr in sorted(self.callees):
+            addName(adr, "sub_%02x" % adr)
+        for adr in sorted(self.targets):
+            addName(adr, "L_%02x" % adr)
+        for adr, name in names.items():
+            if adr in self.instrs or self.owner[adr] == None:  # Can be placed
+                self.labels[adr] = name
+
+    def isCode(self, adr):
+        return self.owner[adr % 256] != None
+
+    def toAsm(self, title=""):
+        # Reassemblable source: code as instructions, other non-zero bytes
+        # (and labelled addresses) as dc, each run in its own asect
+        lines = ["# Disassembly of " + (title or "memory image"), ""]
+        here = None  # Address the assembler is at, None = needs an asect
+        adr = 0
+        while adr < 256:
+            instr = self.instrs.get(adr)
+            if instr == None:  # Data, up to the next code or label
+                if not self.img[adr] and adr not in self.labels:
+                    here = None  # Skip zeros, the image is cleared anyway
+                    adr += 1
+                    continue
+                end = adr + 1
+                while (
+                    end < 256
+                    and end not in self.instrs
+                    and end not in self.labels
+                    and end - adr < 8
+                ):
+                    end += 1
+                while end - 1 > adr and not self.img[end - 1]:  # Trailing zeros
+                    end -= 1
+                data = self.img[adr:end]
+            if here != adr:
+                lines.append("asect 0x%02x" % adr)
+            if adr in self.labels:
+                lines.append(self.labels[adr] + ":")
+            if instr == None:
+                lines.append("    dc " + ", ".join("0x%02x" % b for b in data))
+            elif adr + instr.size > 256:  # Operand wraps round to 0x00
+                lines.append(
+                    "    dc 0x%02x  # %s" % (instr.op, instr.text(self.labels))
+                )
+                end = 256
+            else:
+                lines.append("    " + instr.text(self.labels))
+                end = adr + instr.size
+            adr = here = end
+        lines.append("end")
+        return "\n".join(lines) + "\n"
+
+    def cfg(self):
+        # Text listing of the routines, their blocks and successors
+        lines = []
+        for entry, starts in sorted(self.routines.items()):
+            name = self.labels.get(entry, "%02x" % entry)
+            callees = sorted(self.labels.get(c, "%02x" % c) for c in self.calls[entry])
+            lines.append("%s (%02x) calls: %s" % (name, entry, ", ".join(callees)))
+            for start in starts:
+                block = self.blocks[start]
+                lines.append(
+                    "    %02x-%02x -> %s"
+                    % (
+                        start,
+                        block.end,
+                        " ".join("%02x" % s for s in block.succs) or "exit",
+                    )
+                )
+        return "\n".join(lines) + "\n"
+
+    def dot(self):
+        # Control flow graph for graphviz
+        lines = ["digraph cdm8 {", "    node [shape=box fontname=monospace];"]
+        for start, block in sorted(self.blocks.items()):
+            text = "\\l".join(
+                "%02x: %s" % (a, self.instrs[a].text(self.labels)) for a in block.instrs
+            )
+            lines.append('    b%02x [label="%s\\l"];' % (start, text))
+            for succ in block.succs:
+                lines.append("    b%02x -> b%02x;" % (start, succ))
+            if block.call != None:
+                lines.append("    b%02x -> b%02x [style=dashed];" % (start, block.call))
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+
+_cache = {}
+
+
+def disassemble(img, symbols=None, entries=None):
+    # Disassembly of img, cached by image (treat the result as read only)
+    img = (list(img) + [0] * 256)[:256]
+    key = (
+        bytes(img),
+        tuple(sorted((symbols or {}).items())),
+        tuple(entries or ()),
+    )
+    if key not in _cache:
+        if len(_cache) >= CACHESIZE:
+            del _cache[next(iter(_cache))]
+        _cache[key] = Disassembly(img, symbols, entries)
+    return _cache[key]
+
+
+def readImage(filename):
+    # Read a cocol/CocoIDE memory image ("v2.0 raw" or "v1.0 sym").
+    # Returns (256 byte list, {address:name} symbols)
+    symbols = {}
+    with open(filename, "r") as imgfile:
+        lines = imgfile.read().splitlines()
+    if lines[0] == "v2.0 raw":
+        img = [int(line, 16) for line in lines[1:257]]
+    elif lines[0] == "v1.0 sym":
+        img = [int(val, 16) for val in lines[1].split(":")]
+        for line in lines[2:]:
+            if ":" in line:
+                name, adr = line.rsplit(":", 1)
+                symbols[int(adr, 16)] = name
+    else:
+        raise ValueError("Unsupported image format: " + lines[0])
+    return (img + [0] * 256)[:256], symbols
+
+
+def disassembleFile(filename):
+    img, symbols = readImage(filename)
+    return disassemble(img, symbols)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CdM-8 Disassembler v1.0")
+    parser.add_argument("filename", help="memory_image_file[.img]")
+    parser.add_argument(
+        "-o", dest="output", default="", help="write FILE.asm (default: print)"
+    )
+    parser.add_argument(
+        "-g",
+        dest="cfg",
+        action="store_const",
+        const=True,
+        default=False,
+        help="print the routines and basic blocks, write FILE.dot graph",
+    )
+    args = parser.parse_args()
+    filename = args.filename
+    if filename[-4:] == ".img":
+        filename = filename[:-4]
+    dis = disassembleFile(filename + ".img")
+    source = dis.toAsm(filename + ".img")
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(source)
+    else:
+        print(source)
+    if args.cfg:
+        print(dis.cfg())
+        with open(filename + ".dot", "w") as f:
+            f.write(dis.dot())
@@ -17,28 +17,305 @@
 # V1.81 Removed rol instruction, replaced by swan (Core Mark 5).
 # V1.9 Memory manager (to be) added - maps datamem[x] to datamem[y] via self.mm{} dict.
 # V1.91 V-Flag Fixed regression!
+# V1.92 Call graph profiler (cdm8_prof.py) hooks, loadImg() and CLI image loading
+# V1.93 Memory access counters (cdm8_prof.MemCounter) for the memory heatmap
+# V1.94 Stack peak depth per page and stack overflow into code/data detection
+# V1.95 Instruction and branch coverage bitmaps (cdm8_prof.Coverage)
+# V1.96 --selfprof option to profile the emulator (and IDE) itself
+# V1.97 Hook API (addHook/removeHook): pre/post execute, fetch, read, write and
+#       interrupt hooks. The cdm8_prof tools now attach as hooks
+# V1.98 disasm() uses the cdm8_dis decoder (was the old instruction set and
+#       a missing global hx())
+# V1.99 Virtual clock (self.cycles, cdm8_dis.CYCLES) and device event queue
+#       (schedule()): events fire at instruction boundaries
+# V1.99a Fast-forward the clock to the next event through wait, and through
+#       tight polling loops that cannot change before it
+# V1.99b Per emulator priority interrupt controller (self.intc) replaces the
+#       interrupt vector list passed to step()
+# V1.99c Input port table: loads from input port addresses call the device
+#       directly, no Tk <<checkInPorts>> event per ld (mapPort())
+# V1.99d Output port table: every store to an output port address, stack
+#       writes included, is delivered to its device as it happens
+# V1.99e Memory pages 1 to 7 are set up too (setArch() was passed the whole
+#       arch list), so devices such as DMA can use them
+# V1.99f Memory map self.mm is a list (logical page -> physical page), changed
+#       only by mapPage(), e.g. from the memory manager device
+# V1.99g Options are an object passed to CDM8Emu (options()), the command line
+#       is only parsed when run as a script
+# V1.99h reset() split from run(), runFor() steps with a step budget and
+#       breakpoints (for cocorun)
+# V1.99i powerUp() clears the whole emulator, to reuse it (cocorun.Toolchain)
 
 
 # Python3 and 2
 from __future__ import absolute_import, division, print_function, annotations
 
-import argparse
+import heapq
+import os
 import random
 
 import sys
+from types import SimpleNamespace
+
+import cdm8_dis
 
 random.seed()
 
 
+class EmuHooks:
+    """
+    Hooks added to an emulator with CDM8Emu.addHook(kind, func, adr, opcodes).
+    Kinds and how func is called:
+        "pre"       func(emu, pc, ir) before the instruction ir at pc runs
+        "post"      func(emu, pc, ir) after it has run
+        "fetch"     func(emu, page, adr) instruction or operand fetch
+        "read"      func(emu, page, bank, adr) data/stack memory read
+        "write"     func(emu, page, bank, adr) data/stack memory write
+        "interrupt" func(emu, vector, sp) after ioi/osix entry to an ISR,
+                    sp = stack address of the saved PS
+    adr = (first, last) address range filters on pc, memory address or
+    vector, opcodes = a set of opcodes or an OPCLASSES name filters "pre"
+    and "post" hooks. Interrupts run "pre"/"post" hooks as ir = 0xD8 (ioi).
+    """
+
+    KINDS = ("pre", "post", "fetch", "read", "write", "interrupt")
+    OPCLASSES = {
+        "alu": range(0x00, 0x80),
+        "unary": range(0x80, 0xA0),
+        "st": range(0xA0, 0xB0),
+        "ld": range(0xB0, 0xC0),
+        "stack": range(0xC0, 0xD0),
+        "ldi": range(0xD0, 0xD4),
+        "control": range(0xD4, 0xE0),
+        "branch": range(0xE0, 0xF0),
+        "ldc": range(0xF0, 0x100),
+        "jsr": (0xD6,),
+        "rts": (0xD7,),
+        "call": (0xD6, 0xDA),  # jsr, crc
+        "interrupt": (0xD8, 0xDB, 0xD9),  # ioi, osix, rti
+    }
+
+    def __init__(self, emu):
+        self.emu = emu
+        self.hooks = dict((kind, []) for kind in self.KINDS)
+
+    def add(self, kind, func, adr=None, opcodes=None):
+        if kind not in self.KINDS:
+            raise ValueError("Unknown hook kind: " + str(kind))
+        first, last = adr or (0, 255)
+        ops = bytearray(256)
+        if opcodes == None:
+            opcodes = range(256)
+        elif isinstance(opcodes, str):
+            opcodes = self.OPCLASSES[opcodes]
+        for op in opcodes:
+            ops[op] = 1
+        hook = (kind, func, first, last, ops)
+        self.hooks[kind].append(hook)
+        return hook
+
+    def remove(self, hook):
+        if hook in self.hooks[hook[0]]:
+            self.hooks[hook[0]].remove(hook)
+
+    def count(self):
+        return sum(len(hooks) for hooks in self.hooks.values())
+
+    def pre(self, pc, ir):
+        for kind, func, first, last, ops in self.hooks["pre"]:
+            if first <= pc <= last and ops[ir]:
+                func(self.emu, pc, ir)
+
+    def post(self, pc, ir):
+        for kind, func, first, last, ops in self.hooks["post"]:
+            if first <= pc <= last and ops[ir]:
+                func(self.emu, pc, ir)
+
+    def fetch(self, page, adr):
+        adr = adr % 256
+        for kind, func, first, last, ops in self.hooks["fetch"]:
+            if first <= adr <= last:
+                func(self.emu, page, adr)
+
+    def read(self, page, bank, adr):
+        adr = adr % 256
+        for kind, func, first, last, ops in self.hooks["read"]:
+            if first <= adr <= last:
+                func(self.emu, page, bank, adr)
+
+    def write(self, page, bank, adr):
+        adr = adr % 256
+        for kind, func, first, last, ops in self.hooks["write"]:
+            if first <= adr <= last:
+                func(self.emu, page, bank, adr)
+
+    def interrupt(self, vector, sp):
+        for kind, func, first, last, ops in self.hooks["interrupt"]:
+            if first <= vector <= last:
+                func(self.emu, vector, sp)
+
+
+NEVER = 1 << 62  # Cycle count no event is scheduled for
+# Opcodes allowed in a polling loop: no memory or stack writes, no calls
+IDLEOPS = bytearray(256)
+for op in (
+    list(range(0x00, 0xA0))  # ALU
+    + list(range(0xB0, 0xC0))  # ld
+    + list(range(0xC8, 0xCC))  # ldsa
+    + list(range(0xD0, 0xD4))  # ldi
+    + list(range(0xE0, 0x100))  # branches, ldc
+):
+    IDLEOPS[op] = 1
+
+
+class EventQueue:
+    """
+    Device events, in order of the emulated clock (CDM8Emu.cycles).
+    schedule(when, func, *args) calls func(*args) at the first instruction
+    boundary at or after cycle when, in order of when, then of scheduling.
+    self.due = cycle of the next event, so step() tests a single integer.
+    """
+
+    def __init__(self):
+        self.queue = []
+        self.seq = 0
+        self.due = NEVER
+        self.fired = 0  # Events run, so far
+
+    def schedule(self, when, func, *args):
+        # Returns the event, for cancel()
+        event = [when, self.seq, func, args]
+        self.seq += 1
+        heapq.heappush(self.queue, event)
+        self.due = self.queue[0][0]
+        return event
+
+    def cancel(self, event):
+        if event:
+            event[2] = None  # Dropped when it comes due
+
+    def fire(self, now):
+        # Run the events due by cycle now
+        while self.queue and self.queue[0][0] <= now:
+            when, seq, func, args = heapq.heappop(self.queue)
+            if func:
+                func(*args)
+                self.fired += 1
+        self.due = self.queue[0][0] if self.queue else NEVER
+
+    def pending(self):
+        return len([event for event in self.queue if event[2]])
+
+    def clear(self):
+        self.queue = []
+        self.due = NEVER
+
+
+class IntController:
+    """
+    Priority interrupt controller, one per emulator (CDM8Emu.intc).
+    Vectors are edge triggered unless setMode(vector, level=True). Devices
+    drive a request line with setLine(vector, state): a level vector is
+    pending while its line is held, an edge vector latches a request on the
+    line's rising edge, cleared when the CPU takes it. request(vector)
+    latches an edge request, or raises a level vector's line. Vector 0 has
+    the highest priority. Masked vectors stay pending until unmasked. While
+    the CPU has interrupts disabled, pending edge requests are dropped, as
+    before.
+
+    self.active = (pending | level lines) & mask: step() tests this single
+    integer.
+    Counters per vector: requests, coalesced (requested again while still
+    pending) and dropped.
+    """
+
+    def __init__(self, vectors=cdm8_dis.NUMVECTORS):
+        self.vectors = vectors
+        self.mask = (1 << vectors) - 1  # Bit set = vector enabled
+        self.levelMode = 0  # Bit set = level triggered vector
+        self.reset()
+
+    def reset(self):
+        self.pending = 0
+        self.lines = 0  # Level inputs held
+        self.active = 0
+        self.requests = [0] * self.vectors
+        self.coalesced = [0] * self.vectors
+        self.dropped = [0] * self.vectors
+
+    def update(self):
+        self.active = (self.pending | (self.lines & self.levelMode)) & self.mask
+
+    def request(self, vector=0):
+        bit = 1 << vector
+        if self.levelMode & bit:
+            self.setLine(vector, True)
+            return
+        self.requests[vector] += 1
+        if self.pending & bit:
+            self.coalesced[vector] += 1
+        self.pending |= bit
+        self.update()
+
+    def setLine(self, vector, state=True):
+        # Request line input: held for a level vector, rising edge latched
+        # for an edge vector (see setMode())
+        bit = 1 << vector
+        if not state:
+            self.lines &= ~bit
+        elif not self.lines & bit:
+            self.lines |= bit
+            if not self.levelMode & bit:
+                self.request(vector)
+                return
+            self.requests[vector] += 1
+        self.update()
+
+    def setMode(self, vector, level=False):
+        if level:
+            self.levelMode |= 1 << vector
+        else:
+            self.levelMode &= ~(1 << vector)
+        self.update()
+
+    def setMask(self, vector, enabled=True):
+        if enabled:
+            self.mask |= 1 << vector
+        else:
+            self.mask &= ~(1 << vector)
+        self.update()
+
+    def vector(self):
+        # Highest priority active vector, or None
+        if not self.active:
+            return None
+        return (self.active & -self.active).bit_length() - 1
+
+    def acknowledge(self, vector):
+        # The CPU has taken vector. Edge requests are cleared, level
+        # requests remain until the device releases the line
+        self.pending &= ~(1 << vector)
+        self.update()
+
+    def flush(self):
+        # Interrupts disabled: drop the edge requests that were active
+        for vector in range(self.vectors):
+            if self.pending & self.mask & (1 << vector):
+                self.dropped[vector] += 1
+        self.pending &= ~self.mask
+        self.update()
+
+
 class CDM8Emu:
-    def __init__(self, memory=None, arch="vn", pages=8, parent=None) -> None:
+    def __init__(
+        self, memory=None, arch=None, pages=8, parent=None, options=None
+    ) -> None:
         self.parent = parent
+        self.options = options or defaults  # See options()
         self.VN = "vn"
         self.HV = "hv"
         self.arch = ["vn"] * pages
 
-        args.arch  # Default Von Neuman Architecture
-
         # Class variables/ attributes
         self.curPage = 0
         self.memChanged = [[0]] * pages
@@ -47,21 +324,12 @@ class CDM8Emu:
         # print("&",self.memory)
         # print("datamem", self.datamem)
         # print("memChanged", self.memChanged)
-        self.mm = {
-            0: 0,
-            1: 1,
-            2: 2,
-            3: 3,
-            4: 4,
-            5: 5,
-            6: 6,
-            7: 7,
-        }  # Memory mapping dict
+        self.mm = list(range(pages))  # Memory map, logical to physical page
         # Setup Memory
         # print("Memory\n", self.memory[0])#debug
-        self.setArch(args.arch, page=0)
+        self.setArch(arch or self.options.arch, page=0)
         for n in range(1, pages):
-            self.setArch(self.arch, page=n)  # default is vn, page 0 to 8
+            self.setArch(self.arch[n], page=n)  # default is vn, page 0 to 8
         #           #print("$", n)
         if memory:  # load .img file if provided
             self.memory[0][0] = memory
@@ -87,6 +355,23 @@ class CDM8Emu:
             True  # Pretend that standard.mlb macros are real machine instructions
         )
         self.waitInt = False  # for wait (for interrupt instruction.
+        self.hooks = None  # EmuHooks, only while any hooks are added (addHook)
+        self.cycles = 0  # Virtual clock, cdm8_dis.CYCLES per instruction
+        self.events = EventQueue()  # Device events on the virtual clock
+        self.intc = IntController()  # Hardware interrupt requests
+        # IO port tables, by data address (mapPort())
+        self.inPorts = [None] * 256  # read(adr) returns the input value
+        self.outPorts = [None] * 256  # write(adr, value) for every store
+        # Skip idle wait/polling loops straight to the next event
+        self.fastForward = True
+        self.idleCycles = 0  # Cycles skipped
+        self.idleState = None  # Polling loop state, at its backward branch
+        self.idleLoops = {}  # {(branch, target): loop has only IDLEOPS}
+        # Stack checks, per page
+        # stackGuard[page] = bytearray(256), 1 = code/data, 2 = overwritten
+        self.stackGuard = [None] * pages
+        self.stackAction = "warn"  # Stack overflow into code/data: "warn" or "stop"
+        self.resetStackCheck()
 
     def setArch(self, arch="vn", page=0):
         if arch == "vn":
@@ -105,6 +390,147 @@ class CDM8Emu:
         # print("^",self.memory[page])
         return
 
+    def mapPage(self, page, physical):
+        # Map logical memory page to physical page, in place: self.mm is
+        # read on every memory access
+        if not (0 <= page < len(self.mm) and 0 <= physical < len(self.mm)):
+            return "Illegal memory page"
+        self.mm[page] = physical
+        return
+
+    def resetPages(self):
+        # Identity memory map
+        self.mm[:] = range(len(self.mm))
+
+    def addHook(self, kind, func, adr=None, opcodes=None):
+        # Add a hook, see EmuHooks. Returns the hook, for removeHook()
+        if not self.hooks:
+            self.hooks = EmuHooks(self)
+            self.step = self.hookedStep  # Instrumented step, with post hooks
+        return self.hooks.add(kind, func, adr, opcodes)
+
+    def removeHook(self, hook):
+        if self.hooks:
+            self.hooks.remove(hook)
+            if not self.hooks.count():  # Back to the plain step
+                self.hooks = None
+                del self.step
+
+    def hookedStep(self, *args, **kwargs):
+        # step() while hooks are added. Pre-execute and memory hooks are
+        # called from step(), post-execute hooks after it
+        pc = self.PC
+        CDM8Emu.step(self, *args, **kwargs)
+        if self.hooks:
+            self.hooks.post(pc, self.IR)
+
+    def mapPort(self, adr, read=None, write=None):
+        # Map a device to data address adr: read(adr) supplies the value
+        # of loads from it. Polling loops are fast-forwarded to the next
+        # event, so a value should only change from events or user input.
+        # write(adr, value) is called for every store to adr, on any page
+        self.inPorts[adr] = read
+        self.outPorts[adr] = write
+
+    def unmapPort(self, adr):
+        self.mapPort(adr)
+
+    def portWrite(self, page, bank, adr):
+        # Store to an output port address: deliver the value to the device.
+        # IO is in the data space of every page, as for loads, so it stays
+        # in place when pages are remapped
+        if bank == self.datamem[page]:
+            self.outPorts[adr](adr, self.memory[page][bank][adr])
+
+    def schedule(self, delay, func, *args):
+        # Call func(*args) delay cycles from now. Returns the event, for
+        # cancelEvent()
+        return self.events.schedule(self.cycles + delay, func, *args)
+
+    def cancelEvent(self, event):
+        self.events.cancel(event)
+
+    def skipTo(self, when):
+        # Advance the clock to when, as if idle
+        if when > self.cycles:
+            self.idleCycles += when - self.cycles
+            self.cycles = when
+
+    def idleLoop(self, target):
+        # At a taken backward branch: if the loop from target has run
+        # once with no writes, no events and ends in the same state, it will
+        # repeat until the next event, so skip whole passes up to it.
+        # step() clears idleState at any instruction not in IDLEOPS, so a
+        # pass that left the loop to write or call is never skipped
+        code = self.memory[self.mm[self.curPage]][0]
+        key = (self.PC, target)
+        if key not in self.idleLoops:
+            adr = target
+            while adr < self.PC and IDLEOPS[code[adr]]:
+                adr += cdm8_dis.DECODE[code[adr]][2]
+            self.idleLoops[key] = adr == self.PC
+        if not self.idleLoops[key]:
+            self.idleState = None
+            return
+        state = (
+            key,
+            tuple(self.regs),
+            self.CVZN,
+            self.curPage,
+            self.getSP(),
+            self.events.fired,
+        )
+        if self.idleState and self.idleState[0] == state:
+            period = self.cycles - self.idleState[1]  # Cycles per pass
+            if period > 0:
+                passes = (self.events.due - self.cycles) // period
+                self.skipTo(self.cycles + passes * period)
+        self.idleState = (state, self.cycles)
+
+    def getSP(self):
+        # Current stack pointer (page 0 stack, unless shadow SPs)
+        if self.shadowSP:
+            return self.SP[self.mm[self.curPage]]
+        return self.SP[self.mm[0]]
+
+    def setStackGuard(self, segments=[], page=0):
+        # Mark the memory used by code and data, as (start, size) segments
+        # e.g. from cocol.allocated(). Stack writes to these addresses are
+        # reported as stack overflows
+        guard = bytearray(256)
+        for start, size in segments:
+            for adr in range(start, min(start + size, 256)):
+                guard[adr] = 1
+        self.stackGuard[page] = guard
+
+    def resetStackCheck(self):
+        pages = len(self.SP)
+        self.stackBase = [0] * pages  # SP value of an empty stack (setsp)
+        self.stackPeak = [0] * pages  # Peak stack depth in bytes
+        self.stackFaults = []  # (page, address, PC) of first overflow per address
+        for guard in self.stackGuard:
+            if guard:
+                guard[:] = guard.replace(b"\x02", b"\x01")
+
+    def stackCheck(self, page, adr=None):
+        # Called after the stack grows: record the peak stack depth and
+        # check that a stack write at adr does not overwrite code or data
+        depth = (self.stackBase[page] - self.SP[page]) % 256
+        if depth > self.stackPeak[page]:
+            self.stackPeak[page] = depth
+        guard = self.stackGuard[page]
+        if adr != None and guard and guard[adr]:
+            if guard[adr] == 1:  # First overflow to this address
+                guard[adr] = 2
+                EP(
+                    "Stack overflow: page %d stack write at 0x%02X overwrites code/data"
+                    " (PC=0x%02X)" % (page, adr, self.PC),
+                    term=False,
+                )
+                self.stackFaults.append((page, adr, self.PC))
+            if self.stackAction == "stop":
+                self.HALT = True
+
     def changePC(self, n=0):
         self.PC = (n + 256) % 256  # Wrap around to 0 if 255
         return
@@ -135,100 +561,23 @@ class CDM8Emu:
         if fmt == 3:
             return "0b{0:08b}".format(k)
 
-    def loadImg(self, image=None, page=0):  # Not implemented yet
-        # Direct load image from file under CocoIDE
-        print("Load memory image from file not implemented yet")
+    def loadImg(self, image=None, page=0):
+        # Load a cocol/CocoIDE memory image file ("v2.0 raw" or "v1.0 sym")
+        # into code memory. Returns the image symbols {address:name}, if any
+        img, symbols = cdm8_dis.readImage(image)
+        self.memory[page][0] = img
+        return symbols
 
     def disasm(self, adr):
-        self.IR = self.memory[self.curPage][0][adr]
-        if self.IR & 0x80 == 0:
-            fun = self.IR >> 4
-            opcode = ["move", "add", "addc", "sub", "and", "or", "xor", "cmp"][fun]
-            Rs = (self.IR >> 2) & 3
-            Rd = self.IR & 3
+        # Disassemble the instruction at adr of the current page
+        return cdm8_dis.decode(self.memory[self.mm[self.curPage]][0], adr)[0]
 
-            if self.pretend and Rs == Rd:
-                if opcode == "move":
-                    return "tst r" + str(Rs)
-                if opcode == "sub":
-                    return "clr r" + str(Rs)
-                if opcode == "addc":
-                    return "shl r" + str(Rs)
-
-            return opcode + " r" + str(Rs) + ",r" + str(Rd)
-        if self.IR >> 5 == 0b100:
-            fun = (self.IR >> 2) & 7
-            opcode = ["not", "neg", "dec", "inc", "shr", "shla", "shra", "rol"][fun]
-            Rd = self.IR & 3
-            return opcode + " r" + str(Rd)
-        if self.IR >> 5 == 0b101:
-            fun = (self.IR >> 4) & 1
-            opcode = ["st", "ld"][fun]
-            Rs = (self.IR >> 2) & 3
-            Rd = self.IR & 3
-            return opcode + " r" + str(Rs) + ",r" + str(Rd)
-        if self.IR >> 4 == 0b1100:
-            fun = (self.IR >> 2) & 3
-            opcode = ["push", "pop", "stsp", "ldsp"][fun]
-            Rd = self.IR & 3
-            return opcode + " r" + str(Rd)
-        if self.IR >> 2 == 0b110100:
-            Rd = self.IR & 3
-            return "ldi r" + str(Rd) + ",0x" + hx(self.memory[self.curPage][0][adr + 1])
-        if self.IR >> 4 == 0b1101:
-            fun = self.IR & 15
-            opcode = [
-                "",
-                "",
-                "",
-                "",
-                "halt",
-                "wait",
-                "jsr",
-                "rts",
-                "osi",
-                "rti",
-                "crc",
-                "osix",
-            ] + ["<ext0>", "<ext1>", "<ext2>", "<ext3>"]
-            opcode = opcode[fun]
-            if fun == 6 or fun == 11:
-                return opcode + " 0x" + hx(self.memory[self.curPage][0][adr + 1])
-            else:
-                return opcode
-        if self.IR >> 4 == 0b1110:
-            opcode = [
-                "eq",
-                "ne",
-                "hs",
-                "lo",
-                "mi",
-                "pl",
-                "vs",
-                "vc",
-                "hi",
-                "ls",
-                "ge",
-                "lt",
-                "gt",
-                "le",
-                "r",
-                "nop",
-            ]
-            fun = self.IR & 15
-            pref = "b"
-            if fun == 15:
-                pref = ""
-            return (
-                pref + opcode[fun] + " 0x" + hx(self.memory[self.curPage][0][adr + 1])
-            )
-        if self.IR >> 4 == 0b1111:
-            return "bbne 0x" + hx((adr - 1 - (self.IR & 15) + 256) % 256)
-
-    def step(self, intvectors=[]):
+    def step(self):
         # global self.PC, self.SP, self.IP, self.CVZN, self.memory[0], self.regs, self.HALT, random
-        self.intvectors = intvectors
         self.intvector = 0  # Default 0 (if software interrupt)
+        hwint = False
+        if self.cycles >= self.events.due:  # Device events, may interrupt
+            self.events.fire(self.cycles)
 
         def setZN(x):  # Sets the z and N flags
             self.CVZN = self.CVZN & 0b11111100
@@ -247,17 +596,26 @@ class CDM8Emu:
 
         ## If HW/IO interupt, generate Interrupt Instruction, ioi. Mick Aug 2018
         ien = self.CVZN & 0b10000000  # Check if Ints enabled
-        if self.intvectors and ien:
-            self.intvector = min(self.intvectors)
-            # self.intvectors.remove(self.intvector)
+        if self.intc.active and ien:
+            self.intvector = self.intc.vector()
+            hwint = True
             self.IR = 0xD8  # Hardware interrupt "ioi"
+            self.cycles += cdm8_dis.INTCYCLES
         else:  # No interrupt, so fetch next instruction to IR, flush out/ignore
-            self.intvectors = []  # Interruptd disabled, so flush any interrupts pending
+            if self.intc.active:  # Interrupts disabled, so flush any pending
+                self.intc.flush()
             self.IR = self.memory[self.mm[self.curPage]][0][self.PC]
+            self.cycles += cdm8_dis.CYCLES[self.IR]
+            if self.hooks:
+                self.hooks.fetch(self.mm[self.curPage], self.PC)
+        if self.idleState and not IDLEOPS[self.IR]:
+            self.idleState = None  # Not a polling loop pass, see idleLoop()
 
         # print("IR_1=", self.IR)
+        if self.hooks:
+            self.hooks.pre(self.PC, self.IR)
         ##Trace
-        if args.trace:
+        if self.options.trace:
             if self.PC in self.IP or self.IR == 0xD4:
                 regstr = ""
                 for ind in [0, 1, 2, 3]:
@@ -425,27 +783,38 @@ class CDM8Emu:
             Rd = self.IR & 3
 
             if load == 0b0001:  # ld
-                # CocoIDE Hijack to test if Input address
+                # Input port address? The device returns the value
                 self.ipAdr = self.regs[Rs]
-
-                # Generate interrupt in CocoIDE. If an Input address
-                # returns the Input port value in self.ipVal,
-                self.ipVal = None
-                if self.parent:  # Is running under CocoIDE?
-                    self.parent.event_generate("<<checkInPorts>>")
-                # print("*",self.ipVal)
-                if self.ipVal != None:
-                    self.regs[Rd] = self.ipVal
+                if self.inPorts[self.ipAdr]:
+                    self.regs[Rd] = self.inPorts[self.ipAdr](self.ipAdr)
                 else:
                     self.regs[Rd] = self.memory[self.mm[self.curPage]][
                         self.datamem[self.mm[self.curPage]]
                     ][self.regs[Rs]]
+                if self.hooks:
+                    self.hooks.read(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.ipAdr,
+                    )
 
             else:  # st
                 self.memory[self.mm[self.curPage]][self.datamem[self.mm[self.curPage]]][
                     self.regs[Rs]
                 ] = self.regs[Rd]
                 self.memChanged[self.mm[self.curPage]] += [self.regs[Rs]]
+                if self.hooks:
+                    self.hooks.write(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.regs[Rs],
+                    )
+                if self.outPorts[self.regs[Rs]]:
+                    self.portWrite(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.regs[Rs],
+                    )
 
             self.changePC(self.PC + 1)
             return
@@ -454,6 +823,8 @@ class CDM8Emu:
             Rs = (self.IR & 12) >> 2
             Rd = self.IR & 3
             self.regs[Rd] = self.memory[self.mm[self.curPage]][0][self.regs[Rs]]
+            if self.hooks:
+                self.hooks.read(self.mm[self.curPage], 0, self.regs[Rs])
             self.changePC(self.PC + 1)
             return
 
@@ -467,35 +838,61 @@ class CDM8Emu:
                     self.SP[self.mm[stackPage]]
                 ] = self.regs[Rd]
                 self.memChanged[self.mm[self.curPage]] += [self.SP[self.mm[stackPage]]]
+                if self.hooks:
+                    self.hooks.write(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.SP[self.mm[stackPage]],
+                    )
+                if self.outPorts[self.SP[self.mm[stackPage]]]:
+                    self.portWrite(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.SP[self.mm[stackPage]],
+                    )
+                self.stackCheck(self.mm[stackPage], self.SP[self.mm[stackPage]])
 
             if ss == 1:  # pop
                 self.regs[Rd] = self.memory[self.mm[self.curPage]][
                     self.datamem[self.mm[self.curPage]]
                 ][self.SP[self.mm[stackPage]]]
+                if self.hooks:
+                    self.hooks.read(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.SP[self.mm[stackPage]],
+                    )
                 self.SP[self.mm[stackPage]] = (self.SP[self.mm[stackPage]] + 1) % 256
 
             if ss == 2:  # stsp or ldsa
-                if args.v3:
+                if self.options.v3:
                     self.SP[self.mm[stackPage]] = self.regs[Rd]
                 else:  # mark 4 architecture, addsa
                     imop = self.memory[self.mm[self.curPage]][0][
                         (self.PC + 1 + 256) % 256
                     ]
+                    if self.hooks:
+                        self.hooks.fetch(self.mm[self.curPage], self.PC + 1)
                     self.regs[Rd] = (self.SP[self.mm[stackPage]] + imop + 256) % 256
                     self.changePC(self.PC + 2)
                     return
 
             if ss == 3:
-                if args.v3:  # ldsp
+                if self.options.v3:  # ldsp
                     self.egs[Rd] = self.SP[self.mm[stackPage]]
                 else:
                     if stsel == 0 or stsel == 1:
                         imop = self.memory[self.mm[self.curPage]][0][
                             (self.PC + 1 + 256) % 256
                         ]
+                        if self.hooks:
+                            self.hooks.fetch(self.mm[self.curPage], self.PC + 1)
                         self.SP[self.mm[stackPage]] = (
                             (1 - stsel) * self.SP[self.mm[stackPage]] + imop + 256
                         ) % 256
+                        if stsel == 1:  # setsp, new empty stack
+                            self.stackBase[self.mm[stackPage]] = imop
+                        self.stackCheck(self.mm[stackPage])  # addsp locals
                         self.changePC(self.PC + 2)
                         return
 
@@ -509,13 +906,36 @@ class CDM8Emu:
                                 self.datamem[self.mm[self.curPage]]
                             ][self.SP[self.mm[stackPage]]] = self.regs[Rd]
                             chngMem += [self.SP[self.mm[stackPage]]]
+                            self.stackCheck(
+                                self.mm[stackPage], self.SP[self.mm[stackPage]]
+                            )
                         self.memChanged[self.mm[self.curPage]] += chngMem
+                        if self.hooks:
+                            for adr in chngMem:
+                                self.hooks.write(
+                                    self.mm[self.curPage],
+                                    self.datamem[self.mm[self.curPage]],
+                                    adr,
+                                )
+                        for adr in chngMem:
+                            if self.outPorts[adr]:
+                                self.portWrite(
+                                    self.mm[self.curPage],
+                                    self.datamem[self.mm[self.curPage]],
+                                    adr,
+                                )
 
                     if stsel == 3:  # popall
                         for Rd in (0, 1, 2, 3):
                             self.regs[Rd] = self.memory[self.mm[self.curPage]][
                                 self.datamem[self.mm[self.curPage]]
                             ][self.SP[self.mm[stackPage]]]
+                            if self.hooks:
+                                self.hooks.read(
+                                    self.mm[self.curPage],
+                                    self.datamem[self.mm[self.curPage]],
+                                    self.SP[self.mm[stackPage]],
+                                )
                             self.SP[self.mm[stackPage]] = (
                                 self.SP[self.mm[stackPage]] + 1
                             ) % 256
@@ -525,6 +945,8 @@ class CDM8Emu:
         if self.IR >> 2 == 0b110100:  # ldi
             Rd = self.IR & 3
             imop = self.memory[self.mm[self.curPage]][0][(self.PC + 1 + 256) % 256]
+            if self.hooks:
+                self.hooks.fetch(self.mm[self.curPage], self.PC + 1)
 
             self.regs[Rd] = imop
             self.changePC(self.PC + 2)
@@ -541,19 +963,42 @@ class CDM8Emu:
 
             if vvww == 5:
                 self.WAIT = True
+                if ien and self.fastForward and not self.intc.active:
+                    if self.events.due < NEVER:
+                        self.skipTo(self.events.due)  # Next step fires it
 
             if vvww == 6:  # jsr
                 self.SP[self.mm[stackPage]] = (self.SP[self.mm[stackPage]] + 255) % 256
+                if self.hooks:
+                    self.hooks.fetch(self.mm[self.curPage], self.PC + 1)
+                    self.hooks.write(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.SP[self.mm[stackPage]],
+                    )
                 self.memory[self.mm[self.curPage]][self.datamem[self.mm[self.curPage]]][
                     self.SP[self.mm[stackPage]]
                 ] = (self.PC + 2 + 256) % 256
+                self.stackCheck(self.mm[stackPage], self.SP[self.mm[stackPage]])
                 self.changePC(
                     self.memory[self.mm[self.curPage]][0][(self.PC + 1 + 256) % 256]
                 )
                 self.memChanged[self.mm[self.curPage]] += [self.SP[self.mm[stackPage]]]
+                if self.outPorts[self.SP[self.mm[stackPage]]]:
+                    self.portWrite(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.SP[self.mm[stackPage]],
+                    )
                 return
 
             if vvww == 7:  # rts
+                if self.hooks:
+                    self.hooks.read(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.SP[self.mm[stackPage]],
+                    )
                 self.changePC(
                     self.memory[self.mm[self.curPage]][
                         self.datamem[self.mm[self.curPage]]
@@ -564,6 +1009,17 @@ class CDM8Emu:
 
             if vvww == 10:  # crc
                 temp = (self.PC + 1 + 256) % 256
+                if self.hooks:
+                    self.hooks.read(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.SP[self.mm[stackPage]],
+                    )
+                    self.hooks.write(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.SP[self.mm[stackPage]],
+                    )
                 self.changePC(
                     self.memory[self.mm[self.curPage]][
                         self.datamem[self.mm[self.curPage]]
@@ -572,6 +1028,12 @@ class CDM8Emu:
                 self.memory[self.mm[self.curPage]][self.datamem[self.mm[self.curPage]]][
                     self.SP[self.mm[stackPage]]
                 ] = temp
+                if self.outPorts[self.SP[self.mm[stackPage]]]:
+                    self.portWrite(
+                        self.mm[self.curPage],
+                        self.datamem[self.mm[self.curPage]],
+                        self.SP[self.mm[stackPage]],
+                    )
                 return
 
             if vvww == 15:  # ??
@@ -585,8 +1047,8 @@ class CDM8Emu:
                 if ien:
                     self.HALT = False
                     # PC onto stack
-                    if self.intvectors:  # If hardware ioi
-                        self.intvectors.remove(self.intvector)
+                    if hwint:  # If hardware ioi
+                        self.intc.acknowledge(self.intvector)
                     else:  # software ioi
                         self.changePC(
                             self.PC + 1
@@ -602,6 +1064,7 @@ class CDM8Emu:
                         self.SP[self.mm[0]]
                     ] = self.PC
                     self.memChanged[0] += [self.SP[self.mm[0]]]
+                    self.stackCheck(self.mm[0], self.SP[self.mm[0]])
                     self.changePC(
                         self.memory[self.mm[stackPage]][0][0xF0 + self.intvector * 2]
                     )  ## int vector = 0 -> F0, F2, F4 etc
@@ -612,10 +1075,25 @@ class CDM8Emu:
                         self.SP[self.mm[0]]
                     ] = self.CVZN
                     self.memChanged[0] += [self.SP[self.mm[0]]]
+                    self.stackCheck(self.mm[0], self.SP[self.mm[0]])
                     self.CVZN = self.memory[self.mm[stackPage]][0][
                         0xF1 + self.intvector * 2
                     ]  # self.intvector address +1
+                    for adr in ((self.SP[self.mm[0]] + 1) % 256, self.SP[self.mm[0]]):
+                        if self.hooks:
+                            self.hooks.write(0, self.datamem[self.mm[0]], adr)
+                        if self.outPorts[adr]:
+                            self.portWrite(0, self.datamem[self.mm[0]], adr)
+                    if self.hooks:
+                        self.hooks.read(
+                            self.mm[stackPage], 0, 0xF0 + self.intvector * 2
+                        )
+                        self.hooks.read(
+                            self.mm[stackPage], 0, 0xF1 + self.intvector * 2
+                        )
                     self.curPage = 0  # ISR for ioi always on page 0
+                    if self.hooks:
+                        self.hooks.interrupt(self.intvector, self.SP[self.mm[0]])
                 else:
                     self.changePC(self.PC + 1)  # just ignore!
                 return
@@ -643,6 +1121,7 @@ class CDM8Emu:
                         self.SP[self.mm[stackPage]]
                     ] = self.PC
                     self.memChanged[stackPage] += [self.SP[self.mm[stackPage]]]
+                    self.stackCheck(self.mm[stackPage], self.SP[self.mm[stackPage]])
                     self.changePC(
                         self.memory[stackPage][0][0xF0]
                     )  ## int vector always 0 for osix
@@ -658,12 +1137,46 @@ class CDM8Emu:
                         self.SP[self.mm[stackPage]]
                     ] = self.CVZN
                     self.memChanged[self.mm[stackPage]] += [self.SP[self.mm[stackPage]]]
+                    self.stackCheck(self.mm[stackPage], self.SP[self.mm[stackPage]])
                     self.CVZN = newPS | intEnable  # set Int enable state
+                    if self.hooks:
+                        self.hooks.fetch(self.mm[self.curPage], self.PC - 1)
+                        for adr in (
+                            self.SP[self.mm[stackPage]] + 1,
+                            self.SP[self.mm[stackPage]],
+                        ):
+                            self.hooks.write(
+                                self.mm[stackPage],
+                                self.datamem[self.mm[stackPage]],
+                                adr,
+                            )
+                        self.hooks.read(self.mm[stackPage], 0, 0xF0)
+                        self.hooks.read(self.mm[stackPage], 0, 0xF1)
+                    for adr in (
+                        (self.SP[self.mm[stackPage]] + 1) % 256,
+                        self.SP[self.mm[stackPage]],
+                    ):
+                        if self.outPorts[adr]:
+                            self.portWrite(
+                                self.mm[stackPage],
+                                self.datamem[self.mm[stackPage]],
+                                adr,
+                            )
+                    if self.hooks:
+                        self.hooks.interrupt(0, self.SP[self.mm[stackPage]])
                 else:
                     self.changePC(self.PC + 2)  # skip if not enabled
                 return
 
             if vvww == 9:  # rti = 0xD9
+                if self.hooks:
+                    for adr in (
+                        self.SP[self.mm[stackPage]],
+                        self.SP[self.mm[stackPage]] + 1,
+                    ):
+                        self.hooks.read(
+                            self.mm[stackPage], self.datamem[self.mm[stackPage]], adr
+                        )
                 # PS from stack
                 self.CVZN = self.memory[self.mm[stackPage]][
                     self.datamem[self.mm[stackPage]]
@@ -709,14 +1222,19 @@ class CDM8Emu:
                 dcsn = 1
 
             dcsn = reverse ^ dcsn
+            if self.hooks:
+                self.hooks.fetch(self.mm[self.curPage], self.PC + 1)
             if dcsn != 0:
-                self.changePC(self.memory[self.mm[self.curPage]][0][self.PC + 1])
+                target = self.memory[self.mm[self.curPage]][0][self.PC + 1]
+                if target <= self.PC and self.events.due < NEVER and self.fastForward:
+                    self.idleLoop(target)
+                self.changePC(target)
             else:
                 self.changePC(self.PC + 2)
             return
 
         if ((self.IR >> 4) == 0b1111) and (self.arch == "vn"):
-            if args.save:  # not ldc, we are having a restore point
+            if self.options.save:  # not ldc, we are having a restore point
                 savepnt = self.IR & 0b1111
                 if savepnt > len(savestat) - 1:
                     EP("Illegal opcode: " + str(self.IR), term=False)
@@ -738,9 +1256,57 @@ class CDM8Emu:
                 EP("Illegal opcode: " + str(self.IR), term=False)
 
     def run(self):
+        self.reset()
+        while (
+            (not self.PC in self.BP) and (not self.HALT) and self.PC < 255
+        ):  # Run to next Break point
+            self.step()
+        # print("PC= ", self.PC)
+        # self.cntr += 1  # No of steps keep count?
+        # print("Run Stopped")
+        # self.running=False
+
+    def runFor(self, steps=None, breakpoints=()):
+        # Step from the current state until halt, a breakpoint address is
+        # reached (after at least one step) or steps instructions have run.
+        # Returns (reason, steps run), reason "halt", "break" or "steps"
+        count = 0
+        while not self.HALT:
+            if steps is not None and count >= steps:
+                return "steps", count
+            self.step()
+            count += 1
+            if self.PC in breakpoints:
+                return "break", count
+        return "halt", count
+
+    def powerUp(self):
+        # Power on state, to reuse the emulator for another program: all
+        # memory pages and the memory map, clock and device events, IO port
+        # tables and stack checks cleared, then reset(). Hooks are kept
+        for page in range(len(self.memory)):
+            self.setArch(self.arch[page], page=page)
+        self.mm = list(range(len(self.memory)))
+        self.curPage = 0
+        self.cycles = 0
+        self.events.clear()
+        self.inPorts = [None] * 256
+        self.outPorts = [None] * 256
+        self.idleCycles = 0
+        self.idleState = None
+        self.idleLoops = {}
+        self.stackGuard = [None] * len(self.SP)
+        self.WAIT = False
+        self.waitInt = False
+        self.reset()
+
+    def reset(self):
+        # Processor reset: registers, stacks and interrupts, PC = 0
         self.regs = [0, 0, 0, 0]
         self.PC = 0
-        self.SP = [0] * pages
+        self.SP = [0] * len(self.SP)
+        self.resetStackCheck()
+        self.intc.reset()
         self.IR = 0
         self.IP = []
         self.CVZN = 0x0
@@ -756,15 +1322,6 @@ class CDM8Emu:
         self.HALT = False
         # self.cntr=0
         # self.running=True
-        # Run to
-        while (
-            (not self.PC in self.BP) and (not self.HALT) and self.PC < 255
-        ):  # Run to next Break point
-            self.step()
-        # print("PC= ", self.PC)
-        # self.cntr += 1  # No of steps keep count?
-        # print("Run Stopped")
-        # self.running=False
 
 
 ########## End of Emulator class
@@ -774,67 +1331,155 @@ def EP(s, term=True):
         quit(-1)
 
 
-########## Command Line options
-parser = argparse.ArgumentParser(description="CdM-8 Emulator v1.0")
-parser.add_argument(
-    "-r",
-    dest="run",
-    action="store_const",
-    const=True,
-    default=False,
-    help="run image and quit",
-)
-parser.add_argument(
-    "-l",
-    dest="lst",
-    action="store_const",
-    const=True,
-    default=False,
-    help="display assembler listing (FILE.lst)",
-)
-parser.add_argument(
-    "-w",
-    dest="trace",
-    default="",
-    help="comma-separated list of trace snapshots (format/location): [fmt:]addr[,[fmt:]addr...] with  fmt = x (hex) | d (decimal) | c (ASCII);  addr(hex) = xx (single address) | xx-xx (address range)",
-)
-parser.add_argument(
-    "-s",
-    dest="save",
-    default="",
-    help="save for restore points (chk): chk:xx[-xx],chk:xx[-xx] ...",
-)
-parser.add_argument(
-    "-v3",
-    dest="v3",
-    action="store_const",
-    const=True,
-    default=False,
-    help="assume CdM-8 Mark 3 instruction set",
-)
-parser.add_argument(
-    "-i",
-    dest="ipoints",
-    default="",
-    help="comma-separated list of program execution addresses xx (hex) at which to display trace snapshots: xx[,xx...]",
-)
-parser.add_argument(
-    "-a",
-    dest="arch",
-    default="vn",
-    help="Architecture: default vn (Von Neuman), hv (Harvard)",
+########## Options (the command line options) and command line
+DEFAULTS = dict(
+    run=False,
+    lst=False,
+    trace="",
+    save="",
+    v3=False,
+    ipoints="",
+    arch="vn",
+    stackstop=False,
+    callgraph=False,
+    coverage=False,
+    selfprof="",
 )
-if __name__ == "__main__":
+
+
+def options(**kwargs):
+    # Emulator options as an object, defaults overridden by kwargs, e.g.
+    # CDM8Emu(options=options(v3=True)). No command line is parsed
+    unknown = set(kwargs) - set(DEFAULTS)
+    if unknown:
+        raise TypeError("Unknown emulator option(s): " + ", ".join(sorted(unknown)))
+    return SimpleNamespace(**dict(DEFAULTS, **kwargs))
+
+
+defaults = options()
+
+
+def makeParser():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CdM-8 Emulator v1.0")
+    parser.add_argument(
+        "-r",
+        dest="run",
+        action="store_const",
+        const=True,
+        help="run image and quit",
+    )
+    parser.add_argument(
+        "-l",
+        dest="lst",
+        action="store_const",
+        const=True,
+        help="display assembler listing (FILE.lst)",
+    )
+    parser.add_argument(
+        "-w",
+        dest="trace",
+        help="comma-separated list of trace snapshots (format/location): [fmt:]addr[,[fmt:]addr...] with  fmt = x (hex) | d (decimal) | c (ASCII);  addr(hex) = xx (single address) | xx-xx (address range)",
+    )
+    parser.add_argument(
+        "-s",
+        dest="save",
+        help="save for restore points (chk): chk:xx[-xx],chk:xx[-xx] ...",
+    )
+    parser.add_argument(
+        "-v3",
+        dest="v3",
+        action="store_const",
+        const=True,
+        help="assume CdM-8 Mark 3 instruction set",
+    )
+    parser.add_argument(
+        "-i",
+        dest="ipoints",
+        help="comma-separated list of program execution addresses xx (hex) at which to display trace snapshots: xx[,xx...]",
+    )
+    parser.add_argument(
+        "-a",
+        dest="arch",
+        help="Architecture: default vn (Von Neuman), hv (Harvard)",
+    )
+    parser.add_argument(
+        "-k",
+        dest="stackstop",
+        action="store_const",
+        const=True,
+        help="stop (rather than warn) if the stack overwrites code/data (non-zero image bytes)",
+    )
+    parser.add_argument(
+        "-g",
+        dest="callgraph",
+        action="store_const",
+        const=True,
+        help="profile jsr/rts call graph, write FILE.prof report and FILE.folded stacks",
+    )
+    parser.add_argument(
+        "-c",
+        dest="coverage",
+        action="store_const",
+        const=True,
+        help="record instruction/branch coverage, write FILE.cov bitmaps and FILE.cover report (needs FILE.lst)",
+    )
+    parser.add_argument(
+        "--selfprof",
+        dest="selfprof",
+        nargs="?",
+        const="time",
+        choices=["time", "cprofile"],
+        help="profile the toolchain itself (or set COCO_SELFPROF), write cocoprof.timing and .pstats files",
+    )
     parser.add_argument(
         "filename", type=str, const=None, default="", help="memory_image_file[.img]"
     )
-args = parser.parse_args()
+    parser.set_defaults(**DEFAULTS)
+    return parser
+
 
 if __name__ == "__main__":
+    args = makeParser().parse_args()
+    filename = args.filename
+    if filename[-4:] == ".img":
+        filename = filename[:-4]
+    if args.selfprof or os.environ.get("COCO_SELFPROF"):
+        import cdm8_prof
+
+        cdm8_prof.selfProfile(args.selfprof, emuClass=CDM8Emu)
+    emu = CDM8Emu(options=args)
     try:
-        filename = args.filename
-        if filename[-4:] == ".img":
-            filename = filename[:-4]
-        CDM8Emu().run()
-    except:
-        print("Bad filename or file")
+        symbols = emu.loadImg(filename + ".img")
+    except (IOError, ValueError, IndexError):
+        EP("Bad filename or file")
+    emu.setStackGuard([(adr, 1) for adr in range(256) if emu.memory[0][0][adr]])
+    if args.stackstop:
+        emu.stackAction = "stop"
+    if args.callgraph:
+        import cdm8_prof
+
+        profiler = cdm8_prof.CallProfiler(symbols).attach(emu)
+    if args.coverage:
+        import cdm8_prof
+
+        coverage = cdm8_prof.Coverage(pages=len(emu.memory)).attach(emu)
+    emu.run()
+    for page in range(len(emu.SP)):
+        if emu.stackPeak[page]:
+            print("Peak stack depth page %d: %d bytes" % (page, emu.stackPeak[page]))
+    if args.callgraph:
+        profiler.save(filename)
+        print(profiler.report())
+    if args.coverage:
+        coverage.save(filename + ".cov")
+        try:
+            with open(filename + ".lst", "r") as lstfile:
+                report = coverage.report(lstfile.read())
+        except IOError:
+            print("No " + filename + ".lst listing for the coverage report")
+        else:
+            with open(filename + ".cover", "w") as f:
+                f.write(report)
+            print(report.splitlines()[0])
@@ -11,7 +11,31 @@ from __future__ import absolute_import, division, print_function
 # V1.6 Seperate out IO Ports into (this!) seperate module:
 # V1.7 Added IO ports
 # V1.8 Commented out Memory Manager (CocoIDE V1.97 removed paged memory menu item)
-# To do:    terminal, gRobotIF, LogisimIF, graphics??, DMA?
+# V1.9 IO_Timer counts on the emulator's virtual clock (CDM8Emu.schedule()),
+#      not Tk after(), so timing is the same at any run speed
+# V1.10 setInterrupt() requests the emulator's interrupt controller
+#      (CDM8Emu.intc), replacing the shared interruptVectors list
+# V1.11 attach() maps a port's input addresses into the emulator's port table
+#      (CDM8Emu.mapPort()), reads call readPort()
+# V1.12 Output addresses too: every store calls writePort() -> setOPval().
+#      While the program runs, CocoIDE redraws once per display update,
+#      not once per port update
+# V1.13 Ports are Tk views of headless device models (cdm8_dev), which hold the
+#      registers, address map, timer and interrupts. Timer reads return the
+#      current count
+# V1.14 Ports changed by the emulator are marked dirty and redrawn together,
+#      at most cf.frameRate times a second, configuring only widgets whose
+#      values changed. CocoIDE redraws once per frame, not once per port write
+# V1.15 IO_DMA: DMA controller (cdm8_dev.DMA)
+# V1.16 IO_Terminal: character terminal (cdm8_dev.Terminal), output inserted
+#      into one Text widget once per frame
+# V1.17 IO_Framebuffer: pixel display (cdm8_dev.Framebuffer), changed rows
+#      drawn with one PhotoImage.put() per frame
+# V1.18 IO_Bridge: co-simulation bridge to an external simulator
+#      (cdm8_dev.Bridge), buffered writes sent every frame
+# V1.19 OP_MemMgr back: memory manager (cdm8_dev.MemMgr), port writes remap
+#      memory pages through CDM8Emu.mapPage()
+# To do:    gRobotIF
 ver = "V1.8"
 
 try:
@@ -33,11 +57,39 @@ from sys import platform
 
 
 import cdm8_asm as cf  # Configuration and defaults file
+import cdm8_dev  # Headless device models
 
 # Global vars
-interruptVectors = []
 IDE = None
-memDict = {0: 0, 1: 1, 2: 2, 3: 3, 4: 4, 5: 5, 6: 6, 7: 7}
+dirtyPorts = []  # Ports to redraw on the next frame
+frameId = None  # Tk after() id of the next frame
+ideDirty = False  # CocoIDE display to redraw on the next frame
+drawing = False
+
+
+def requestFrame(widget):
+    # Schedule the next frame, unless already scheduled
+    global frameId
+    if frameId is None and not drawing:
+        frameId = widget.after(1000 // cf.frameRate, drawFrame)
+
+
+def drawFrame():
+    # Redraw the dirty ports, then CocoIDE once
+    global frameId, ideDirty, drawing
+    frameId = None
+    drawing = True
+    ports = dirtyPorts[:]
+    del dirtyPorts[:]
+    for port in ports:
+        port.dirty = False
+        if port.portFrame.winfo_exists():
+            port.updatePort()
+    drawing = False
+    if ideDirty and IDE and not IDE.running:
+        # While running, the run loop updates the display
+        IDE.updateDisp()
+    ideDirty = False
 
 
 class IOport:
@@ -50,32 +102,40 @@ class IOport:
      __init__() # called when instantiating new port
      updatePort() # updates the port display of all IO values. Can be each processor step
      or as often as required.
+     The port is a view of a headless device model (cdm8_dev), created from the class
+     attribute device. The model holds the port registers and address map, and calls
+     the view's updatePort() whenever it changes.
+     The port is connected to an emulator by attach(emu), which maps its input addresses
+     to the model's readPort() and its output addresses to writePort(). Loads from them
+     return the value in self.portIPvals, then call getIPval(). Every store calls
+     setOPval(adr, val).
      Note:
             self.portIPvals = {} # dictionary of input port {adresss:value} pairs
             self.portOPvals = {} # dictionary of output port {address:value) pairs
-        These are automatically updated and read by CocoIDE,but can be read/set directly as required.
+        These are the model's, automatically updated and read by CocoIDE,but can be
+        read/set directly as required.
         Your methods (i.e. self.updatePort()) should also include a call to self.IOport._updatePort()
         as required to trigger a callback to CocoIDE to update the display etc.
 
-    ## The interruptVectors list is shared between all child object ports
+    ## Interrupts
       Interrupt vectors can be set using self.setInterrupt(), and will be picked up at beginning of the next
-      self.emu.step(), from CocoIDE.runProg(). The interruptVector list is processed in order FIFO
+      self.emu.step(), from CocoIDE.runProg(). Pending vectors are held by the emulator's interrupt
+      controller (CDM8Emu.intc), and taken in priority order, vector 0 first
     """
 
-    global interruptVectors  # Interrupt vector default = []. If not empty list, will raise interrupt
+    device = cdm8_dev.Device  # Model class
 
     def __init__(self, parent=None, portno=0, portAdr=0xF0, name="Untitled"):
         self.portno = portno
         self.parent = parent
-        self.portAdr = portAdr + self.portno  # default memory Address
-        self.prevAdr = None
+        try:
+            self.model = self.device(portAdr + self.portno)  # default memory Address
+        except ValueError:  # Its ports would go past 0xFF
+            self.model = self.device(portAdr)
+        self.model.subscribe(self.modelChanged)  # Redraw when the model changes
+        self.dirty = False  # Waiting for the next frame
+        self.shown = {}  # Widget options last configured, by widget
         self.name = name
-        self.prevRetVec = 0
-        self.retVectorVar = tk.StringVar()
-        # Dictionaries to hold IP and OP values. Can set to None in Super class if not used
-        # Define more entries if more than one adr/port/IOs required etc.
-        self.portIPvals = {}  # default input port adressses:values
-        self.portOPvals = {}  # default output port addresses:values
         ## Create the Standard IO port container - Super Class needs only fill self.IOdispwin
         #  with default GUI widgets etc.
         self.portFrame = tk.Frame(self.parent, width=358)
@@ -121,28 +181,48 @@ class IOport:
         self.IOdispwin.pack(side=tk.TOP, fill=tk.X, expand=1)
         # self.portno += 1
 
+    # The port registers are the model's
+    portAdr = property(lambda self: self.model.portAdr)
+    portIPvals = property(lambda self: self.model.portIPvals)
+    portOPvals = property(lambda self: self.model.portOPvals)
+    emu = property(lambda self: self.model.emu)
+
+    def modelChanged(self, model):
+        # Redraw on the next frame, however often the model changes
+        if not self.dirty:
+            self.dirty = True
+            dirtyPorts.append(self)
+            requestFrame(self.parent)
+
+    def configWidget(self, widget, **options):
+        # Configure widget only if options differ from those last configured
+        if self.shown.get(widget) != options:
+            self.shown[widget] = options
+            widget.config(**options)
+
     def getIPadr(self):
-        return list(self.portIPvals.keys())
+        return self.model.getIPadr()
 
     def getOPadr(self):
-        return list(self.portOPvals.keys())
+        return self.model.getOPadr()
 
     def getIPval(self):
-        return self.portIPvals.values()
+        return self.model.getIPval()
+
+    def attach(self, emu):
+        # Map the port's addresses into emulator emu's port table
+        if IDE:
+            self.model.onError = IDE.portError
+        self.model.attach(emu)
+
+    def detach(self):
+        self.model.detach()
 
     def setOPval(self, adr=None, val=0):
-        if adr == None:
-            adr = self.portAdr
-        # print ("%%", adr)#debug
-        if adr in self.portOPvals.keys():
-            # print("**", adr, val)#debug(
-            self.portOPvals[adr] = val
-            self.updatePort()
+        return self.model.setOPval(adr, val)
 
     def resetPort(self, event=None):
-        for item in self.portOPvals.keys():
-            self.portOPvals[item] = 0
-        self.updatePort()
+        self.model.resetPort()
 
     def updatePortAdr(self, event=None):
         # Check value returned
@@ -154,31 +234,23 @@ class IOport:
                     error = True
         else:
             error = True
-        # if ok, update port address
-        if not error:
+        # if ok, and all the device's ports fit, update port address
+        if not error and self.model.setAddress(int(numstr, 16)):
             self.adrBoxtxt.set(numstr)
-            numIPadrs = len(self.portIPvals)
-            numOPadrs = len(self.portOPvals)
-            self.portIPvals = {}  #: del self.portIPvals[self.portAdr]
-            self.portOPvals = {}  #: del self.portOPvals[self.portAdr]
-            self.portAdr = int(numstr, 16)
-            for n in range(numIPadrs):
-                # print("n=",n, self.portAdr+n)
-                self.portIPvals[(self.portAdr + n)] = 0x00
-            startAdr = self.portAdr
-            for n in range(numOPadrs):
-                # print("n=",n, self.portAdr+n)
-                self.portOPvals[(self.portAdr + n)] = 0x00
-            # print(self.portIPvals)# debug
-            # print(self.portOPvals)# debug
         else:
             self.adrBoxtxt.set("%02X" % self.portAdr)
-        self.updatePort()
+            self.updatePort()
 
     def _updatePort(self):
-        self.parent.event_generate("<<updatePort>>", state=256)
+        # CocoIDE redraws on the next frame
+        global ideDirty
+        self.model.remap()
+        ideDirty = True
+        requestFrame(self.parent)
 
     def removePort(self, event=None):
+        self.detach()
+        self.model.unsubscribe(self.modelChanged)
         self.portFrame.destroy()  # Remove itself!
         # Generate event in Super class to clear up IOports list etc.
         self.parent.event_generate("<<updatePort>>", state=str(self.portno))
@@ -190,23 +262,21 @@ class IOport:
         self.dispfont.config(size=int(newsize * 1.3), weight="bold")  # update
 
     def setInterrupt(self, vector=0):
-        global interruptVectors  # Interrupt vector
         # Generates a hardware interrupt for the CDM8 machine.
         # Will be serviced, after the current instruction has been completed
         # then reset.
-        interruptVectors += [vector]
-        # print("£", vector, interruptVectors)
+        self.model.setInterrupt(vector)
 
 
 ### IO Ports (inherit from IOport)
 
 
 class OP_LEDs_8x1(IOport):
+    device = cdm8_dev.LEDs8x1
+
     def __init__(self, parent=None, portno=0, portAdr=0xF0):
         self.name = self.__class__.__name__  # IO port name for title
         IOport.__init__(self, parent, portno, portAdr, self.name)
-        self.portOPvals = {self.portAdr: 0x00}  # Only outputs needed
-        self.portIPvals = {}
         # Create the port GUI
         self.opLabels = []
         for n in range(8):
@@ -226,44 +296,33 @@ class OP_LEDs_8x1(IOport):
         # self.updatePort()
 
     def updatePort(self, event=None):
-        # Check if address needs updating
-        if self.portAdr != self.prevAdr:
-            self.portOPvals = {self.portAdr: 0x00}
-            self.portIPvals = {}
-            self.prevAdr = self.portAdr
-
-        # Then update the port IO registers
+        # Update the LEDs from the port OP register
         newval = self.portOPvals[self.portAdr]
-        for n in range(len(self.opLabels)):
-            mask = 0b00000001
-            for bit in range(8):
-                if newval & mask:
-                    self.opLabels[bit].config(bg="yellow", fg="black")
-                else:
-                    self.opLabels[bit].config(bg=cf.oportColour, fg="white")
-                mask = mask << 1
+        mask = 0b00000001
+        for bit in range(8):
+            if newval & mask:
+                self.configWidget(self.opLabels[bit], bg="yellow", fg="black")
+            else:
+                self.configWidget(self.opLabels[bit], bg=cf.oportColour, fg="white")
+            mask = mask << 1
         IOport._updatePort(self)  # Call back to update CocoIDE
 
 
 class IP_Keybd_7Bit(IOport):
+    device = cdm8_dev.Keybd7Bit
+
     def __init__(self, parent=None, portno=0, portAdr=0xF0):
         self.name = self.__class__.__name__
         IOport.__init__(self, parent, portno, portAdr, self.name)
-        self.portOPvals = {}
-        self.portIPvals = {self.portAdr: 0}  # Only Input port needed
 
         # Create the port display
         # Vars
-        self.keybBuffer = []  # Character buffer
-        self.prevIntvec = 0
         self.retVectorVar = tk.IntVar()
         self.retVectorVar.set("0")
         self.prevRetVec = "0"
         self.ctrlcVectorVar = tk.IntVar()
         self.ctrlcVectorVar.set("1")
         self.prevCtrlVec = "1"
-        self.bufVar = tk.StringVar()
-        self.bufVar.set("")
         # widgets
         self.intLabel = tk.Label(self.IOdispwin, text="Interrupt: Return Ctrl+C")
         self.intLabel.grid(row=0, column=0, columnspan=3, sticky="sew")
@@ -297,21 +356,10 @@ class IP_Keybd_7Bit(IOport):
             fg="white",
             bg="royal blue",
         )
-        self.bufEntry.bind("<Key>", self.updatePort)  #
-        # self.bufEntry.bind("<Return>", self.updatePort)
+        self.bufEntry.bind("<Key>", self.keyPress)  #
         self.bufEntry.grid(row=1, column=4)
         self.updatePort()
 
-    def getIPval(self):  # Overide the parent method
-        ret = IOport.getIPval(self)
-        if self.keybBuffer:
-            if self.keybBuffer[0] < 32:
-                self.bufEntry.delete("1.0", "1.0 + 1c")
-            self.bufEntry.delete("1.0", "1.0 + 1c")
-            del self.keybBuffer[0]
-        self.updatePort(self, keypress=False)
-        return ret
-
     def updateVec(self, event=None):
         # print("update vector")
         intvec = str(self.retVectorVar.get())
@@ -327,58 +375,50 @@ class IP_Keybd_7Bit(IOport):
             self.ctrlcVectorVar.set(intvec[0])
         else:
             self.ctrlcVectorVar.set(str(self.prevCtrlVec))
+        self.model.retVector = int(self.prevRetVec)
+        self.model.ctrlcVector = int(self.prevCtrlVec)
         return
 
-    def updatePort(self, event=None, keypress=True):
-        # print("keyb updatePort")
-        # Check and update buffer and IP port value/char
-        if event and keypress:
-            if event.keysym == "Return":
-                # print("Return Interrupt")
-                self.setInterrupt(vector=int(self.retVectorVar.get()))
-            elif event.char:
-                # A valid character key has been pressed, limit to 7 bits and 16 chars
-                asc = ord(event.char)
-                if asc == 3:  # Ctrl C Interrupt
-                    # print("^C Interrupt")
-                    self.setInterrupt(vector=int(self.ctrlcVectorVar.get()))
-                elif asc < 32 and len(self.keybBuffer) < 16:  # Control Char.
-                    self.keybBuffer.append(asc)
-                    self.bufEntry.insert(tk.END, "^" + chr(asc + 96))  # Leading ^
-                elif len(self.keybBuffer) < 16:
-                    self.keybBuffer.append(asc)
-                    self.bufEntry.insert(tk.END, event.char)
-        # Update Input port value (with next char)
-        # print(self.keybBuffer)#debug
-        if self.keybBuffer:
-            self.portIPvals[self.portAdr] = self.keybBuffer[0]
-        else:
-            self.portIPvals[self.portAdr] = 0b10000000
-        # print(self.portIPvals[self.portAdr])#debug
+    def keyPress(self, event=None):
+        if event.keysym == "Return":
+            # print("Return Interrupt")
+            self.model.returnKey()
+        elif event.char:
+            # A valid character key has been pressed
+            self.model.key(ord(event.char))
+        return "break"
+
+    def updatePort(self, event=None):
+        # Show the buffered characters, control chars with a leading ^
+        text = ""
+        for asc in self.model.keybBuffer:
+            if asc < 32:
+                text += "^" + chr(asc + 96)
+            else:
+                text += chr(asc)
+        if self.shown.get(self.bufEntry) != text:
+            self.shown[self.bufEntry] = text
+            self.bufEntry.delete("1.0", tk.END)
+            self.bufEntry.insert(tk.END, text)
         IOport._updatePort(self)  # Call back to update CocoIDE
         return "break"
 
 
 class IO_Timer(IOport):
+    device = cdm8_dev.Timer
+
     def __init__(self, parent=None, portno=0, portAdr=0xF0):
         self.name = self.__class__.__name__
         IOport.__init__(self, parent, portno, portAdr, self.name)
         ## Variables
-        self.portOPvals = {self.portAdr: 0}  # self.portAdr:0} # Write and
-        self.portIPvals = {self.portAdr: 0}  # Read timer values
         self.timerStrValue = tk.StringVar()
         self.timerStrValue.set(str("%03d" % 0))
-        self.timerValue = 0
         # timerIncrement = 1000 # 1000 msecs = 1 sec
         self.timerIncVar = tk.IntVar()
-        self.timerIncVar.set(100)  # 0.1 Sec
-        self.timerInc = 100
-        self.prevTimerValue = 0
+        self.timerIncVar.set(self.model.timerInc)  # 0.1 Sec
         self.vectorVar = tk.StringVar()
         self.vectorVar.set("0")
         self.prevVec = "0"
-        self.callback = False
-        self.decrid = None
 
         ## Create the port GUI
         # Interuppt Vector
@@ -399,15 +439,19 @@ class IO_Timer(IOport):
             row=1, column=0, sticky="w"
         )
         tk.Radiobutton(
-            self.IOdispwin, text="0.1sec", variable=self.timerIncVar, value=100
-        ).grid(
-            row=1, column=1, sticky="w"
-        )  # , command=self.tscaleSelect
+            self.IOdispwin,
+            text="0.1sec",
+            variable=self.timerIncVar,
+            value=100,
+            command=self.updateInc,
+        ).grid(row=1, column=1, sticky="w")
         tk.Radiobutton(
-            self.IOdispwin, text="1.0sec", variable=self.timerIncVar, value=1000
-        ).grid(
-            row=1, column=2, sticky="w"
-        )  # , command=self.tscaleSelect
+            self.IOdispwin,
+            text="1.0sec",
+            variable=self.timerIncVar,
+            value=1000,
+            command=self.updateInc,
+        ).grid(row=1, column=2, sticky="w")
 
         # Timer readout
         self.timerDisp = tk.Entry(
@@ -420,7 +464,7 @@ class IO_Timer(IOport):
             bg=cf.ioportColour,
             fg="white",
         )
-        self.timerDisp.bind("<Return>", self.setOPval)
+        self.timerDisp.bind("<Return>", self.enterTimer)
         self.timerDisp.grid(row=0, rowspan=2, column=4)
         self.updatePort()
 
@@ -432,65 +476,45 @@ class IO_Timer(IOport):
             self.vectorVar.set(intvec[0])
         else:
             self.vectorVar.set(str(self.prevVec))
+        self.model.vector = int(self.prevVec)
         return
 
-    def decrTimer(self, event=None):
-        self.timerInc = self.timerIncVar.get()
-        self.updatePort()
-        # print(self.timerInc, "%",self.timerValue)# debug
-        if self.timerValue > 0:
-            self.timerValue -= 1
-            self.decrid = self.parent.after(self.timerInc, self.decrTimer)
-            self.callback = True
-        else:  # self.timerValue <= 0
-            # generate interrupt
-            self.setInterrupt(vector=int(self.vectorVar.get()))
-            self.timerValue = 0
-            self.prevTimerValue = 0
-            self.callback = False
-
-    def setOPval(self, adr=None, val=None):
-        # Overide parent setOPval
-        if val == None:  # Direct entered timer value
+    def updateInc(self):
+        self.model.timerInc = self.timerIncVar.get()
+
+    def enterTimer(self, event=None):
+        # Direct entered timer value
+        try:
             val = int(self.timerStrValue.get())
-            if val < 0 or val > 255:
-                # self.timerStrValue.set(str("%03d" % self.prevTimerValue))
-                val = self.prevTimerValue
-        if val > 0:  # and self.prevTimerValue != val: # If new timer setting
-            self.timerValue = val
-            self.prevTimerValue = val
-        if self.timerValue > 0 and self.callback == False:
-            # Only if timer not currenly running set callback
-            self.decrTimer()
-        if val == 0 and self.callback == True:
-            # Cancel timer
-            # print("cancel timer", val)
-            self.parent.after_cancel(self.decrid)
-            self.timerValue = 0
-            self.callback = False
-            self.updatePort()
+        except ValueError:
+            val = -1
+        if val < 0 or val > 255:
+            val = self.model.prevTimerValue
+        self.model.setOPval(self.portAdr, val)
 
     def updatePort(self, event=None):
-        self.portIPvals = {self.portAdr: self.timerValue}
-        self.portOPvals = {self.portAdr: 0}
-        self.timerStrValue.set(str("%03d" % self.timerValue))
+        if self.shown.get(self.timerDisp) != self.model.timerValue:
+            self.shown[self.timerDisp] = self.model.timerValue
+            self.timerStrValue.set(str("%03d" % self.model.timerValue))
         IOport._updatePort(self)  # Call back to update CocoIDE
         return
 
 
 class IP_Buttons_8x1(IOport):
+    device = cdm8_dev.Buttons8x1
+
     def __init__(self, parent=None, portno=0, portAdr=0xF0):
         self.name = self.__class__.__name__
         IOport.__init__(self, parent, portno, portAdr, self.name)
-        self.portOPvals = {}
-        self.portIPvals = {self.portAdr: 0}  # Only Input port needed
         # Create the port GUI
         self.ipButtons = []
-        self.buttonNum = None
         self.resetPortVar = tk.IntVar()
         self.resetPortVar.set(1)
         tk.Checkbutton(
-            self.IOdispwin, text="Reset\non Read", var=self.resetPortVar
+            self.IOdispwin,
+            text="Reset\non Read",
+            var=self.resetPortVar,
+            command=self.updateReset,
         ).pack(side=tk.LEFT)
         # Create Input Buttons
         for n in range(8):
@@ -507,193 +531,290 @@ class IP_Buttons_8x1(IOport):
                     activeforeground="white",
                     relief="raised",
                     border=2,
-                    command=lambda x=(n): self.updatePort(button=x),
                 ),
             )
             self.ipButtons[0].pack(side=tk.RIGHT, expand=1)
-            self.btn = None
-            for btn in self.ipButtons:
-                btn.bind("<Button-1>", self.toggleButton)  # updatePort)
-                btn.bind("<ButtonRelease-1>", None)  # self.releaseAllButtons)
-
-                btn.bind("<Key>", lambda e: "break")  # disable keys!
-                # btn.bind("<Enter>", lambda e: btn.focus_force())
-                # btn.bind("<KeyRelease-Return>", self.updatePort)
+            self.ipButtons[0].bind(
+                "<Button-1>", lambda e, x=n: self.toggleButton(button=x)
+            )
+            self.ipButtons[0].bind("<Key>", lambda e: "break")  # disable keys!
         self.updatePort()
 
+    def updateReset(self):
+        self.model.resetOnRead = self.resetPortVar.get() == 1
+
     def toggleButton(self, event=None, button=None):
-        if event and not button:  # Get numberof button released
-            # debug, 4=mouse button-1 down, 5 mouse button-1 release
-            # print("%",self.resetPortVar.get(), event.type)
-            if (
-                int(event.type) == 4 or int(event.type) == 5
-            ):  # or self.resetPortVar.get() == 0:# and event.type == 5):
-                n = 7
-                for btn in self.ipButtons:
-                    if btn == event.widget:  # find which button was released
-                        button = n
-                    n -= 1
         if button != None:
-            # print("Button=", button, self.ipButtons[button].config("relief"))
-            if "raised" in self.ipButtons[7 - button].config("relief"):  # == "raised":
-                self.pushButton(button=button)
-            else:
-                self.releaseButton(button=button)
+            self.model.toggle(button)
         return "break"
 
-    def pushButton(self, event=None, button=None):
-        if event and not button:  # Get number of button pressed
-            if int(event.type) == 4:  # event = Mouse Button pressed
-                n = 7
-                for btn in self.ipButtons:
-                    if btn == event.widget:  # find which button was pressed
-                        button = n
-                    n -= 1
-                # print(self.ipButtons[n].state(), self.ipButtons[n+1].state())# debug
-        if button != None:
-            print("toggled down")
-            self.ipButtons[7 - button].config(relief="sunken")
-            # print(self.portIPvals[self.portAdr], butt)
-            portval = self.portIPvals[self.portAdr] | (1 << button)  # += 2**butt
-            # print("portval", portval)
-            self.portIPvals[self.portAdr] = portval
+    def updatePort(self, event=None):
+        # Show pushed buttons sunken
+        for button in range(8):
+            if self.model.isDown(button):
+                self.configWidget(self.ipButtons[7 - button], relief="sunken")
+            else:
+                self.configWidget(self.ipButtons[7 - button], relief="raised")
         IOport._updatePort(self)
         return "break"
 
-    def releaseAllButtons(self, event=None):
-        # print(self.resetPortVar.get())
-        if self.resetPortVar.get() == 0:
-            for btn in self.ipButtons:
-                #    print(btn)
-                #    btn.state(["!pressed", "!active"])
-                #    #print(btn.state())
-                btn.config(relief="raised")
-            self.portIPvals[self.portAdr] = 0
-        IOport._updatePort(self)
-        return "break"
 
-    def releaseButton(self, event=None, button=None):
-        if event and not button:  # Get numberof button released
-            # debug, 4=mouse button-1 down, 5 mouse button-1 release
-            # print("%",self.resetPortVar.get(), event.type)
-            if int(event.type) == 5:  # event = Mouse Button released
-                n = 7
-                for btn in self.ipButtons:
-                    if btn == event.widget:  # find which button was released
-                        button = n
-                    n -= 1
-        if button != None:
-            print("toggle up")
-            print("Raised")
-            self.ipButtons[7 - button].config(relief="raised")
-            # print(self.portIPvals[self.portAdr], butt)
-            portval = self.portIPvals[self.portAdr] & (~(1 << button))  # += 2**butt
-            # print("portval", portval)
-            self.portIPvals[self.portAdr] = portval
-        IOport._updatePort(self)
-        return "break"
+class IO_DMA(IOport):
+    device = cdm8_dev.DMA
 
-    def getIPval(self):  # Override IOport getIPVal
-        # Save current values
-        val = self.portIPvals.values()
-        # If reset on read is selected, reset port to 0
-        if self.resetPortVar.get() == 1:
-            self.portIPvals[self.portAdr] = 0
-            # Reset buttons
-            if self.resetPortVar.get() == 1:
-                for btn in self.ipButtons:
-                    btn.config(relief="raised")
-        return val
-
-    def updatePort(self, event=None, button=None):
-        # If port adr changed, update port address range
-        # print(self.prevAdr, self.portAdr)debug
-        if self.portAdr != self.prevAdr:
-            self.portIPvals[self.portAdr] = 0x00
-            self.prevAdr = self.portAdr
-        IOport._updatePort(self)
+    def __init__(self, parent=None, portno=0, portAdr=0xF0):
+        self.name = self.__class__.__name__
+        IOport.__init__(self, parent, portno, portAdr, self.name)
+        # Create the port GUI, register names and values
+        self.adrRangeLabel = tk.Label(
+            self.IOdispwin, text="to %02X " % (self.portAdr + 4)
+        )
+        self.adrRangeLabel.grid(row=0, column=0, rowspan=2, sticky="w")
+        self.regLabels = []
+        for n, regname in enumerate(["Src", "Dst", "Len", "Pages", "Ctrl"]):
+            tk.Label(self.IOdispwin, text=regname).grid(row=0, column=n + 1)
+            self.regLabels.append(
+                tk.Label(
+                    self.IOdispwin,
+                    text="00",
+                    width=3,
+                    font=self.dispfont,
+                    border=3,
+                    relief="raised",
+                    bg=cf.ioportColour,
+                    fg="white",
+                )
+            )
+            self.regLabels[-1].grid(row=1, column=n + 1)
+        self.statusLabel = tk.Label(self.IOdispwin, text="", width=12)
+        self.statusLabel.grid(row=0, column=6, rowspan=2)
+        self.updatePort()
+
+    def updatePort(self, event=None):
+        self.configWidget(self.adrRangeLabel, text="to %02X " % (self.portAdr + 4))
+        for n, val in enumerate(self.model.regs):
+            self.configWidget(self.regLabels[n], text="%02X" % val)
+        if self.model.busy:
+            status = "Busy"
+        else:
+            status = "Done" if self.model.done else "Idle"
+        self.configWidget(
+            self.statusLabel, text="%s\n%d bytes" % (status, self.model.bytes)
+        )
+        IOport._updatePort(self)  # Call back to update CocoIDE
+
+
+class IO_Terminal(IOport):
+    device = cdm8_dev.Terminal
+    maxLines = 200  # Lines kept on screen
+
+    def __init__(self, parent=None, portno=0, portAdr=0xF0):
+        self.name = self.__class__.__name__
+        IOport.__init__(self, parent, portno, portAdr, self.name)
+        self.clears = self.model.clears
+        # Create the port GUI
+        self.intLabel = tk.Label(self.IOdispwin, text="")
+        self.intLabel.grid(row=0, column=0, sticky="nw")
+        self.screen = tk.Text(
+            self.IOdispwin,
+            height=6,
+            width=32,
+            font=self.dispfont,
+            fg="white",
+            bg="black",
+            insertbackground="white",
+        )
+        self.screen.bind("<Key>", self.keyPress)
+        self.screen.grid(row=0, column=1)
+        self.updatePort()
+
+    def keyPress(self, event=None):
+        if event.keysym == "Return":
+            self.model.input("\n")
+        elif event.char:
+            self.model.input(event.char)
         return "break"
 
+    def updatePort(self, event=None):
+        self.configWidget(
+            self.intLabel,
+            text="Data %02X\nStatus %02X" % (self.portAdr, self.portAdr + 1),
+        )
+        if self.clears != self.model.clears:  # Port reset, clear screen
+            self.clears = self.model.clears
+            self.screen.delete("1.0", tk.END)
+        text = self.model.takeOutput()
+        if text:  # All the characters sent since the last frame
+            self.screen.insert(tk.END, text)
+            lines = int(self.screen.index("end-1c").split(".")[0])
+            if lines > self.maxLines:
+                self.screen.delete("1.0", "%d.0" % (lines - self.maxLines + 1))
+            self.screen.see(tk.END)
+        IOport._updatePort(self)  # Call back to update CocoIDE
+
+
+class IO_Framebuffer(IOport):
+    device = cdm8_dev.Framebuffer
+    imageSize = 192  # pixels, both modes
+
+    def __init__(self, parent=None, portno=0, portAdr=0xF0):
+        self.name = self.__class__.__name__
+        IOport.__init__(self, parent, portno, portAdr, self.name)
+        # Create the port GUI
+        self.adrLabel = tk.Label(self.IOdispwin, text="")
+        self.adrLabel.grid(row=0, column=0, sticky="nw")
+        self.image = tk.PhotoImage(width=self.imageSize, height=self.imageSize)
+        tk.Label(self.IOdispwin, image=self.image, border=3, relief="sunken").grid(
+            row=0, column=1
+        )
+        self.model.dirtyRows = set(range(self.model.size()[1]))
+        self.updatePort()
+
+    def updatePort(self, event=None):
+        self.configWidget(
+            self.adrLabel,
+            text="Adr  %02X\nData %02X\nMode %02X"
+            % (self.portAdr, self.portAdr + 1, self.portAdr + 2),
+        )
+        rows = self.model.takeRows()
+        if rows:  # Draw the changed rows, first to last, in one put()
+            scale = self.imageSize // self.model.size()[0]
+            colours = self.model.colours()
+            data = []
+            for y in range(rows[0], rows[-1] + 1):
+                line = " ".join(
+                    colours[pixel] for pixel in self.model.row(y) for n in range(scale)
+                )
+                data += ["{" + line + "}"] * scale
+            self.image.put(" ".join(data), to=(0, rows[0] * scale))
+        IOport._updatePort(self)  # Call back to update CocoIDE
+
+
+class IO_Bridge(IOport):
+    device = cdm8_dev.Bridge
+
+    def __init__(self, parent=None, portno=0, portAdr=0xF0):
+        self.name = self.__class__.__name__
+        IOport.__init__(self, parent, portno, portAdr, self.name)
+        self.noPorts = tk.StringVar()
+        self.noPorts.set(str(self.model.count))
+        self.targetVar = tk.StringVar()
+        self.targetVar.set("python3 cdm8_cosim.py")
+        # Create the port GUI
+        self.adrRangeLabel = tk.Label(self.IOdispwin, text="")
+        self.adrRangeLabel.grid(row=0, column=0, columnspan=2, sticky="w")
+        tk.Label(self.IOdispwin, text="N=").grid(row=1, column=0, sticky="e")
+        self.noPortsEntry = tk.Entry(self.IOdispwin, text=self.noPorts, width=2)
+        self.noPortsEntry.bind("<Return>", self.updateN)
+        self.noPortsEntry.grid(row=1, column=1, sticky="w")
+        self.targetEntry = tk.Entry(self.IOdispwin, text=self.targetVar, width=24)
+        self.targetEntry.bind("<Return>", self.connect)
+        self.targetEntry.grid(row=0, column=2, columnspan=2, sticky="ew")
+        self.connectButton = tk.Button(
+            self.IOdispwin, text="Connect", command=self.connect
+        )
+        self.connectButton.grid(row=1, column=2, sticky="w")
+        self.statsLabel = tk.Label(self.IOdispwin, text="")
+        self.statsLabel.grid(row=1, column=3, sticky="w")
+        self.updatePort()
+
+    def updateN(self, event=None):
+        noports = self.noPorts.get()
+        if not (noports.isdigit() and self.model.setPorts(int(noports))):
+            self.noPorts.set(str(self.model.count))
+        self.updatePort()
+
+    def connect(self, event=None):
+        # Connect to the simulator given by the entry, or disconnect
+        if self.model.connected():
+            self.model.close()
+        else:
+            try:
+                self.model.connect(self.targetVar.get())
+            except (OSError, ValueError) as error:
+                self.configWidget(self.statsLabel, text=str(error)[:30])
+                return
+        self.updatePort()
+
+    def removePort(self, event=None):
+        self.model.close()
+        IOport.removePort(self)
+
+    def updatePort(self, event=None):
+        self.model.flush()  # Buffered writes, once per frame
+        self.configWidget(
+            self.adrRangeLabel, text="to %02X" % (self.portAdr + self.model.count - 1)
+        )
+        if self.model.connected():
+            self.configWidget(self.connectButton, text="Disconnect")
+            self.configWidget(
+                self.statsLabel,
+                text="%d trans. %d batches %d syncs"
+                % (self.model.transactions, self.model.batches, self.model.syncs),
+            )
+        else:
+            self.configWidget(self.connectButton, text="Connect")
+        IOport._updatePort(self)  # Call back to update CocoIDE
+
 
-"""
-##?? In progress - not needed for non-paged memory
 class OP_MemMgr(IOport):
-    def __init__(self, parent=None, portno=0, portAdr=0xf0):
-        self.name=self.__class__.__name__
+    device = cdm8_dev.MemMgr
+
+    def __init__(self, parent=None, portno=0, portAdr=0xF0):
+        self.name = self.__class__.__name__
         IOport.__init__(self, parent, portno, portAdr, self.name)
         ## Variables
-        global memDict
-        memDict = {0:0, 1:1, 2:2, 3:3, 4:4, 5:5, 6:6, 7:7}
-        self.portOPvals = {self.portAdr:0} # Write to port OP new val/map
-        self.portIPvals = {}
-        self.mmDict = {0:0, 1:1, 2:2, 3:3, 4:4, 5:5, 6:6, 7:7}
         self.pageSelect = []
         self.pageSelectVars = []
-        
+
         ## GUI
         tk.Label(self.IOdispwin, text="Map RAM Page: ").grid(row=0, column=0)
         tk.Label(self.IOdispwin, text="To RAM Page: ").grid(row=1, column=0, sticky="e")
         for n in range(8):
-            tk.Label(self.IOdispwin, text="%01X" % n).grid(row=0, column=(n*2+1), sticky="w")
-            if n < 7: # Add spaces
-                tk.Label(self.IOdispwin, width=1).grid(row=0, column=(n*2+2))
+            tk.Label(self.IOdispwin, text="%01X" % n).grid(
+                row=0, column=(n * 2 + 1), sticky="w"
+            )
+            if n < 7:  # Add spaces
+                tk.Label(self.IOdispwin, width=1).grid(row=0, column=(n * 2 + 2))
             self.pageSelectVars.append(tk.IntVar())
-            self.pageSelect.append( ttk.Combobox(self.IOdispwin, textvariable=self.pageSelectVars[-1],
-            state='readonly', width=1, foreground="black", background="white"))
-            self.pageSelect[-1].bind('<<ComboboxSelected>>',self.updatePort) # reset Program Counter
-            self.pageSelect[-1]['values'] = [0,1,2,3,4,5,6,7]
+            self.pageSelect.append(
+                ttk.Combobox(
+                    self.IOdispwin,
+                    textvariable=self.pageSelectVars[-1],
+                    state="readonly",
+                    width=1,
+                    foreground="black",
+                    background="white",
+                )
+            )
+            self.pageSelect[-1].bind(
+                "<<ComboboxSelected>>", lambda e, page=n: self.selectPage(page)
+            )
+            self.pageSelect[-1]["values"] = [0, 1, 2, 3, 4, 5, 6, 7]
             self.pageSelect[-1].current(n)
-            self.pageSelect[-1].grid(row=1, column=(n*2+1), sticky="w")
-        
-    def removePort(self, event=None): #Overide IOpoort method
-        # Reset memory mappings
-        global memDict
-        # restore default memDict
-        memDict = {0:0, 1:1, 2:2, 3:3, 4:4, 5:5, 6:6, 7:7}
-        IDE.Emu.mm = memDict
-        IOport.removePort(self) # then close the MM.
-    
-    def setOPval(self, adr=None, val=0):
-        global memDict
-        mappage = val & 0b0000111
-        topage  = (val >> 4) & 0b00001111
-        #print("Map page ", mappage, " to ", topage)
-        if mappage > 7 or topage > 7:
-            #print("")
-            return "Run time Error!\nIllegal Memory Manager value\n Bits 3 and 7 should be 0"
-        else:
-            memDict[mappage] = topage
-            #print(memDict)
-            self.pageSelectVars[mappage].set(topage)
-            IOport.setOPval(self,adr, val) # update IDE etc.   
-        return
-        
+            self.pageSelect[-1].grid(row=1, column=(n * 2 + 1), sticky="w")
+        self.updatePort()
+
+    def selectPage(self, page):
+        self.model.mapPage(page, int(self.pageSelectVars[page].get()))
+
     def updatePort(self, event=None):
-        global memDict
-        if event:
-            #print("Listbox chamged")
-            memDict = {}
-            n = 0
-            for page in self.pageSelectVars:
-                #n = page.curselection(0)
-                #print("Page ", n," to ", page.get())
-                memDict[n] = int(page.get())
-                n += 1
-        IDE.Emu.mm = memDict
-        #print(" ",memDict,"\n", IDE.Emu.mm)
-"""
+        # Show the map, e.g. after a write to the port
+        for page, physical in enumerate(self.model.map):
+            if self.shown.get(self.pageSelect[page]) != physical:
+                self.shown[self.pageSelect[page]] = physical
+                self.pageSelectVars[page].set(physical)
+        IOport._updatePort(self)  # Call back to update CocoIDE
 
 
 class OP_Disp_16xChr(IOport):
+    device = cdm8_dev.Disp16xChr
+
     def __init__(self, parent=None, portno=0, portAdr=0xE0):
         self.name = self.__class__.__name__
         portno = 0  # Always zero for this
         IOport.__init__(self, parent, portno, portAdr, self.name)
         # Create the port GUI
-        self.portOPvals = {}
-        self.prevAdr = None
-        for n in range(16):
-            self.portOPvals[self.portAdr + n] = 0x00
         self.adrRangeLabel = tk.Label(
             self.IOdispwin, text=" to\n  %02X" % (self.portAdr + 15)
         )
@@ -720,94 +841,74 @@ class OP_Disp_16xChr(IOport):
         self.updatePort()
 
     def updatePort(self, event=None):
-        # If port adr changed, update address range
-        # print(self.prevAdr, self.portAdr)
-        if self.portAdr != self.prevAdr:
-            self.portOPvals = {}
-            self.prevAdr = self.portAdr
-            self.adrRangeLabel.config(text="to\n" + "%02X" % (self.portAdr + 15))
-            #
-            for n in range(16):
-                self.portOPvals[self.portAdr + n] = 0x00
-            IOport._updatePort(self)  # Call back to update CocoIDE
-
+        self.configWidget(
+            self.adrRangeLabel, text="to\n" + "%02X" % (self.portAdr + 15)
+        )
         # Update port display label chars
         n = 0
         for key, val in self.portOPvals.items():
             # print("*",key, val)
             if val != 0:
-                self.charLabels[n].config(text=chr(val))
+                self.configWidget(self.charLabels[n], text=chr(val))
             else:
-                self.charLabels[n].config(text="")
+                self.configWidget(self.charLabels[n], text="")
             n += 1
+        IOport._updatePort(self)  # Call back to update CocoIDE
         return
 
 
 class OP_HexDisps_xN(IOport):
+    device = cdm8_dev.HexDisps
+    padx = 1
+    spacers = True
+
     def __init__(self, parent=None, portno=0, portAdr=0xF0):
         self.name = self.__class__.__name__  # IO port name for title
         IOport.__init__(self, parent, portno, portAdr, self.name)
-        self.portOPvals = {}  # Only outputs needed
         self.noPorts = tk.StringVar()
-        self.noPorts.set("3")
+        self.noPorts.set(str(self.model.noPorts))
         self.charLabels = []
         self.spacer = []
-        self.prevPorts = None
         # Display
         self.adrRangeLabel = tk.Label(
             self.IOdispwin,
-            text="to %02X " % (self.portAdr + int(self.noPorts.get()) - 1),
+            text="to %02X " % (self.portAdr + self.model.noPorts - 1),
         )
         self.adrRangeLabel.grid(row=0, column=0, columnspan=2, sticky="w")
         self.noPortsLabel = tk.Label(self.IOdispwin, text="N=")
         self.noPortsLabel.grid(row=1, column=0, sticky="e")
         self.noPortsEntry = tk.Entry(self.IOdispwin, text=self.noPorts, width=1)
-        self.noPortsEntry.bind("<Return>", self.updatePort)  # self.portNupdate)
+        self.noPortsEntry.bind("<Return>", self.updateN)
         self.noPortsEntry.grid(row=1, column=1, sticky="e")
         tk.Label(self.IOdispwin, text=" ", width=1).grid(row=0, column=2, rowspan=2)
-        self.charLabels = []
-        # self.portNupdate()
         self.updatePort()
 
-    def updatePort(self, event=None):
-        # Called by CocoIE if OP Port address is written to or changed
-
-        # Check if num of OP ports or addreses have changed
-        noports = int(self.noPorts.get()[0])
-        self.noPorts.set(str(noports))  # Just use first character
-        if str(noports) in "123456" and noports != self.prevPorts:
-            # print("Redraw Hex disp")# debug
-            # redraw the display
-            for disp in self.charLabels:
-                disp.destroy()
-            self.charLabels = []
-            for disp in self.spacer:
-                disp.destroy()
-            self.spacer = []
-            for n in range(noports):
-                self.charLabels.append(
-                    tk.Label(
-                        self.IOdispwin,
-                        text="",
-                        width=1,
-                        padx=1,
-                        font=self.dispfont,
-                        pady=3,
-                        border=3,
-                        relief="raised",
-                        bg=cf.oportColour,
-                        fg="white",
-                    )
-                )
-                self.charLabels[-1].grid(
-                    row=0, column=(n * 3 + 5), rowspan=2, sticky="nsew"
-                )
+    def updateN(self, event=None):
+        # Number of displays entered, just use first character
+        noports = self.noPorts.get()[:1]
+        if not (noports.isdigit() and self.model.setPorts(int(noports))):
+            # Bad value. not in range 1 to 6, or alpha char
+            self.noPorts.set(str(self.model.noPorts))
+        self.updatePort()
+
+    def newDisplays(self, noports):
+        # (Re)draw noports two digit displays
+        for disp in self.charLabels:
+            disp.destroy()
+        self.charLabels = []
+        for disp in self.spacer:
+            disp.destroy()
+        self.spacer = []
+        self.shown = {}
+        for n in range(noports):
+            # Low then high nibble
+            for column in (n * 3 + 5, n * 3 + 4):
                 self.charLabels.append(
                     tk.Label(
                         self.IOdispwin,
                         text="",
                         width=1,
-                        padx=1,
+                        padx=self.padx,
                         font=self.dispfont,
                         pady=3,
                         border=3,
@@ -816,142 +917,42 @@ class OP_HexDisps_xN(IOport):
                         fg="white",
                     )
                 )
-                self.charLabels[-1].grid(
-                    row=0, column=(n * 3 + 4), rowspan=2, sticky="nsew"
-                )
+                self.charLabels[-1].grid(row=0, column=column, rowspan=2, sticky="nsew")
+            if self.spacers:
                 self.spacer.append(tk.Label(self.IOdispwin, text="", width=0, padx=3))
                 self.spacer[-1].grid(
                     row=0, column=(n * 3 + 6), rowspan=2, sticky="nsew"
                 )
-        else:  # Bad value. not in range 1 to 6, or alpha char
-            self.noPorts.set(self.prevPorts)
-
-        # Check if OP addresses need updating
-        numports = int(self.noPorts.get())
-        if self.portAdr != self.prevAdr or numports != self.prevPorts:
-            # print("Updating Adrs")#debug
-            self.portOPvals = {}
-            self.adrRangeLabel.config(text="to %X" % (self.portAdr + numports - 1))
-            for n in range(numports):
-                self.portOPvals[self.portAdr + n] = 0x00
-            self.prevAdr = self.portAdr
-            self.prevPorts = numports
-
-        # Then update the port display
-        labIndex = 0
-        for n in range(len(self.portOPvals)):
-            newval = int(self.portOPvals[self.portAdr + n])
-            self.charLabels[labIndex].config(text="%X" % (newval & 0b00001111))
-            labIndex += 1
-            self.charLabels[labIndex].config(text="%X" % (newval >> 4))
-            labIndex += 1
-        IOport._updatePort(self)  # Call back to update CocoIDE/Emu
-
-
-class OP_DecDisps_2xN(IOport):
-    def __init__(self, parent=None, portno=0, portAdr=0xF0):
-        self.name = self.__class__.__name__  # IO port name for title
-        IOport.__init__(self, parent, portno, portAdr, self.name)
-        self.portOPvals = {}  # Only outputs needed
-        self.noPorts = tk.StringVar()
-        self.noPorts.set("3")
-        self.charLabels = []
-        self.spacer = []
-        self.prevPorts = None
-        # Display
-        self.adrRangeLabel = tk.Label(
-            self.IOdispwin,
-            text="to %02X " % (self.portAdr + int(self.noPorts.get()) - 1),
-        )
-        self.adrRangeLabel.grid(row=0, column=0, columnspan=2, sticky="w")
-        self.noPortsLabel = tk.Label(self.IOdispwin, text="N=")
-        self.noPortsLabel.grid(row=1, column=0, sticky="e")
-        self.noPortsEntry = tk.Entry(self.IOdispwin, text=self.noPorts, width=1)
-        self.noPortsEntry.bind("<Return>", self.updatePort)  # self.portNupdate)
-        self.noPortsEntry.grid(row=1, column=1, sticky="e")
-        tk.Label(self.IOdispwin, text=" ", width=1).grid(row=0, column=2, rowspan=2)
-        self.charLabels = []
-        # self.portNupdate()
-        self.updatePort()
 
     def updatePort(self, event=None):
-        # Called by CocoIE if OP Port address is written to or changed
-        # Check if num of OP ports or addreses have changed
-        noports = int(self.noPorts.get()[0])
-        self.noPorts.set(str(noports))  # Just use first character
-        if str(noports) in "123456" and noports != self.prevPorts:
-            # print("Redraw Hex disp")# debug
-            # redraw the display
-            for disp in self.charLabels:
-                disp.destroy()
-            self.charLabels = []
-            for disp in self.spacer:
-                disp.destroy()
-            self.spacer = []
-            for n in range(noports):
-                self.charLabels.append(
-                    tk.Label(
-                        self.IOdispwin,
-                        text="",
-                        width=1,
-                        padx=3,
-                        font=self.dispfont,
-                        pady=3,
-                        border=3,
-                        relief="raised",
-                        bg=cf.oportColour,
-                        fg="white",
-                    )
-                )
-                self.charLabels[-1].grid(
-                    row=0, column=(n * 3 + 5), rowspan=2, sticky="nsew"
-                )
-                self.charLabels.append(
-                    tk.Label(
-                        self.IOdispwin,
-                        text="",
-                        width=1,
-                        padx=3,
-                        font=self.dispfont,
-                        pady=3,
-                        border=3,
-                        relief="raised",
-                        bg=cf.oportColour,
-                        fg="white",
-                    )
-                )
-                self.charLabels[-1].grid(
-                    row=0, column=(n * 3 + 4), rowspan=2, sticky="nsew"
-                )
-                # self.spacer.append(tk.Label(self.IOdispwin, text="", width=1))
-                # elf.spacer[-1].grid(row=0, column=(n*3+6),rowspan=2, sticky="nsew")
-        else:  # Bad value. not in range 1 to 6, or alpha char
-            self.noPorts.set(self.prevPorts)
-
-        # Check if OP addresses need updating
-        numports = int(self.noPorts.get())
-        if self.portAdr != self.prevAdr or numports != self.prevPorts:
-            # print("Updating Adrs")#debug
-            self.portOPvals = {}
-            self.adrRangeLabel.config(text="to %02X" % (self.portAdr + numports - 1))
-            for n in range(numports):
-                self.portOPvals[self.portAdr + n] = 0x00
-            self.prevAdr = self.portAdr
-            self.prevPorts = numports
+        # Called when the model changes, i.e. OP Port written to or address changed
+        numports = self.model.noPorts
+        if len(self.charLabels) != numports * 2:
+            self.newDisplays(numports)
+        self.configWidget(
+            self.adrRangeLabel, text="to %02X" % (self.portAdr + numports - 1)
+        )
 
         # Then update the port display
         labIndex = 0
-        for n in range(len(self.portOPvals)):
-            newval = int(self.portOPvals[self.portAdr + n])
-            nibtxt = "0123456789.-+*/="[newval & 0b00001111]
-            self.charLabels[labIndex].config(text=nibtxt)
-            nibtxt = "0123456789.-+*/="[newval >> 4]
+        digits = self.model.digits
+        for newval in self.portOPvals.values():
+            self.configWidget(
+                self.charLabels[labIndex], text=digits[newval & 0b00001111]
+            )
             labIndex += 1
-            self.charLabels[labIndex].config(text=nibtxt)
+            self.configWidget(self.charLabels[labIndex], text=digits[newval >> 4])
             labIndex += 1
         IOport._updatePort(self)  # Call back to update CocoIDE/Emu
 
 
+class OP_DecDisps_2xN(OP_HexDisps_xN):
+    # Digits 0-9 and . - + * / =
+    device = cdm8_dev.DecDisps
+    padx = 3
+    spacers = False
+
+
 if __name__ == "__main__":
     # test
     myapp = tk.Tk()
@@ -0,0 +1,675 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# CdM8 IDE and emulator
+# (c) M L Walters and A Shafarenko June-July 2018
+
+####### CDM8 Emulator profiling tools
+# V1.0 Call graph profiler for jsr/rts, crc, ioi/osix and rti
+# V1.1 Memory access counters (heatmap) per page and bank
+# V1.2 Instruction and branch coverage bitmaps, coverage report from listings
+# V1.3 Self-profiling of the toolchain (cocas, cocol, emulator, IDE)
+# V1.4 Tools attach to the emulator with hooks (CDM8Emu.addHook)
+# V1.5 Import time budget for the headless toolchain (importBudget), run this
+#      module to check it
+
+
+# Python3 and 2
+from __future__ import absolute_import, division, print_function
+
+import atexit
+import os
+import sys
+import time
+from array import array
+
+import cdm8_dis
+
+
+def loadSymbols(filename):
+    # Read the symbol table from a cocol "v1.0 sym" image file.
+    # Returns {address:name}, empty if the image has no symbols
+    return cdm8_dis.readImage(filename)[1]
+
+
+def asmSymbols(ctx, sects=None):
+    # Build {address:name} from the assembler's tables (cocas.Context).
+    # Absolute labels are used as they are. Entry points of relocatable
+    # sections need the section start addresses from the linker
+    # (cocol.sects) to be placed, otherwise they are skipped.
+    symbols = {}
+    for name, adr in ctx.labels.get("$abs", {}).items():
+        if name[0] not in "!>":
+            symbols[adr] = name
+    for name, adr in ctx.ents.get("$abs", {}).items():
+        symbols[adr] = name
+    if sects:
+        for sectname in sects:
+            sc = sects[sectname]
+            if "start" not in sc:
+                continue
+            for name, offset in sc["ents"]:
+                symbols[(sc["start"] + offset) % 256] = name
+    return symbols
+
+
+class HookTool:
+    # Base class for tools that attach to an emulator with hooks.
+    # hookList() gives the (kind, func[, adr, opcodes]) to add
+
+    def attach(self, emu):
+        # Add the hooks to a CDM8Emu, returns self
+        self.detach()
+        self.emu = emu
+        self.hooks = [emu.addHook(*hook) for hook in self.hookList()]
+        return self
+
+    def detach(self):
+        # Remove the hooks, the emulator runs without them again
+        for hook in getattr(self, "hooks", []):
+            self.emu.removeHook(hook)
+        self.hooks = []
+
+
+class CallProfiler(HookTool):
+    """
+    Shadow call stack for the CDM8 emulator. attach() it to a CDM8Emu and
+    the emulator reports every executed instruction, every jsr/crc call,
+    rts return, ioi/osix interrupt and rti to it.
+
+    Each frame on the shadow stack records the stack pointer at which its
+    return address was stored, so returns pop back to the right frame even
+    if the program manipulates the stack (or uses crc as a coroutine switch).
+    Interrupt service routines are pushed as new roots, so their instruction
+    counts are not charged to the code they interrupted.
+
+    Results:
+        self.calls = {routine: number of calls}
+        self.incl = {routine: inclusive instruction count}
+        self.excl = {routine: exclusive instruction count}
+        self.edges = {(caller, callee): number of calls}
+        self.folded = {"root;caller;callee": exclusive instruction count}
+    where routine = (page, address) of the routine entry point
+    """
+
+    ROOT_SP = 256  # Above any real stack address, never popped
+
+    def __init__(self, symbols=None):
+        self.symbols = symbols or {}
+        self.reset()
+
+    def reset(self):
+        self.stack = []  # Frames: [routine, sp, path, startcount, isroot]
+        self.active = {}  # {routine: number of frames currently on the stack}
+        self.total = 0
+        self.calls = {}
+        self.incl = {}
+        self.excl = {}
+        self.edges = {}
+        self.folded = {}
+
+    def hookList(self):
+        return [
+            ("pre", self._preHook),
+            ("post", self._callHook, None, "call"),
+            ("interrupt", self._intHook),
+        ]
+
+    def _preHook(self, emu, pc, ir):
+        self.count(pc, emu.curPage)
+        if ir == 0xD7:
+            self.ret(emu.getSP())
+        elif ir == 0xD9:
+            self.rti(emu.getSP())
+
+    def _callHook(self, emu, pc, ir):
+        self.call(emu.PC, emu.getSP(), emu.curPage, crc=(ir == 0xDA))
+
+    def _intHook(self, emu, vector, sp):
+        self.interrupt(emu.PC, vector, sp)
+
+    def name(self, routine):
+        page, adr = routine
+        label = self.symbols.get(adr, "sub_%02x" % adr)
+        if page:
+            return "p%d:%s" % (page, label)
+        return label
+
+    def _push(self, routine, sp, isroot=False, prefix=""):
+        if isroot or not self.stack:
+            path = prefix + self.name(routine)
+        else:
+            caller = self.stack[-1][0]
+            path = self.stack[-1][2] + ";" + self.name(routine)
+            self.edges[(caller, routine)] = self.edges.get((caller, routine), 0) + 1
+        self.calls[routine] = self.calls.get(routine, 0) + 1
+        self.active[routine] = self.active.get(routine, 0) + 1
+        self.stack.append([routine, sp, path, self.total, isroot])
+
+    def _pop(self):
+        routine, sp, path, start, isroot = self.stack.pop()
+        self.active[routine] -= 1
+        if self.active[routine] == 0:  # Outermost activation (recursion)
+            self.incl[routine] = self.incl.get(routine, 0) + self.total - start
+        return isroot
+
+    def count(self, pc, page=0):
+        # Called by the emulator once per executed instruction
+        if not self.stack:  # First instruction, program entry is the root
+            self._push((page, pc), self.ROOT_SP, isroot=True)
+            self.calls[(page, pc)] -= 1  # Entry is not a call
+        self.total += 1
+        top = self.stack[-1]
+        self.excl[top[0]] = self.excl.get(top[0], 0) + 1
+        self.folded[top[2]] = self.folded.get(top[2], 0) + 1
+
+    def call(self, target, sp, page=0, crc=False):
+        # jsr (or crc) to target, return address stored at stack address sp
+        if crc and self.stack and self.stack[-1][1] == sp and not self.stack[-1][4]:
+            # crc back into a suspended coroutine: swap, not a nested call
+            self._pop()
+        self._push((page, target), sp)
+
+    def ret(self, sp):
+        # rts, return address read from stack address sp
+        while self.stack and self.stack[-1][1] <= sp and not self.stack[-1][4]:
+            self._pop()
+
+    def interrupt(self, target, vector, sp):
+        # ioi/osix into an ISR, frame stored from stack address sp
+        self._push((0, target), sp, isroot=True, prefix="int%d:" % vector)
+
+    def rti(self, sp):
+        # rti, PS/PC frame read from stack address sp
+        while self.stack and self.stack[-1][1] <= sp:
+            if self._pop():
+                break
+
+    def inclusive(self):
+        # Inclusive counts including routines still on the shadow stack
+        incl = dict(self.incl)
+        seen = set()
+        for routine, sp, path, start, isroot in self.stack:
+            if routine not in seen:
+                incl[routine] = incl.get(routine, 0) + self.total - start
+                seen.add(routine)
+        return incl
+
+    def report(self):
+        incl = self.inclusive()
+        total = self.total or 1
+        lines = [
+            "CdM-8 call graph profile: %d instructions" % self.total,
+            "",
+            "%-24s %7s %9s %9s %7s"
+            % ("Routine", "Calls", "Inclusive", "Exclusive", "%Incl"),
+        ]
+        for routine in sorted(incl, key=lambda r: incl[r], reverse=True):
+            lines.append(
+                "%-24s %7d %9d %9d %6.1f%%"
+                % (
+                    "%02x %s" % (routine[1], self.name(routine)),
+                    self.calls.get(routine, 0),
+                    incl[routine],
+                    self.excl.get(routine, 0),
+                    100.0 * incl[routine] / total,
+                )
+            )
+        lines += ["", "%-40s %7s" % ("Caller -> Callee", "Calls")]
+        for (caller, callee), n in sorted(
+            self.edges.items(), key=lambda e: e[1], reverse=True
+        ):
+            lines.append(
+                "%-40s %7d" % (self.name(caller) + " -> " + self.name(callee), n)
+            )
+        return "\n".join(lines) + "\n"
+
+    def collapsed(self):
+        # Collapsed stacks, one "frame;frame;frame count" line per call path,
+        # as read by flamegraph.pl, speedscope, inferno etc.
+        return "".join("%s %d\n" % (path, n) for path, n in sorted(self.folded.items()))
+
+    def save(self, filename):
+        # Write filename.prof (text report) and filename.folded
+        with open(filename + ".prof", "w") as f:
+            f.write(self.report())
+        with open(filename + ".folded", "w") as f:
+            f.write(self.collapsed())
+
+
+class MemCounter(HookTool):
+    """
+    Per address memory access counters for every page and bank of the
+    CDM8 emulator. attach() an instance to a CDM8Emu to start counting,
+    detach() to stop (no counting cost).
+
+    Counters are flat arrays of unsigned ints, indexed by
+    (page * 2 + bank) * 256 + address:
+        self.fetches  instruction and operand fetches (code bank)
+        self.reads    ld, ldc, pop/popall, rts, rti, crc, interrupt vectors
+        self.writes   st, push/pushall, jsr, crc, interrupt frames
+    """
+
+    KINDS = ("fetches", "reads", "writes")
+
+    def __init__(self, pages=8):
+        self.pages = pages
+        self.reset()
+
+    def reset(self):
+        size = self.pages * 2 * 256
+        self.fetches = array("L", [0]) * size
+        self.reads = array("L", [0]) * size
+        self.writes = array("L", [0]) * size
+
+    def hookList(self):
+        return [
+            ("fetch", lambda emu, page, adr: self.fetch(page, adr)),
+            ("read", lambda emu, page, bank, adr: self.read(page, bank, adr)),
+            ("write", lambda emu, page, bank, adr: self.write(page, bank, adr)),
+        ]
+
+    def fetch(self, page, adr):
+        self.fetches[page * 512 + (adr & 0xFF)] += 1
+
+    def read(self, page, bank, adr):
+        self.reads[(page * 2 + bank) * 256 + (adr & 0xFF)] += 1
+
+    def write(self, page, bank, adr):
+        self.writes[(page * 2 + bank) * 256 + (adr & 0xFF)] += 1
+
+    def totals(self, page=0, bank=0):
+        # Total accesses for each of the 256 addresses of one page/bank
+        start = (page * 2 + bank) * 256
+        return [
+            self.fetches[n] + self.reads[n] + self.writes[n]
+            for n in range(start, start + 256)
+        ]
+
+    def csv(self):
+        # Addresses with at least one access, one CSV row each
+        lines = ["page,bank,address,fetches,reads,writes"]
+        for n in range(len(self.reads)):
+            if self.fetches[n] or self.reads[n] or self.writes[n]:
+                lines.append(
+                    "%d,%d,0x%02x,%d,%d,%d"
+                    % (
+                        n // 512,
+                        (n // 256) % 2,
+                        n % 256,
+                        self.fetches[n],
+                        self.reads[n],
+                        self.writes[n],
+                    )
+                )
+        return "\n".join(lines) + "\n"
+
+    def saveCSV(self, filename):
+        with open(filename, "w") as f:
+            f.write(self.csv())
+
+    def asArray(self):
+        # NumPy array, shape (3, pages, 2, 256): [fetches, reads, writes]
+        import numpy  # Optional, only needed for NumPy export
+
+        return numpy.array(
+            [getattr(self, kind) for kind in self.KINDS], dtype=numpy.uint32
+        ).reshape(3, self.pages, 2, 256)
+
+    def saveNumPy(self, filename):
+        import numpy
+
+        numpy.save(filename, self.asArray())
+
+
+def branchTaken(op, cvzn):
+    # Whether branch opcode op (0xE0-0xEF) is taken with flags cvzn, as
+    # in CDM8Emu.step()
+    C, V, Z, N = (cvzn >> 3) & 1, (cvzn >> 2) & 1, (cvzn >> 1) & 1, cvzn & 1
+    taken = (Z, C, N, V, C & ~Z & 1, ~(N ^ V) & 1, ~Z & ~(N ^ V) & 1, 1)
+    return bool(taken[(op >> 1) & 0b111] ^ (op & 1))
+
+
+def parseListing(listing):
+    # Split a cocas.pretty_print listing (file or IDE text) into lines of
+    # [address, [code bytes], source text]. address is None for lines
+    # without code, continuation lines add their bytes to the line before.
+    lines = []
+    for text in listing.splitlines():
+        if text[2:4] == ": " and text[:2].strip():
+            try:
+                adr = int(text[:2], 16)
+                code = [int(x, 16) for x in text[4:15].split()]
+            except ValueError:
+                lines.append([None, [], text])
+                continue
+            if text[15:].strip() == "" and lines and lines[-1][0] != None:
+                lines[-1][1] += code  # More bytes of the line before
+                continue
+            lines.append([adr, code, text])
+        else:
+            lines.append([None, [], text])
+    return lines
+
+
+class Coverage(HookTool):
+    """
+    Instruction and branch coverage bitmaps for the CDM8 emulator. attach()
+    an instance to a CDM8Emu to start recording.
+
+    Each bitmap has one bit per address, 32 bytes per page:
+        self.executed  an instruction was fetched from the address
+        self.taken     the branch at the address was taken
+        self.nottaken  the branch at the address was not taken
+    Coverage from many runs (e.g. a process pool running a test set) is
+    combined with merge() or |, a bitwise OR of the bitmaps. toBytes() and
+    fromBytes() give a compact form to pass between processes or save.
+    """
+
+    KINDS = ("executed", "taken", "nottaken")
+
+    def __init__(self, pages=8):
+        self.pages = pages
+        self.reset()
+
+    def reset(self):
+        self.executed = bytearray(self.pages * 32)
+        self.taken = bytearray(self.pages * 32)
+        self.nottaken = bytearray(self.pages * 32)
+
+    def hookList(self):
+        return [("pre", self._preHook), ("post", self._branchHook, None, "branch")]
+
+    def _preHook(self, emu, pc, ir):
+        page = emu.mm[emu.curPage]
+        if emu.memory[page][0][pc] == ir:  # Not a hardware interrupt
+            self.execute(page, pc)
+
+    def _branchHook(self, emu, pc, ir):
+        # Taken from the condition, not the new PC: a branch to pc + 2
+        # goes to the same place either way. Branches leave the flags as
+        # they were
+        self.branch(emu.mm[emu.curPage], pc, branchTaken(ir, emu.CVZN))
+
+    def execute(self, page, adr):
+        self.executed[page * 32 + (adr >> 3)] |= 1 << (adr & 7)
+
+    def branch(self, page, adr, taken):
+        if taken:
+            self.taken[page * 32 + (adr >> 3)] |= 1 << (adr & 7)
+        else:
+            self.nottaken[page * 32 + (adr >> 3)] |= 1 << (adr & 7)
+
+    def isSet(self, kind, adr, page=0):
+        return (getattr(self, kind)[page * 32 + (adr >> 3)] >> (adr & 7)) & 1
+
+    def merge(self, other):
+        # OR the bitmaps of other (Coverage or bytes from toBytes()) into self
+        if not isinstance(other, Coverage):
+            other = Coverage.fromBytes(other)
+        for kind in self.KINDS:
+            mine, theirs = getattr(self, kind), getattr(other, kind)
+            merged = int.from_bytes(mine, "little") | int.from_bytes(theirs, "little")
+            setattr(
+                self,
+                kind,
+                bytearray(merged.to_bytes(max(len(mine), len(theirs)), "little")),
+            )
+        self.pages = len(self.executed) // 32
+        return self
+
+    def __ior__(self, other):
+        return self.merge(other)
+
+    def __or__(self, other):
+        return Coverage.fromBytes(self.toBytes()).merge(other)
+
+    def toBytes(self):
+        return bytes(self.executed + self.taken + self.nottaken)
+
+    @classmethod
+    def fromBytes(cls, data):
+        cov = cls(pages=len(data) // 96)
+        size = cov.pages * 32
+        cov.executed = bytearray(data[:size])
+        cov.taken = bytearray(data[size : 2 * size])
+        cov.nottaken = bytearray(data[2 * size :])
+        return cov
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.toBytes())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            return cls.fromBytes(f.read())
+
+    def annotate(self, listing, page=0, base=0):
+        # Coverage mark for each line of a cocas listing:
+        #   "     " no code (or dc/ds data)
+        #   "#####" no instruction of the line was executed
+        #   "    +" executed, every conditional branch went both ways
+        #   "   +T" or "   +N" a branch was only Taken or only Not taken
+        # base is the start address of the section (0 for asects)
+        marks = []
+        for adr, code, text in parseListing(listing):
+            words = text[21:].split()  # Source, after the line number
+            if words and words[0][-1:] in ":>":
+                words = words[1:]
+            if adr == None or not code or (words and words[0] in ("dc", "ds")):
+                marks.append(("     ", text))
+                continue
+            adr += base
+            executed = False
+            outcome = ""
+            n = 0
+            while n < len(code):  # Decode the line to find its branches
+                a = (adr + n) % 256
+                if self.isSet("executed", a, page):
+                    executed = True
+                    if code[n] >> 4 == 0xE and code[n] not in (0xEE, 0xEF):
+                        if not self.isSet("taken", a, page):
+                            outcome = "N"
+                        elif not self.isSet("nottaken", a, page):
+                            outcome = "T"
+                n += cdm8_dis.DECODE[code[n]][2]  # Instruction length
+            if not executed:
+                marks.append(("#####", text))
+            else:
+                marks.append(("%5s" % ("+" + outcome), text))
+        return marks
+
+    def report(self, listing, page=0, base=0):
+        # Annotated listing with a summary of uncovered lines and branches
+        marks = self.annotate(listing, page, base)
+        code = [m for m, text in marks if m != "     "]
+        uncovered = code.count("#####")
+        partial = len([m for m in code if m[-1] in "TN"])
+        lines = [
+            "CdM-8 coverage: %d of %d code lines executed, %d lines with"
+            " branches not covered both ways"
+            % (len(code) - uncovered, len(code), partial),
+            "",
+        ]
+        lines += ["%s %s" % (mark, text) for mark, text in marks]
+        return "\n".join(lines) + "\n"
+
+
+class SelfProfiler:
+    """
+    Profiles the toolchain itself. wrap() replaces a function or method
+    with one that times every call (calls, total and longest time) and,
+    with cprofile=True, captures a cProfile profile of it. Nested calls
+    of wrapped functions (e.g. step inside run) are timed, but only the
+    outermost call is captured by cProfile.
+    """
+
+    def __init__(self, cprofile=False):
+        self.cprofile = cprofile
+        self.times = {}  # {label: [calls, total seconds, longest call]}
+        self.profiles = {}  # {label: cProfile.Profile}
+        self.depth = 0
+
+    def wrap(self, owner, name, label=None):
+        # Replace owner.name (module function or class method) with a timed one
+        func = getattr(owner, name)
+        label = label or "%s.%s" % (owner.__name__, name)
+        self.times[label] = [0, 0.0, 0.0]
+        if self.cprofile:
+            import cProfile
+
+            self.profiles[label] = cProfile.Profile()
+        profiler = self
+
+        def timed(*args, **kwargs):
+            profile = None
+            if profiler.depth == 0 and label in profiler.profiles:
+                profile = profiler.profiles[label]
+                profile.enable()
+            profiler.depth += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                profiler.depth -= 1
+                if profile:
+                    profile.disable()
+                stats = profiler.times[label]
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+
+        timed.__name__ = name
+        timed.__doc__ = func.__doc__
+        setattr(owner, name, timed)
+
+    def summary(self):
+        lines = [
+            "CdM-8 toolchain timing",
+            "",
+            "%-28s %9s %11s %11s %11s"
+            % ("Function", "Calls", "Total ms", "Mean ms", "Max ms"),
+        ]
+        for label in sorted(self.times, key=lambda l: self.times[l][1], reverse=True):
+            calls, total, longest = self.times[label]
+            lines.append(
+                "%-28s %9d %11.2f %11.4f %11.2f"
+                % (
+                    label,
+                    calls,
+                    total * 1000,
+                    total * 1000 / (calls or 1),
+                    longest * 1000,
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+    def save(self, prefix="cocoprof"):
+        # Write prefix.timing and prefix.<function>.pstats (cprofile only)
+        with open(prefix + ".timing", "w") as f:
+            f.write(self.summary())
+        for label, profile in self.profiles.items():
+            if self.times[label][0]:
+                profile.dump_stats("%s.%s.pstats" % (prefix, label))
+
+
+def selfProfile(mode=None, emuClass=None, ideClass=None, cocas=None, prefix=None):
+    # Start self-profiling if mode (a CLI option value) or the COCO_SELFPROF
+    # environment variable is "time" (timers only) or "cprofile" (timers
+    # and cProfile). Wraps cocas.asm, cocas.pretty_print and cocol.link if
+    # loaded, the emulator step() and the IDE updateDisp(). Results are
+    # written at exit to prefix (COCO_SELFPROF_OUT, default "cocoprof").
+    mode = mode or os.environ.get("COCO_SELFPROF", "")
+    if not mode:
+        return None
+    profiler = SelfProfiler(cprofile=(mode == "cprofile"))
+    cocas = cocas or sys.modules.get("cocas")  # cocas is __main__ from its CLI
+    if cocas:
+        profiler.wrap(cocas, "asm", "cocas.asm")
+        profiler.wrap(cocas, "pretty_print", "cocas.pretty_print")
+    if "cocol" in sys.modules:
+        profiler.wrap(sys.modules["cocol"], "link")
+    if emuClass == None and "cdm8_emu" in sys.modules:
+        emuClass = sys.modules["cdm8_emu"].CDM8Emu
+    if emuClass:
+        profiler.wrap(emuClass, "step", "CDM8Emu.step")
+    if ideClass:
+        profiler.wrap(ideClass, "updateDisp", "CocoIDE.updateDisp")
+    prefix = prefix or os.environ.get("COCO_SELFPROF_OUT", "cocoprof")
+
+    def finish():
+        profiler.save(prefix)
+        sys.stderr.write(profiler.summary())
+
+    atexit.register(finish)
+    return profiler
+
+
+# Headless toolchain modules: importing them must be quick (e.g. for pool
+# workers) and must not load Tk or parse the command line
+CORE = ("cdm8_dis", "cdm8_emu", "cdm8_dev", "cocas", "cocol")
+IMPORTBUDGET = 30  # ms, all of CORE from a fresh interpreter
+NOTCORE = ("tkinter", "Tkinter", "argparse")
+
+
+def importTimes(modules=CORE, repeat=3):
+    # Import modules in fresh interpreters (python -X importtime), best of
+    # repeat runs after a warm-up run (so .pyc files are used).
+    # Returns {module: cumulative ms} for every module loaded, modules
+    # imported by an earlier one in the list count in the earlier one
+    import subprocess
+
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    command = [sys.executable, "-X", "importtime", "-c", "import " + ",".join(modules)]
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = {}
+    for run in range(repeat + 1):
+        result = subprocess.run(
+            command, cwd=here, env=env, stderr=subprocess.PIPE, text=True
+        )
+        if result.returncode:
+            raise ImportError(result.stderr.strip().splitlines()[-1])
+        times = {}
+        for line in result.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                fields = line[12:].split("|")
+                if fields[1].strip().isdigit():
+                    times[fields[2].strip()] = int(fields[1]) / 1000
+        if run:
+            for name, ms in times.items():
+                best[name] = min(ms, best.get(name, ms))
+    return best
+
+
+def importBudget(modules=CORE, budget=IMPORTBUDGET, notcore=NOTCORE):
+    # Check importing modules: returns (total ms, problems), problems is a
+    # list of messages, empty if within budget and no GUI/CLI modules loaded
+    times = importTimes(modules)
+    total = sum(times.get(name, 0) for name in modules)
+    problems = []
+    if total > budget:
+        problems.append(
+            "Import time %.1f ms over the %d ms budget: %s"
+            % (
+                total,
+                budget,
+                ", ".join(
+                    "%s %.1f ms" % (name, times.get(name, 0)) for name in modules
+                ),
+            )
+        )
+    for name in notcore:
+        if name in times:
+            problems.append("Importing the toolchain loads " + name)
+    return total, problems
+
+
+if __name__ == "__main__":
+    total, problems = importBudget()
+    print("Toolchain import time %.1f ms (budget %d ms)" % (total, IMPORTBUDGET))
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)
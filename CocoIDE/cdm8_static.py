@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# CdM8 IDE and emulator
+# (c) M L Walters and A Shafarenko June-July 2018
+
+####### CDM8 static analysis of memory images
+# V1.0 Best and worst case execution times (cycles) of subroutines and ISRs,
+#      loop bounds from "#!loop N" source comments
+# V1.1 Maximum stack depth of routines and ISRs against the free memory
+
+
+# Python3 and 2
+from __future__ import absolute_import, division, print_function
+
+import cdm8_dis
+from cdm8_prof import parseListing
+
+EXIT = -1  # Node every rts/rti/halt block leads to
+INTFRAME = 2  # Bytes pushed by an interrupt or ioi: PC and PS
+# Fixed stack effect of instructions (bytes pushed, negative for pops)
+PUSHES = {"push": 1, "pop": -1, "pushall": 4, "popall": -4}
+
+
+def loopBounds(listing, base=0):
+    # Loop bounds from a cocas listing: a "#!loop N" (at most N times) or
+    # "#!loop M-N" (M to N times) comment on the line of a loop's branch or
+    # first instruction, or on the label line just before it.
+    # Returns {address: (M, N)} for every code byte of the annotated lines
+    bounds = {}
+    pending = None
+    for adr, code, text in parseListing(listing):
+        n = text.find("#!loop")
+        if n >= 0:
+            words = text[n + 6 :].split()
+            try:
+                low, high = (words[0].split("-") + [None])[:2]
+                pending = (int(low), int(high)) if high else (1, int(low))
+            except (IndexError, ValueError):
+                pending = None  # Ignore a bad annotation
+        if pending and adr != None and code:
+            for n in range(len(code)):
+                bounds[(base + adr + n) % 256] = pending
+            pending = None
+    return bounds
+
+
+def addCost(a, b):
+    # Cycle counts, None = unbounded
+    if a == None or b == None:
+        return None
+    return a + b
+
+
+def dagPaths(start, nodes, succs, cost):
+    # Shortest and longest cost of the paths from start to each node of an
+    # acyclic graph (start and node costs included). cost[node] = (min, max)
+    order = []
+    seen = set()
+    stack = [(start, iter(succs[start]))]
+    seen.add(start)
+    while stack:  # Depth first, for a topological order
+        node, children = stack[-1]
+        for child in children:
+            if child in nodes and child not in seen:
+                seen.add(child)
+                stack.append((child, iter(succs[child])))
+                break
+        else:
+            stack.pop()
+            order.append(node)
+    shortest = {start: cost[start][0]}
+    longest = {start: cost[start][1]}
+    for node in reversed(order):
+        for child in succs[node]:
+            if child in seen:
+                low = shortest[node] + cost[child][0]
+                high = addCost(longest[node], cost[child][1])
+                if child not in shortest or low < shortest[child]:
+                    shortest[child] = low
+                if child not in longest:
+                    longest[child] = high
+                elif longest[child] != None:
+                    longest[child] = None if high == None else max(high, longest[child])
+    return shortest, longest
+
+
+class Timing:
+    """
+    Static best and worst case execution times, in clock cycles
+    (cdm8_dis.CYCLES), of every routine of a cdm8_dis.Disassembly: the
+    program from address 0, jsr subroutines and the interrupt service
+    routines of the vectors. Called subroutines are included. ISR times
+    include the interrupt entry (cdm8_dis.INTCYCLES).
+
+    Loops need bounds (see loopBounds()): each execution of a loop is
+    counted as at most N passes through its worst iteration. Loops without
+    bounds, loops that never exit and recursion make the WCET unbounded.
+
+    Results:
+        self.times = {entry: (bcet, wcet)}, None = unknown/unbounded
+        self.notes = {entry: [reasons for unbounded times]}
+    """
+
+    def __init__(self, dis, bounds=None, cycles=None):
+        self.dis = dis
+        self.bounds = bounds or {}
+        self.cycles = cycles or cdm8_dis.CYCLES
+        self.times = {}
+        self.notes = {}
+        for entry in dis.routines:
+            self.routine(entry)
+
+    def name(self, adr):
+        return self.dis.labels.get(adr, "%02x" % adr)
+
+    def blockCost(self, start, active):
+        block = self.dis.blocks[start]
+        cycles = sum(self.cycles[self.dis.instrs[adr].op] for adr in block.instrs)
+        low, high = cycles, cycles
+        if block.call != None:
+            called = self.routine(block.call, active)
+            low += called[0] or 0
+            high = addCost(high, called[1])
+        return low, high
+
+    def routine(self, entry, active=()):
+        # (bcet, wcet) of the routine at entry
+        if entry in self.times:
+            return self.times[entry]
+        if entry not in self.dis.routines:
+            return 0, None
+        notes = self.notes.setdefault(entry, [])
+        if entry in active:
+            notes.append("recursive")
+            return 0, None
+        active = active + (entry,)
+        blocks = self.dis.blocks
+        nodes = set(self.dis.routines[entry])
+        cost = dict((start, self.blockCost(start, active)) for start in nodes)
+        cost[EXIT] = (0, 0)
+        succs = {EXIT: []}
+        for start in nodes:
+            succs[start] = [s for s in blocks[start].succs if s in nodes]
+            last = self.dis.instrs[blocks[start].end]
+            if last.flow == cdm8_dis.HALT or (
+                last.flow == cdm8_dis.RET and last.adr not in self.dis.rtiJumps
+            ):
+                succs[start].append(EXIT)
+        nodes.add(EXIT)
+        for header, body, sources in self.loops(entry, succs):
+            self.collapse(entry, header, body, sources, nodes, succs, cost)
+        shortest, longest = dagPaths(entry, nodes, succs, cost)
+        if EXIT in longest:
+            times = (shortest[EXIT], longest[EXIT])
+        else:
+            if not notes:
+                notes.append("never returns")
+            times = (None, None)
+        if entry in self.dis.vectors.values():
+            times = tuple(addCost(t, cdm8_dis.INTCYCLES) for t in times)
+        self.times[entry] = times
+        return times
+
+    def loops(self, entry, succs):
+        # Natural loops [(header, body, back edge sources)], inner first
+        back = []
+        onstack = set([entry])
+        seen = set([entry])
+        stack = [(entry, iter(succs[entry]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child in onstack:
+                    back.append((node, child))
+                elif child not in seen:
+                    seen.add(child)
+                    onstack.add(child)
+                    stack.append((child, iter(succs[child])))
+                    break
+            else:
+                stack.pop()
+                onstack.discard(node)
+        preds = {}
+        for node in succs:
+            for child in succs[node]:
+                preds.setdefault(child, []).append(node)
+        loops = {}
+        for source, header in back:
+            body, sources = loops.setdefault(header, (set([header]), []))
+            sources.append(source)
+            todo = [source]
+            while todo:
+                node = todo.pop()
+                if node not in body:
+                    body.add(node)
+                    todo += preds.get(node, [])
+        return sorted(
+            [(h, b, s) for h, (b, s) in loops.items()], key=lambda l: len(l[1])
+        )
+
+    def bound(self, header, sources):
+        # (min, max) passes of the loop, from the branch or first instruction
+        for start in sources + [header]:
+            block = self.dis.blocks.get(start)
+            if block:
+                for adr in [block.end] + block.instrs:
+                    if adr in self.bounds:
+                        return self.bounds[adr]
+        return None
+
+    def collapse(self, entry, header, body, sources, nodes, succs, cost):
+        # Replace a loop by its header node, costed for all its passes.
+        # Inner loops are already collapsed into their header nodes
+        body = body & nodes
+        notes = self.notes[entry]
+        for node in nodes - body:
+            if any(child in body and child != header for child in succs[node]):
+                notes.append("loop at %02x has more than one entry" % header)
+        inner = dict((node, [c for c in succs[node] if c != header]) for node in body)
+        shortest, longest = dagPaths(header, body, inner, cost)
+        sources = [s for s in sources if s in body]
+        exits = [n for n in body if any(c not in body for c in succs[n])]
+        bound = self.bound(header, sources)
+        if not exits:
+            notes.append("loop at %02x never exits" % header)
+            low, high = None, None
+        else:
+            iterLow = min(shortest.get(s, 0) for s in sources)
+            exitLow = min(shortest.get(x, 0) for x in exits)
+            low = (bound[0] - 1) * iterLow + exitLow if bound else exitLow
+            high = None
+            if bound:
+                iterHigh = [longest.get(s) for s in sources]
+                exitHigh = [longest.get(x) for x in exits]
+                if None not in iterHigh + exitHigh:
+                    high = (bound[1] - 1) * max(iterHigh) + max(exitHigh)
+            else:
+                notes.append("no #!loop bound for loop at %02x" % header)
+        outside = []
+        for node in body:
+            outside += [c for c in succs[node] if c not in body and c not in outside]
+        for node in body:
+            if node != header:
+                nodes.discard(node)
+                del succs[node]
+        succs[header] = outside
+        cost[header] = (low or 0, high)
+
+    def report(self):
+        lines = [
+            "CdM-8 static timing (cycles)",
+            "",
+            "%-24s %8s %8s  %s" % ("Routine", "BCET", "WCET", "Notes"),
+        ]
+        isrs = dict((isr, v) for v, isr in self.dis.vectors.items())
+        for entry in sorted(self.times):
+            low, high = self.times[entry]
+            name = "%02x %s" % (entry, self.name(entry))
+            if entry in isrs:
+                name += " (ISR %d)" % isrs[entry]
+            lines.append(
+                "%-24s %8s %8s  %s"
+                % (
+                    name,
+                    "-" if low == None else low,
+                    "unbounded" if high == None else high,
+                    ", ".join(self.notes.get(entry, [])),
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+    def annotate(self, listing, base=0):
+        # Listing with the cycles of each line, and the BCET/WCET of each
+        # routine before its first line. base is the section start address
+        lines = []
+        for adr, code, text in parseListing(listing):
+            if adr != None and (base + adr) % 256 in self.times:
+                low, high = self.times[(base + adr) % 256]
+                lines.append(
+                    "      ## %s: BCET %s, WCET %s cycles"
+                    % (self.name((base + adr) % 256), low, high)
+                )
+            if adr != None and code and (base + adr) % 256 in self.dis.instrs:
+                cycles, n = 0, 0
+                while n < len(code):
+                    cycles += self.cycles[code[n]]
+                    n += cdm8_dis.DECODE[code[n]][2]
+                lines.append("%5d %s" % (cycles, text))
+            else:
+                lines.append("      " + text)
+        return "\n".join(lines) + "\n"
+
+
+class StackDepth:
+    """
+    Static maximum stack depth, in bytes, of every routine of a
+    cdm8_dis.Disassembly, from push/pop, pushall/popall, addsp and the return
+    addresses and depths of called subroutines (ldsa only reads SP). Each
+    ISR adds the interrupt entry frame (INTFRAME). Interrupts are not nested,
+    so the worst case for the program is its own depth plus the deepest ISR.
+
+    Results:
+        self.depths = {entry: max depth}, None = unbounded
+        self.notes = {entry: [reasons and warnings]}
+        self.top = stack top set by setsp in the program (0 = 256)
+    """
+
+    def __init__(self, dis):
+        self.dis = dis
+        self.depths = {}
+        self.notes = {}
+        self.top = 0
+        for entry in dis.routines:
+            self.routine(entry)
+        self.isrDepth = self.isrs(()) if dis.vectors else 0
+        self.depth = addCost(self.depths.get(0, 0), self.isrDepth)
+
+    def name(self, adr):
+        return self.dis.labels.get(adr, "%02x" % adr)
+
+    def routine(self, entry, active=()):
+        # Max depth of the routine at entry, called subroutines included
+        if entry in self.depths:
+            return self.depths[entry]
+        if entry not in self.dis.routines:
+            return None
+        notes = self.notes.setdefault(entry, [])
+        if entry in active:
+            notes.append("recursive")
+            return None
+        active = active + (entry,)
+        dis = self.dis
+        start = {entry: 0}  # Depth at the start of each block
+        peak = 0
+        todo = [entry]
+        while todo and peak != None:
+            block = dis.blocks[todo.pop()]
+            depth = start[block.start]
+            for adr in block.instrs:
+                instr = dis.instrs[adr]
+                op = instr.mnemonic
+                reach = depth  # Deepest point of the instruction
+                if op == "addsp":
+                    depth -= (
+                        instr.operand - 256 if instr.operand > 127 else instr.operand
+                    )
+                elif op == "setsp":
+                    if entry == 0 and not self.top:
+                        self.top = instr.operand
+                    else:
+                        notes.append("setsp at %02x" % adr)
+                    depth = 0
+                elif op == "jsr":  # Return address, then the subroutine
+                    reach = addCost(depth + 1, self.routine(instr.target, active))
+                elif op in ("ioi", "osix"):
+                    reach = addCost(depth, self.isrs(active))
+                elif op == "crc":
+                    notes.append("computed call at %02x not followed" % adr)
+                elif op == "rti" and adr in dis.rtiJumps:
+                    depth -= INTFRAME  # ei/di style jump
+                else:
+                    depth += PUSHES.get(op, 0)
+                if reach == None or depth > 256:
+                    if reach == None:
+                        notes.append("unbounded call at %02x" % adr)
+                    else:
+                        notes.append("stack grows without limit")
+                    peak = None
+                    break
+                peak = max(peak, reach, depth)
+            else:
+                if instr.flow == cdm8_dis.RET and adr not in dis.rtiJumps:
+                    if depth != 0:
+                        notes.append("returns at %02x with depth %d" % (adr, depth))
+                for succ in block.succs:
+                    if succ in dis.blocks and (
+                        succ not in start or start[succ] < depth
+                    ):
+                        if succ in start and "unbalanced stack" not in notes:
+                            notes.append("unbalanced stack")
+                        start[succ] = depth
+                        todo.append(succ)
+        if peak != None and entry in dis.vectors.values():
+            peak += INTFRAME
+        self.depths[entry] = peak
+        return peak
+
+    def isrs(self, active):
+        # Deepest ISR (with its frame) for ioi, None if unbounded
+        isrs = [v for v in self.dis.vectors.values() if v in self.dis.routines]
+        depths = [self.routine(v, active) for v in isrs]
+        if None in depths:
+            return None
+        return max(depths + [INTFRAME])
+
+    def room(self, segments):
+        # Free bytes below the stack top, above the highest segment
+        # (start, size) under it, e.g. cocol.allocated()
+        top = self.top or 256
+        limit = 0
+        for start, size in segments:
+            if start < top:
+                limit = max(limit, start + size)
+        return max(0, top - limit)
+
+    def report(self, segments=None):
+        lines = [
+            "CdM-8 static stack depth (bytes)",
+            "",
+            "%-24s %8s  %s" % ("Routine", "Depth", "Notes"),
+        ]
+        isrs = dict((isr, v) for v, isr in self.dis.vectors.items())
+        for entry in sorted(self.depths):
+            name = "%02x %s" % (entry, self.name(entry))
+            if entry in isrs:
+                name += " (ISR %d)" % isrs[entry]
+            depth = self.depths[entry]
+            lines.append(
+                "%-24s %8s  %s"
+                % (
+                    name,
+                    "unbounded" if depth == None else depth,
+                    ", ".join(self.notes.get(entry, [])),
+                )
+            )
+        lines.append("")
+        depth = "unbounded" if self.depth == None else self.depth
+        lines.append("Worst case program + ISR: %s" % depth)
+        if segments != None:
+            room = self.room(segments)
+            lines.append("Free below stack top 0x%02x: %d" % (self.top, room))
+            if self.depth == None or self.depth > room:
+                lines.append("STACK OVERFLOW into code/data possible")
+        return "\n".join(lines) + "\n"
+
+
+def imageSegments(img):
+    # Memory used by an image without linker information: non-zero bytes
+    return [(adr, 1) for adr in range(len(img)) if img[adr]]
+
+
+def analyseSource(text):
+    # Assemble and link source text as CocoIDE does. Returns
+    # (Disassembly, listing, loop bounds) or raises ValueError
+    import io
+
+    import cocas
+    import cocol
+    import cdm8_prof
+
+    ctx = cocas.Context()
+    obj, listing, err = cocas.compile_asm(io.StringIO(text), ctx=ctx)
+    if err:
+        raise ValueError(err)
+    err, linklist, img = cocol.link(ideobjtext=obj, fileout=False)
+    if err:
+        raise ValueError(err)
+    dis = cdm8_dis.disassemble(img, cdm8_prof.asmSymbols(ctx, cocol.sects))
+    return dis, listing, loopBounds(listing)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="CdM-8 Static Analyser v1.0")
+    parser.add_argument("filename", help="source_file.asm or image_file.img")
+    args = parser.parse_args()
+    if args.filename[-4:] == ".img":
+        dis, listing, bounds = cdm8_dis.disassembleFile(args.filename), None, {}
+    else:
+        with open(args.filename, "r") as f:
+            dis, listing, bounds = analyseSource(f.read())
+    timing = Timing(dis, bounds)
+    if listing:
+        print(timing.annotate(listing))
+        segments = sys.modules["cocol"].allocated()
+    else:
+        segments = imageSegments(dis.img)
+    print(timing.report())
+    print(StackDepth(dis).report(segments))
@@ -9,18 +9,17 @@
 # V2.5: A Shaferenko, NewCocas.
 # V2.6: M Walters, Jan 2020, rol replaced by swan instruction (mark 5 core)
 # V2.7: M Walters, Added GUI
+# V2.8: --selfprof option to profile the assembler itself
+# V2.9: GUI moved to cocas_gui.py, Tk and argparse only imported when used
+# V2.10: standard.mlb is also found beside cocas.py (libraryPath())
+# V2.11: compile_asm(macros=) takes macro libraries parsed once (loadMacros())
 
 
-import argparse
 import io
 import os
 import sys
 import time
-import tkinter as tk
 from enum import Enum, auto
-from tkinter import filedialog
-from tkinter import scrolledtext as sctx
-from tkinter import ttk
 from typing import IO, Dict, List, Optional, Tuple, Union
 
 ASM_VER = "2.7"
@@ -173,128 +172,11 @@ iset: Dict[str, Tuple[int, int]] = {
 }
 
 
-class CocAs(tk.Tk):
-    def __init__(self, master=None) -> None:
-        self.master = master
-        self.mainWin = tk.Toplevel(master=master)
-        self.mainWin.lift()
-        self.mainWin.resizable(width=False, height=False)
-        self.mainWin.title("CDM8 Assembler: CocAs GUI")
-        if __name__ == "__main__":
-            self.mainWin.protocol(
-                "WM_DELETE_WINDOW", self.closeCocas
-            )  # Only if main module
-        self.mainWin.focus()
-        ## Create buttonbar, link and status panels
-        buttonBar = ttk.Frame(
-            self.mainWin, name="buttonbar", height=35, width=400, border=2
-        )
-        buttonBar.pack(side=tk.TOP, fill=tk.X, expand=False)
-
-        linkPanel = ttk.Frame(self.mainWin, name="link", border=2, relief="sunken")
-        linkPanel.pack(side=tk.TOP, fill=tk.X, expand=1)
-        self.linkText = ttk.Label(linkPanel, text="No file selected")
-        self.linkText.pack(expand=1)
-        self.linkText.bind("<Key>", lambda e: "break")
-
-        seperator = ttk.Frame(self.mainWin, name="sep1", height=35, border=2)
-        seperator.pack(side=tk.TOP, fill=tk.BOTH, expand=False)
-
-        statusPanel = ttk.Frame(self.mainWin, name="status", border=2, relief="sunken")
-        statusPanel.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-        self.statusText = sctx.ScrolledText(statusPanel, height=25, wrap=tk.NONE)
-        self.statusText.pack(fill=tk.BOTH, expand=1)
-        self.statusText.bind("<Key>", lambda e: "break")
-
-        # buttons
-        addButton = ttk.Button(buttonBar, text="Select .asm File", command=self.addFile)
-        addButton.pack(side=tk.LEFT)
-        linkButton = ttk.Button(
-            buttonBar,
-            text="Assemble to .obj File",
-            command=self.asmFile,
-        )
-        linkButton.pack(side=tk.LEFT)
-        quitButton = ttk.Button(buttonBar, text="Quit", command=self.closeCocas)
-        quitButton.pack(side=tk.LEFT)
-
-        self.asmfile = ""
+def CocAs(master=None, exitroot=False):
+    # The assembler GUI (cocas_gui.CocAs), Tk is only imported when it is used
+    import cocas_gui
 
-    def addFile(self, event=None) -> None:
-        # print("add file")
-        filepath = None
-
-        try:
-            filepath = filedialog.askopenfilename(
-                filetypes=(("CDM8 Assembly File", "*.asm"), ("All files", "*.*"))
-            )
-        except:
-            pass
-        self.mainWin.lift()
-        if filepath:
-            self.asmfile = filepath
-            self.linkText.config(text=filepath + "\n")
-            self.statusText.delete("1.0", tk.END)
-
-    def asmFile(self, event=None) -> None:
-        error_msg = ""
-
-        ctx = Context()
-        ctx.lst = True
-
-        self.statusText.delete("1.0", tk.END)
-        if not self.asmfile:
-            error_msg = "No file to Assemble!\n"
-        else:
-            if self.asmfile[-4:] == ".asm":
-                filename = self.asmfile[:-4]
-                try:
-                    fileBuff = open("{}.asm".format(filename), "r")
-                except IOError:
-                    error_msg = "{}.asm: file not found".format(filename)
-        if not error_msg:
-            try:
-                ctx.filename = filename
-                obj_code, codelist, error_msg = compile_asm(
-                    fileBuff, ctx=ctx
-                )  # , self.cdm8ver)
-            except Exception as e:
-                error_msg = str(e)
-        if error_msg:
-            self.statusText.insert(tk.END, error_msg)
-        else:
-            self.statusText.insert(
-                tk.END,
-                "\n\nASSEMBLED OK! Written to:\n {}.obj\n".format(self.asmfile[:-4]),
-            )
-            self.statusText.insert(tk.END, "\nASSEMBLER REPORT LISTING:\n" + codelist)
-            self.statusText.insert(tk.END, "\nOBJECT CODE:\n")
-            self.statusText.insert(tk.END, obj_code)
-            self.statusText.see(tk.END)
-            # print("**", obj_code) # debug
-        # Save obj file
-        # print("Saving obj file")
-        try:
-            with io.open("{}.obj".format(filename), "w", encoding="utf8") as f:
-                f.write(obj_code)
-            print()
-        except TypeError:
-            raise
-            error_msg = "TypeError"
-            # return "break"
-        except Exception as e:
-            error_msg = str(e)
-            # return "break"
-        if error_msg:
-            self.statusText.insert(tk.END, error_msg)
-        else:
-            self.statusText.insert(tk.END, "\nSaved OBJ:\n {}.obj OK".format(filename))
-        self.statusText.see(tk.END)
-
-    def closeCocas(self) -> None:
-        self.mainWin.destroy()
-        if __name__ == "__main__":
-            self.master.destroy()  # type: ignore
+    return cocas_gui.CocAs(master, exitroot)
 
 
 class AssemblerError:
@@ -2083,8 +1965,30 @@ def ismstack(ctx: Context, l: int, s: str) -> Union[AssemblerError, bool]:
 ################################ E N D OF MACRO FACILITIES
 
 
-def compile_asm(codetext=None, cdm8ver=4, ctx=None):
-    """Entry point when imported as a library"""
+def libraryPath(name="standard.mlb"):
+    # Macro library beside the running script, beside this module, or else
+    # in the current directory
+    for folder in (sys.path[0], os.path.dirname(os.path.abspath(__file__))):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            return path
+    return name
+
+
+def loadMacros(filename, ctx=None):
+    # Parse the macro library filename into ctx (a new Context by default).
+    # Returns ctx.macros, raises IOError or ValueError
+    ctx = ctx or Context()
+    with open(filename, "r") as mlibfile:
+        res = takemdefs(ctx, mlibfile, os.path.basename(filename))
+    if isinstance(res, AssemblerError):
+        raise ValueError(res.message)
+    return ctx.macros
+
+
+def compile_asm(codetext=None, cdm8ver=4, ctx=None, macros=None):
+    """Entry point when imported as a library. macros: parsed macro
+    libraries (see loadMacros()) used instead of reading standard.mlb"""
 
     global err_line
 
@@ -2101,18 +2005,15 @@ def compile_asm(codetext=None, cdm8ver=4, ctx=None):
     ctx.raw_text = ctx.text.copy()
 
     mlb_name = "standard.mlb"
-    mlb_path = os.path.join(sys.path[0], mlb_name)
+    mlb_path = libraryPath(mlb_name)
 
     skipfile = False
-    try:
-        mlibfile = open(mlb_path, "r")
-    except IOError:
+    if macros is not None:
+        ctx.macros.update(macros)
         skipfile = True
-
-    if skipfile:
-        skipfile = False
+    else:
         try:
-            mlibfile = open(mlb_name, "r")
+            mlibfile = open(mlb_path, "r")
         except IOError:
             skipfile = True
             print("WARNING: no {} found".format(mlb_name))
@@ -2138,6 +2039,8 @@ def compile_asm(codetext=None, cdm8ver=4, ctx=None):
 
 
 def main() -> None:
+    import argparse
+
     parser = argparse.ArgumentParser(description="CdM-8 Assembler v1.0")
     parser.add_argument("filename", nargs="?", type=str, help="source_file[.asm]")
     parser.add_argument(
@@ -2166,15 +2069,26 @@ def main() -> None:
         default=False,
         help="Include debug output",
     )
+    parser.add_argument(
+        "--selfprof",
+        dest="selfprof",
+        nargs="?",
+        const="time",
+        default="",
+        choices=["time", "cprofile"],
+        help="profile the assembler itself (or set COCO_SELFPROF)",
+    )
     args = parser.parse_args()
+    if args.selfprof or os.environ.get("COCO_SELFPROF"):
+        import cdm8_prof
+
+        cdm8_prof.selfProfile(args.selfprof, cocas=sys.modules[__name__])
     filename = args.filename
     if not filename:
         # Fire up GUI!
-        args.lst = True
-        root = tk.Tk()
-        root.withdraw()
-        cocasGUI = CocAs(master=root)
-        root.mainloop()
+        import cocas_gui
+
+        cocas_gui.main()
     else:
         ctx = Context()
         ctx.filename = filename
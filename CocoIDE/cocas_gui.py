@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# CdM8 assembler GUI, the assembler itself is cocas.py
+
+# V2.7: M Walters, Added GUI
+# V2.9: Moved from cocas.py, so the assembler can be imported without Tk
+
+
+import io
+import tkinter as tk
+from tkinter import filedialog
+from tkinter import scrolledtext as sctx
+from tkinter import ttk
+
+import cocas
+
+
+class CocAs(tk.Tk):
+    def __init__(self, master=None, exitroot=False) -> None:
+        self.master = master
+        self.exitroot = exitroot
+        self.mainWin = tk.Toplevel(master=master)
+        self.mainWin.lift()
+        self.mainWin.resizable(width=False, height=False)
+        self.mainWin.title("CDM8 Assembler: CocAs GUI")
+        if exitroot:
+            self.mainWin.protocol(
+                "WM_DELETE_WINDOW", self.closeCocas
+            )  # Only if main module
+        self.mainWin.focus()
+        ## Create buttonbar, link and status panels
+        buttonBar = ttk.Frame(
+            self.mainWin, name="buttonbar", height=35, width=400, border=2
+        )
+        buttonBar.pack(side=tk.TOP, fill=tk.X, expand=False)
+
+        linkPanel = ttk.Frame(self.mainWin, name="link", border=2, relief="sunken")
+        linkPanel.pack(side=tk.TOP, fill=tk.X, expand=1)
+        self.linkText = ttk.Label(linkPanel, text="No file selected")
+        self.linkText.pack(expand=1)
+        self.linkText.bind("<Key>", lambda e: "break")
+
+        seperator = ttk.Frame(self.mainWin, name="sep1", height=35, border=2)
+        seperator.pack(side=tk.TOP, fill=tk.BOTH, expand=False)
+
+        statusPanel = ttk.Frame(self.mainWin, name="status", border=2, relief="sunken")
+        statusPanel.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.statusText = sctx.ScrolledText(statusPanel, height=25, wrap=tk.NONE)
+        self.statusText.pack(fill=tk.BOTH, expand=1)
+        self.statusText.bind("<Key>", lambda e: "break")
+
+        # buttons
+        addButton = ttk.Button(buttonBar, text="Select .asm File", command=self.addFile)
+        addButton.pack(side=tk.LEFT)
+        linkButton = ttk.Button(
+            buttonBar,
+            text="Assemble to .obj File",
+            command=self.asmFile,
+        )
+        linkButton.pack(side=tk.LEFT)
+        quitButton = ttk.Button(buttonBar, text="Quit", command=self.closeCocas)
+        quitButton.pack(side=tk.LEFT)
+
+        self.asmfile = ""
+
+    def addFile(self, event=None) -> None:
+        # print("add file")
+        filepath = None
+
+        try:
+            filepath = filedialog.askopenfilename(
+                filetypes=(("CDM8 Assembly File", "*.asm"), ("All files", "*.*"))
+            )
+        except:
+            pass
+        self.mainWin.lift()
+        if filepath:
+            self.asmfile = filepath
+            self.linkText.config(text=filepath + "\n")
+            self.statusText.delete("1.0", tk.END)
+
+    def asmFile(self, event=None) -> None:
+        error_msg = ""
+
+        ctx = cocas.Context()
+        ctx.lst = True
+
+        self.statusText.delete("1.0", tk.END)
+        if not self.asmfile:
+            error_msg = "No file to Assemble!\n"
+        else:
+            if self.asmfile[-4:] == ".asm":
+                filename = self.asmfile[:-4]
+                try:
+                    fileBuff = open("{}.asm".format(filename), "r")
+                except IOError:
+                    error_msg = "{}.asm: file not found".format(filename)
+        if not error_msg:
+            try:
+                ctx.filename = filename
+                obj_code, codelist, error_msg = cocas.compile_asm(
+                    fileBuff, ctx=ctx
+                )  # , self.cdm8ver)
+            except Exception as e:
+                error_msg = str(e)
+        if error_msg:
+            self.statusText.insert(tk.END, error_msg)
+        else:
+            self.statusText.insert(
+                tk.END,
+                "\n\nASSEMBLED OK! Written to:\n {}.obj\n".format(self.asmfile[:-4]),
+            )
+            self.statusText.insert(tk.END, "\nASSEMBLER REPORT LISTING:\n" + codelist)
+            self.statusText.insert(tk.END, "\nOBJECT CODE:\n")
+            self.statusText.insert(tk.END, obj_code)
+            self.statusText.see(tk.END)
+            # print("**", obj_code) # debug
+        # Save obj file
+        # print("Saving obj file")
+        try:
+            with io.open("{}.obj".format(filename), "w", encoding="utf8") as f:
+                f.write(obj_code)
+            print()
+        except TypeError:
+            raise
+            error_msg = "TypeError"
+            # return "break"
+        except Exception as e:
+            error_msg = str(e)
+            # return "break"
+        if error_msg:
+            self.statusText.insert(tk.END, error_msg)
+        else:
+            self.statusText.insert(tk.END, "\nSaved OBJ:\n {}.obj OK".format(filename))
+        self.statusText.see(tk.END)
+
+    def closeCocas(self) -> None:
+        self.mainWin.destroy()
+        if self.exitroot:
+            self.master.destroy()  # type: ignore
+
+
+def main() -> None:
+    root = tk.Tk()
+    root.withdraw()
+    cocasGUI = CocAs(master=root, exitroot=True)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -100,6 +100,15 @@ from __future__ import absolute_import, division, print_function
 # V2.2      Suppress outfile.img when compiling/linking from CocoIDE
 # V2.3      Bug fixes for online use with VPN
 # V2.4      Bug fix for MAC/OS??
+# V2.5      Analyse menu: Memory access heatmap (cdm8_prof.py)
+#           Stack peak depth and stack overflow into code/data warning or stop
+#           Code coverage: uncovered lines and one way branches highlighted
+#           --selfprof option (or COCO_SELFPROF) times the IDE and toolchain
+#           Disassemble Image: memory image to source (cdm8_dis.py)
+#           Timing Analysis: static BCET/WCET of routines and ISRs (cdm8_static.py)
+#           Stack Analysis: static maximum stack depth against free memory
+# V2.6      Compiles use a warm toolchain session (cocorun.Toolchain): macro
+#           libraries parsed once, unchanged source not assembled again
 # To do:    Link files IDE directive (in compileTest())
 #           Re-write compileText for multi page and compiler directives.
 #           Memory Manager - in progress
@@ -135,6 +144,7 @@ import collections as colls
 import atexit
 import codecs
 import copy
+import math
 import pyclbr
 
 
@@ -145,10 +155,14 @@ import cdm8_asm as cf
 # Compiler/linker
 import cocas
 import cocol
+import cocorun
 
 # import cocol
 import cdm8_emu
 import cdm8_io
+import cdm8_prof
+import cdm8_dis
+import cdm8_static
 
 # Get list of IOport classes
 
@@ -329,7 +343,6 @@ class CocoIDE(tk.Frame):
         ## Make classwide the CDM8 emulator
         self.Emu = Emulator
         self.Emu.parent = self  # allows for callbacks to CocoIDE
-        self.bind("<<checkInPorts>>", self.inputPortHandler)
         cdm8_io.IDE = self  # allow cdm8_io to call back into CocoIDE
         # Useful CDM8 (self.Emu) attributes/defaults
         # Emu.CVZN = ob0000 # SP Flags
@@ -358,6 +371,12 @@ class CocoIDE(tk.Frame):
         self.startIndex = "1.0"
         self.prevStr = ""
         self.pageDisp = False  # No memory pages shown as default (simple display)
+        self.heatmap = False  # Colour memory display by access counts
+        self.memCounter = None  # cdm8_prof.MemCounter, for the heatmap
+        self.coverage = None  # cdm8_prof.Coverage, if recording coverage
+        self.codelist = None  # Listing of the last compile, for coverage
+        self.symbols = {}  # {address: label} of the last compile
+        self.toolchain = None  # cocorun.Toolchain, from the first compile
         self.bgColour = None  # to restore bg colour when AMES exits.
         ## Interupt defaults
         self.interrupt = False
@@ -499,6 +518,22 @@ class CocoIDE(tk.Frame):
         # self.emumenu.add_command(label="Paged Memory     ", command=self.toggleMemPageDisp)
         # self.emumenu.add_command(label="Shadow SPs      ✔", command=self.setShadowSP)
         self.menubar.add_cascade(label="CDM8", menu=self.emumenu)
+        # Analyse menu
+        self.anamenu = tk.Menu(self.menubar, tearoff=0)
+        self.anamenu.add_command(label="Memory Heatmap   ", command=self.toggleHeatmap)
+        self.anamenu.add_command(label="Save Heatmap CSV", command=self.saveHeatmap)
+        self.anamenu.add_command(
+            label="Stop on Stack Overflow   ", command=self.toggleStackStop
+        )
+        self.anamenu.add_command(label="Code Coverage   ", command=self.toggleCoverage)
+        self.anamenu.add_command(
+            label="Save Coverage Report", command=self.saveCoverageReport
+        )
+        self.anamenu.add_separator()
+        self.anamenu.add_command(label="Disassemble Image", command=self.openImage)
+        self.anamenu.add_command(label="Timing Analysis", command=self.saveTimingReport)
+        self.anamenu.add_command(label="Stack Analysis", command=self.saveStackReport)
+        self.menubar.add_cascade(label="Analyse", menu=self.anamenu)
         # Help Menu
         self.helpmenu = tk.Menu(self.menubar, tearoff=0)
         self.helpmenu.add_command(label="Manual", command=self.helpwin)
@@ -1139,6 +1174,7 @@ class CocoIDE(tk.Frame):
         # Delete and renumber ports if n is a port number
         if n != None and n >= 0:
             # Event generated by deleting an IO port
+            self.IOPorts[n].detach()
             del self.IOPorts[n]
             # Update and renumber ports
             portno = 0
@@ -1158,9 +1194,11 @@ class CocoIDE(tk.Frame):
             # replace existing port
             self.updatePort(portno=portno)  # delete port, then
             self.IOPorts.insert(portno, getattr(cdm8_io, portkey)(self.IOFrame, portno))
+            self.IOPorts[portno].attach(self.Emu)
         else:  # Append
             portno = len(self.IOPorts)
             self.IOPorts.append(getattr(cdm8_io, portkey)(self.IOFrame, portno))
+            self.IOPorts[-1].attach(self.Emu)
             # renumber ports
             portno = 0
             for port in self.IOPorts:
@@ -1169,55 +1207,21 @@ class CocoIDE(tk.Frame):
         # self.dispAllMemory()
         self.updateDisp()
 
-    def inputPortHandler(self, event=None):
-        # Interrupt handler called by the Emulator whenever an
-        # Input (data memory) Port address is read .
-        # Memory address passed via self.Emu.ipAdr,
-        # If found in any IP port,then sets self.Emu.ipVal to Input port value.
-        # Emulator then substitutes value from ipVal instead memory adr val.
-        # Also used by OP ports to trigger a dislpay update
-        for port in self.IOPorts:
-            for adr in port.portIPvals.keys():
-                # print(adr, self.Emu.ipAdr)
-                if adr == self.Emu.ipAdr:
-                    self.Emu.ipVal = port.portIPvals[adr]
-                    port.getIPval()  # trigger port update
-        self.updateDisp()
-        return
-
-    def updateOPs(self):
-        ## Check for Output port value updates
-        if self.Emu.memChanged[0]:
-            adr = self.Emu.memChanged[0][-1]  # last change only, always page 0
-            for port in self.IOPorts:
-                # print(adr,"**",list(port.getOPadr()))
-                if adr in port.getOPadr():
-                    errormsg = None
-                    # print("*", adr, list(port.getOPadr()), memval)
-                    errormsg = port.setOPval(
-                        adr, self.Emu.memory[0][self.Emu.datamem[0]][adr]
-                    )
-                    if errormsg:
-                        # rint(errormsg)
-                        txtaddr = self.mcode_list.search(
-                            self.Emu.hx(self.Emu.PC - 1) + ":", "1.0", tk.END
-                        )
-                        if txtaddr:
-                            # print("£",txtaddr)
-                            self.mcode_list.tag_add(
-                                "smod",
-                                "%s linestart" % txtaddr,
-                                "%s lineend+1c" % txtaddr,
-                            )  # add tag to k
-                            self.mcode_list.tag_config(
-                                "smod", font=self.boldfont, foreground="red"
-                            )
-                        self.statusMsg.config(text=errormsg)
-                    try:
-                        del self.Emu.memChanged[0][-1]
-                    except IndexError:  # When user hits compile while running!
-                        pass
-                        # print(self.Emu.memChanged[0])
+    def portError(self, errormsg):
+        # Run time error from an output port write, show it on the
+        # instruction that wrote the port
+        txtaddr = self.mcode_list.search(
+            self.Emu.hx(self.Emu.PC - 1) + ":", "1.0", tk.END
+        )
+        if txtaddr:
+            # print("£",txtaddr)
+            self.mcode_list.tag_add(
+                "smod",
+                "%s linestart" % txtaddr,
+                "%s lineend+1c" % txtaddr,
+            )  # add tag to k
+            self.mcode_list.tag_config("smod", font=self.boldfont, foreground="red")
+        self.statusMsg.config(text=errormsg)
 
     def interruptHandler(self, event=None):
         # Interupt handler
@@ -1741,9 +1745,24 @@ class CocoIDE(tk.Frame):
                                 bg=bgcolour, fg=fgcolour
                             )  # , text=ptext)#self.Emu.hx(memval))
                 index += 1
+        if self.heatmap and self.memCounter:
+            self.dispHeatmap(curPage, numbanks)
         self.dispPC()
         return
 
+    def dispHeatmap(self, curPage, numbanks):
+        # Colour memory cells by number of accesses (fetch, read and write),
+        # white = never accessed, through to red = most accessed (log scale)
+        counts = []
+        for n in range(numbanks):
+            counts += self.memCounter.totals(curPage, n)
+        hottest = math.log(1 + max(counts)) or 1
+        for index in range(len(counts)):
+            if counts[index]:
+                level = 220 - int(200 * math.log(1 + counts[index]) / hottest)
+                self.memLabel[index].config(bg="#ff%02x%02x" % (level, level))
+        return
+
     def dispPC(self):
         # print("**", self.Emu.hx(self.Emu.PC))#debug
         ## Update current line, mem addr highlight
@@ -1873,13 +1892,7 @@ class CocoIDE(tk.Frame):
         return
 
     def step(self, dispUD=True):
-        # interrupt = cdm8_io.interrupt
-        vectors = cdm8_io.interruptVectors  # fetch vectors, if any
-        # print("£", vectors)
-        self.Emu.step(vectors)
-        # Update the interrupt vector queue to the IO devices
-        cdm8_io.interruptVectors = self.Emu.intvectors
-        self.updateOPs()
+        self.Emu.step()  # Interrupts from the IO devices are in self.Emu.intc
         if dispUD:
             self.updateDisp()
 
@@ -1930,8 +1943,11 @@ class CocoIDE(tk.Frame):
                         # print("HALT=", self.Emu.HALT)# debug
                         break  # Break point detected
 
+        self.showCoverage()
         if self.Emu.HALT:
-            self.statusMsg.config(text="Processor Halted: Reset to Run Program")
+            self.statusMsg.config(
+                text="Processor Halted: Reset to Run Program" + self.stackReport()
+            )
             self.runStopButton.config(
                 text="Start ", fg="black", activeforeground="black", state="disabled"
             )
@@ -1939,7 +1955,6 @@ class CocoIDE(tk.Frame):
             self.runStopButton.config(
                 text="Start ", fg="black", activeforeground="black", state="normal"
             )
-        self.updateOPs()
         self.updateDisp()
         self.running = False
         self.runStopButton.config(text="Start ", fg="black", activeforeground="black")
@@ -2354,6 +2369,33 @@ class CocoIDE(tk.Frame):
                     pass
         return "break"
 
+    def openImage(self, event=None, filepath=None):
+        # Disassemble a memory image (no source needed) into the editor
+        result = self.save_if_modified()
+        if result != None:
+            if filepath == None:
+                filepath = filedialog.askopenfilename(
+                    filetypes=(("Memory Image", "*.img"), ("All files", "*.*"))
+                )
+            if filepath:
+                try:
+                    dis = cdm8_dis.disassembleFile(filepath)
+                except (IOError, ValueError, IndexError):
+                    self.statusMsg.config(text="Bad image file")
+                    return "break"
+                self.asstxt.delete(1.0, "end")
+                self.asstxt.edit_reset()
+                self.asstxt.edit_separator()
+                self.mcode_list.delete(1.0, tk.END)
+                self.asstxt.insert(1.0, dis.toAsm(os.path.basename(filepath)))
+                self.asstxt.edit_modified(False)
+                self.file_path = None  # Not saved as source yet
+                self.set_title()
+                self.changed = True
+                self.highlighter()
+                self.asstxt.see("1.0")
+        return "break"
+
     def file_save(self, event=None):
         # if platform != "darwin":#Fix for Mac Save problem??
         self.master.config(cursor="watch")
@@ -2599,6 +2641,140 @@ class CocoIDE(tk.Frame):
             self.emumenu.entryconfig(10, label="Shadow SPs       ")
             self.Emu.shadowSP = False
 
+    def toggleHeatmap(self, event=None):
+        if self.heatmap:
+            self.anamenu.entryconfig(0, label="Memory Heatmap   ")
+            self.heatmap = False
+            self.memCounter.detach()  # Stop counting
+            self.memCounter = None
+        else:
+            self.anamenu.entryconfig(0, label="Memory Heatmap  ✔")
+            self.heatmap = True
+            self.memCounter = cdm8_prof.MemCounter(pages=len(self.Emu.memory))
+            self.memCounter.attach(self.Emu)
+        self.dispAllMemory()
+
+    def toggleStackStop(self, event=None):
+        if self.Emu.stackAction == "stop":
+            self.anamenu.entryconfig(2, label="Stop on Stack Overflow   ")
+            self.Emu.stackAction = "warn"
+        else:
+            self.anamenu.entryconfig(2, label="Stop on Stack Overflow  ✔")
+            self.Emu.stackAction = "stop"
+
+    def stackReport(self):
+        # Peak stack depth and any stack overflow, for the status message
+        page = self.Emu.curPage
+        msg = "\nPeak stack depth: %d bytes" % self.Emu.stackPeak[page]
+        if self.Emu.stackFaults:
+            page, adr, pc = self.Emu.stackFaults[0]
+            msg += "\nSTACK OVERFLOW at 0x%02x (PC=0x%02x)" % (adr, pc)
+        return msg
+
+    def toggleCoverage(self, event=None):
+        if self.coverage:
+            self.anamenu.entryconfig(3, label="Code Coverage   ")
+            self.coverage.detach()  # Stop recording
+            self.coverage = None
+        else:
+            self.anamenu.entryconfig(3, label="Code Coverage  ✔")
+            self.coverage = cdm8_prof.Coverage(pages=len(self.Emu.memory))
+            self.coverage.attach(self.Emu)
+        self.showCoverage()
+
+    def showCoverage(self):
+        # Highlight source lines not executed, and lines with branches
+        # that have only gone one way, since coverage was enabled
+        self.asstxt.tag_delete("uncov")
+        self.asstxt.tag_delete("partcov")
+        if not (self.coverage and self.codelist):
+            return
+        marks = self.coverage.annotate(self.codelist)
+        for n, (mark, text) in enumerate(marks):
+            line = "%d.0" % (n + 1)
+            if mark == "#####":
+                self.asstxt.tag_add("uncov", line, "%s lineend+1c" % line)
+            elif mark[-1] in "TN":
+                self.asstxt.tag_add("partcov", line, "%s lineend+1c" % line)
+        self.asstxt.tag_config("uncov", background=cf.uncovColour)
+        self.asstxt.tag_config("partcov", background=cf.partcovColour)
+        self.asstxt.tag_lower("uncov")
+        self.asstxt.tag_lower("partcov")
+
+    def saveCoverageReport(self, event=None):
+        if not (self.coverage and self.codelist):
+            self.statusMsg.config(text="Code Coverage\nnot enabled")
+            return "Cancelled"
+        filepath = filedialog.asksaveasfilename(
+            filetypes=(("Coverage Report", "*.cover"), ("All files", "*.*")),
+            defaultextension=".cover",
+        )
+        if filepath:
+            with open(filepath, "w") as f:
+                f.write(self.coverage.report(self.codelist))
+            return "saved"
+        return "Cancelled"
+
+    def saveTimingReport(self, event=None):
+        # Static best/worst case cycles of the compiled program's routines
+        if not self.codelist:
+            self.statusMsg.config(text="Compile first\nfor Timing Analysis")
+            return "Cancelled"
+        dis = cdm8_dis.disassemble(self.Emu.memory[0][0], self.symbols)
+        timing = cdm8_static.Timing(dis, cdm8_static.loopBounds(self.codelist))
+        isrs = [timing.times.get(v, (0, None))[1] for v in dis.vectors.values()]
+        if isrs:
+            worst = "unbounded" if None in isrs else max(isrs)
+            self.statusMsg.config(text="Worst ISR WCET\n%s cycles" % worst)
+        filepath = filedialog.asksaveasfilename(
+            filetypes=(("Timing Report", "*.timing"), ("All files", "*.*")),
+            defaultextension=".timing",
+        )
+        if filepath:
+            with open(filepath, "w") as f:
+                f.write(timing.annotate(self.codelist) + "\n" + timing.report())
+            return "saved"
+        return "Cancelled"
+
+    def saveStackReport(self, event=None):
+        # Static maximum stack depth against the memory left by the linker
+        if not self.codelist:
+            self.statusMsg.config(text="Compile first\nfor Stack Analysis")
+            return "Cancelled"
+        dis = cdm8_dis.disassemble(self.Emu.memory[0][0], self.symbols)
+        stack = cdm8_static.StackDepth(dis)
+        segments = cocol.allocated()
+        room = stack.room(segments)
+        if stack.depth == None:
+            self.statusMsg.config(text="Max stack unbounded\n%d bytes free" % room)
+        else:
+            msg = "Max stack %d bytes\n%d bytes free" % (stack.depth, room)
+            if stack.depth > room:
+                msg = "STACK OVERFLOW!\n" + msg
+            self.statusMsg.config(text=msg)
+        filepath = filedialog.asksaveasfilename(
+            filetypes=(("Stack Report", "*.stack"), ("All files", "*.*")),
+            defaultextension=".stack",
+        )
+        if filepath:
+            with open(filepath, "w") as f:
+                f.write(stack.report(segments))
+            return "saved"
+        return "Cancelled"
+
+    def saveHeatmap(self, event=None):
+        if not self.memCounter:
+            self.statusMsg.config(text="Memory Heatmap\nnot enabled")
+            return "Cancelled"
+        filepath = filedialog.asksaveasfilename(
+            filetypes=(("CSV File", "*.csv"), ("All files", "*.*")),
+            defaultextension=".csv",
+        )
+        if filepath:
+            self.memCounter.saveCSV(filepath)
+            return "saved"
+        return "Cancelled"
+
     def setArch(self, arch="vn", page=0, event=None):
 
         if self.Emu.setArch(arch, page=page) != "Unrecognised Architecture":
@@ -2740,9 +2916,12 @@ class CocoIDE(tk.Frame):
         codelist = None
         obj_code = None
         if errorMsg == None:
-            filebuff = io.StringIO(text)  # cocas likes to use a file type object!
             try:
-                obj_code, codelist, errorMsg = cocas.compile_asm(filebuff, self.cdm8ver)
+                if not self.toolchain:
+                    self.toolchain = cocorun.Toolchain(cdm8ver=self.cdm8ver)
+                obj_code, codelist, errorMsg, ctx = self.toolchain.assemble(
+                    text, self.cdm8ver
+                )
             except Exception as e:
                 errorMsg = e
 
@@ -2890,6 +3069,11 @@ class CocoIDE(tk.Frame):
                 for num in IMG:
                     self.Emu.memory[0][0][index] = num
                     index += 1
+                self.Emu.setStackGuard(cocol.allocated(), page=0)
+                self.codelist = codelist
+                self.symbols = cdm8_prof.asmSymbols(ctx, cocol.sects)
+                if self.coverage:  # New code, start again
+                    self.coverage.reset()
 
         # End of compile/link/load mem
 
@@ -2966,6 +3150,7 @@ class CocoIDE(tk.Frame):
     def resetEmu(self, event=None):
         self.initPC()
         self.Emu.SP = [0] * 8
+        self.Emu.intc.reset()  # Forget pending interrupts
         self.Emu.curPage = 0
         self.Emu.HALT = False
         self.runStopButton.config(
@@ -2992,6 +3177,9 @@ class CocoIDE(tk.Frame):
         # need to clear all memory changed pages
         for n in range(len(self.Emu.memChanged)):
             self.Emu.memChanged[n] = []
+        if self.memCounter:
+            self.memCounter.reset()
+        self.Emu.resetStackCheck()
         # self.highlighter()
         # Reset IO ports
         for port in self.IOPorts:
@@ -3079,7 +3267,17 @@ def main():
     # parser.add_argument('-p',dest='scrScale',action='store_const',const=True,default=False, help="-p  Presenter mode, expands program window to fill screen")
     parser.add_argument("filename", nargs="?", help="Option <filename>")
     # parser.add_argument("--file", "-f", type=str, required=False)
+    parser.add_argument(
+        "--selfprof",
+        dest="selfprof",
+        nargs="?",
+        const="time",
+        default="",
+        choices=["time", "cprofile"],
+        help="profile the IDE and toolchain (or set COCO_SELFPROF)",
+    )
     args = parser.parse_args()
+    cdm8_prof.selfProfile(args.selfprof, ideClass=CocoIDE)
     # print(args.scrScale, args.filename)#debug
     # sys.excepthook = savefiles # If fatal error save files!
     Emu = cdm8_emu.CDM8Emu()
@@ -5,6 +5,10 @@
 # V2.0  GUI Added M.L.Walters, Oct 2017
 # V2.2  fileout=True keyword added to link() to suppress file output
 #       when run from CocoIDE (VOIDS problem with MAC? when compiling)
+# V2.3  allocated() lists memory used by the last link (stack overflow checks)
+# V2.4  Options passed to link() as an object (options()), command line only
+#       parsed when run as a script. GUI moved to cocol_gui.py (Tk on demand)
+# V2.5  link(objtexts=[(name, text), ...]) links object texts from memory
 
 
 # Python 2 and 3 compatibility
@@ -15,178 +19,24 @@ try:
 except NameError:
     pass  # Running on Python 3
 
-import argparse
 import os
 import sys
+from types import SimpleNamespace
 from typing import List, Optional
 
-try:
-    # Python 3 tk
-    import tkinter as tk
-    import tkinter.font as font
-    from tkinter import filedialog, messagebox
-    from tkinter import scrolledtext as sctx
-    from tkinter import ttk
-except ImportError:
-    # Python 2 tk (runs but not exhaustively tested!)
-    # Ames lib (sendfile.py) not python 2 compatible (urllib)
-    import ScrolledText as sctx
-    import tkFileDialog as filedialog
-    import tkFont as font
-    import Tkinter as tk
-    import tkMessageBox as messagebox
-    import ttk
-
-
-TITLE = "Cocol Linker GUI V2.0"
-
-
 IMG = [0] * 256
 taken = []
 sects = {}
 xtrns = {}
-objfiles = []
 errormsg = ""
 term = False
 
 
-class CocoLink(tk.Tk):
-    def __init__(self, master=None, name="cocol", exitroot=False, sym=True) -> None:
-        super().__init__()
-        self.master = master
-        self.mainWin = tk.Toplevel(master=master)
-        self.mainWin.lift()
-        # self.mainWin.update()
-        # self.mainWin.wm_attributes("-topmost", False)
-
-        # Sets up the window
-        self.mainWin.resizable(width=False, height=False)
-        self.mainWin.title("Link files: cocol GUI")
-        if __name__ == "__main__":
-            self.mainWin.protocol(
-                "WM_DELETE_WINDOW", self.closeCocol
-            )  # Only if main module
-        self.mainWin.focus()
-
-        # Create buttonbar panel
-        buttonBar = tk.Frame(
-            self.mainWin, name="buttonbar", height=35, width=400, border=2, pady=5
-        )
-        buttonBar.pack(side=tk.TOP, fill=tk.X, expand=False)
-
-        # Create link panel
-        linkPanel = tk.Frame(
-            self.mainWin, name="link", border=2, relief="sunken", pady=5
-        )
-        linkPanel.pack(side=tk.TOP, fill=tk.BOTH, expand=1)
-        self.linkText = sctx.ScrolledText(linkPanel, height=10)
-        self.linkText.pack(expand=1)
-        self.linkText.bind("<Key>", lambda e: "break")
-        # self.linkText.config(state=tk.DISABLED)
-
-        # Create seperator panel
-        seperator = tk.Frame(self.mainWin, name="sep1", height=35, border=2, pady=5)
-        seperator.pack(side=tk.TOP, fill=tk.BOTH, expand=False)
-
-        # Create status panel
-        statusPanel = tk.Frame(
-            self.mainWin, name="status", border=2, relief="sunken", pady=5, bg="white"
-        )
-        statusPanel.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-        self.statusText = sctx.ScrolledText(statusPanel, height=25)
-        self.statusText.pack(expand=1)
-        self.statusText.bind("<Key>", lambda e: "break")
-
-        # Create add obj button for the linker
-        addButton = tk.Button(
-            buttonBar, text="Add\n OBJ File", command=self.addObjFile
-        )  # , height=2)
-        addButton.pack(side=tk.LEFT)
-
-        # Create remove obj button for the linker
-        remButton = tk.Button(
-            buttonBar, text="Remove\n OBJ File", command=self.remObjFile
-        )  # , height=2)
-        remButton.pack(side=tk.LEFT)
-
-        # Create link symbol button for the linker
-        linkSymbolButton = tk.Button(
-            buttonBar,
-            text="Link\n Include Symbols",
-            command=lambda: self.linkFiles(sym=sym),
-        )  # , height=2)
-        linkSymbolButton.pack(side=tk.LEFT)
-
-        # Create link logisim button for the linker
-        linkLogisimButton = tk.Button(
-            buttonBar, text="Link\n Logisim Image", command=self.linkFiles
-        )  # , height=2)
-        linkLogisimButton.pack(side=tk.LEFT)
-
-        # Create quit button for the linker
-        quitButton = tk.Button(
-            buttonBar, text="Quit\n Linker", command=self.closeCocol
-        )  # , height=2)
-        quitButton.pack(side=tk.LEFT)
-
-    def addObjFile(self, event=None) -> None:
-        global objfiles
-        # print("add file")
-        filepath = None
-        try:
-            filepath = filedialog.askopenfilename(
-                filetypes=(("CDM8 Object File", "*.obj"), ("All files", "*.*"))
-            )
-        except:  # noqa
-            pass
-        self.mainWin.lift()
-        if filepath:
-            objfiles.append(filepath)
-            # print(objfiles)
-            self.linkText.delete(1.0, tk.END)
-            for filepath in objfiles:
-                # print(filepath)
-                self.linkText.insert(tk.END, filepath + "\n")
-
-    def remObjFile(self, event=None) -> None:  # Event is never used here
-        print("rem file")
-        linno = int(float(self.linkText.index("insert linestart")))
-        # print(linno)
-        if linno <= len(objfiles):
-            del objfiles[linno - 1]
-            self.linkText.delete("insert linestart", "insert lineend +1c")
-
-    def linkFiles(
-        self, event=None, sym: bool = False
-    ) -> None:  # Event is never used here
-        global args
-        args.sym = sym
-        args.lst = True
-
-        # self.statusText.delete("1.0", tk.END)
-        if len(objfiles) == 0:
-            errormsg = "No files to Link!\n"
-        else:
-            errormsg, listing, image = link(objfiles, termp=False, fileout=True)
-        if errormsg:
-            self.statusText.insert(tk.END, errormsg)
-        else:
-            self.statusText.insert(
-                tk.END,
-                "\n\nLINKED OK! Image written to:\n " + objfiles[0][:-4] + ".img\n",
-            )
-            self.statusText.insert(
-                tk.END, "\nLINKER REPORT LISTING:\n" + listing  # noqa
-            )  # noqa
-            self.statusText.see(tk.END)
-        # while int(float(self.statusText.index("end linestart ")))>11: # Scroll
-        #    #print("link files", int(float(self.statusText.index("end linestart "))))
-        #    self.statusText.delete("1.0", "1.0 lineend +1c")# Scroll
+def CocoLink(master=None, name="cocol", exitroot=False, sym=True):
+    # The linker GUI (cocol_gui.CocoLink), Tk is only imported when it is used
+    import cocol_gui
 
-    def closeCocol(self) -> None:
-        self.mainWin.destroy()
-        if __name__ == "__main__":
-            self.master.destroy()
+    return cocol_gui.CocoLink(master, name, exitroot, sym)
 
 
 # Functions
@@ -254,14 +104,27 @@ def deploy(name: str, addr: int):
     return
 
 
+def allocated() -> List[tuple]:
+    """Memory used by the last link(), as sorted (start, size) segments of
+    the absolute segments and deployed relocatable sections"""
+    segs = [(addr, size) for (addr, size, f) in taken]
+    for name in sects:
+        if "start" in sects[name] and "data" in sects[name]:
+            segs += [(sects[name]["start"], len(sects[name]["data"]))]
+    return sorted(segs)
+
+
 def link(
     objectfiles: list = [],
     ideobjtext: str = None,
     filename: str = "linkout",
     termp: bool = False,
     fileout=True,
+    options=None,
+    objtexts=None,
 ):
-    global IMG, taken, sects, xtrns, args, errormsg, term, args
+    global IMG, taken, sects, xtrns, args, errormsg, term
+    args = options or defaults  # See options()
     IMG = [0] * 256
     taken = []
     sects = {}
@@ -291,10 +154,15 @@ def link(
         objtxtlist = ideobjtext.split("\n")
         for line in objtxtlist:
             objtext += [(line, filename)]
+    elif objtexts:
+        objfilename = objtexts[0][0]
     elif listofobj:
         objfilename = listofobj[0]
     else:
         return "Error: Nothing to compile!", None, None
+    # Object texts in memory, as (name, text) pairs, e.g. from cocas.compile_asm
+    for name, text in objtexts or []:
+        objtext += [(line, name) for line in text.split("\n")]
 
     # , args.sym, objtext)
     # print("1 ",objtext)
@@ -633,69 +501,83 @@ def link(
     return errormsg, listing, IMG
 
 
-# Parse command line
-parser = argparse.ArgumentParser(description="CdM-8 Linker v1.0")
-parser.add_argument("objfile", type=str, nargs="*", help="objfile[.obj] ...")
-
-parser.add_argument(
-    "-l",
-    dest="lst",
-    action="store_const",
-    const=True,
-    default=False,
-    help="produce summary",
-)
-parser.add_argument(
-    "-a",
-    dest="abs",
-    action="store_const",
-    const=True,
-    default=False,
-    help="absolute code",
-)
-parser.add_argument(
-    "-r",
-    dest="rel",
-    action="store_const",
-    const=True,
-    default=False,
-    help="load starting with main",
-)
-parser.add_argument(
-    "-y",
-    dest="encrypt",
-    action="store_const",
-    const=True,
-    default=False,
-    help="encrypt the image file",
-)
-parser.add_argument(
-    "-z",
-    dest="zero_bound",
-    action="store_const",
-    const=True,
-    default=True,
-    help="start from 0",
+# Options (the command line options) and command line
+DEFAULTS = dict(
+    lst=False, abs=False, rel=False, encrypt=False, zero_bound=True, sym=False
 )
-parser.add_argument(
-    "-s",
-    dest="sym",
-    action="store_const",
-    const=True,
-    default=False,
-    help="symbol-enhanced image",
-)
-args = parser.parse_args()
+
+
+def options(**kwargs):
+    # Linker options as an object, defaults overridden by kwargs, e.g.
+    # link(files, options=options(sym=True)). No command line is parsed
+    unknown = set(kwargs) - set(DEFAULTS)
+    if unknown:
+        raise TypeError("Unknown linker option(s): " + ", ".join(sorted(unknown)))
+    return SimpleNamespace(**dict(DEFAULTS, **kwargs))
+
+
+defaults = options()
+args = defaults  # Options of the current or last link()
+
+
+def makeParser():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CdM-8 Linker v1.0")
+    parser.add_argument("objfile", type=str, nargs="*", help="objfile[.obj] ...")
+
+    parser.add_argument(
+        "-l",
+        dest="lst",
+        action="store_const",
+        const=True,
+        help="produce summary",
+    )
+    parser.add_argument(
+        "-a",
+        dest="abs",
+        action="store_const",
+        const=True,
+        help="absolute code",
+    )
+    parser.add_argument(
+        "-r",
+        dest="rel",
+        action="store_const",
+        const=True,
+        help="load starting with main",
+    )
+    parser.add_argument(
+        "-y",
+        dest="encrypt",
+        action="store_const",
+        const=True,
+        help="encrypt the image file",
+    )
+    parser.add_argument(
+        "-z",
+        dest="zero_bound",
+        action="store_const",
+        const=True,
+        help="start from 0",
+    )
+    parser.add_argument(
+        "-s",
+        dest="sym",
+        action="store_const",
+        const=True,
+        help="symbol-enhanced image",
+    )
+    parser.set_defaults(**DEFAULTS)
+    return parser
 
 
 if __name__ == "__main__":
-    if args.objfile:  # Run from CLI
-        link(args.objfile, termp=True)
+    cliargs = makeParser().parse_args()
+    if cliargs.objfile:  # Run from CLI
+        link(cliargs.objfile, termp=True, options=cliargs)
     else:
         # Fire up GUI!
-        args.lst = True
-        # args.sym=True
-        root = tk.Tk()
-        root.withdraw()
-        cocolGUI = CocoLink(master=root, name="cocol", exitroot=True)
-        root.mainloop()
+        import cocol_gui
+
+        cocol_gui.main()
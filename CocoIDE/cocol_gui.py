@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# Cocol linker GUI, the linker itself is cocol.py
+# V2.0  GUI Added M.L.Walters, Oct 2017
+# V2.4  Moved from cocol.py, so the linker can be imported without Tk
+
+
+# Python 2 and 3 compatibility
+from __future__ import absolute_import, division, print_function
+
+try:
+    # Python 3 tk
+    import tkinter as tk
+    import tkinter.font as font
+    from tkinter import filedialog, messagebox
+    from tkinter import scrolledtext as sctx
+    from tkinter import ttk
+except ImportError:
+    # Python 2 tk (runs but not exhaustively tested!)
+    # Ames lib (sendfile.py) not python 2 compatible (urllib)
+    import ScrolledText as sctx
+    import tkFileDialog as filedialog
+    import tkFont as font
+    import Tkinter as tk
+    import tkMessageBox as messagebox
+    import ttk
+
+import cocol
+
+TITLE = "Cocol Linker GUI V2.0"
+
+objfiles = []
+
+
+class CocoLink(tk.Tk):
+    def __init__(self, master=None, name="cocol", exitroot=False, sym=True) -> None:
+        super().__init__()
+        self.master = master
+        self.mainWin = tk.Toplevel(master=master)
+        self.mainWin.lift()
+        # self.mainWin.update()
+        # self.mainWin.wm_attributes("-topmost", False)
+
+        # Sets up the window
+        self.mainWin.resizable(width=False, height=False)
+        self.mainWin.title("Link files: cocol GUI")
+        self.exitroot = exitroot
+        if exitroot:
+            self.mainWin.protocol(
+                "WM_DELETE_WINDOW", self.closeCocol
+            )  # Only if main module
+        self.mainWin.focus()
+
+        # Create buttonbar panel
+        buttonBar = tk.Frame(
+            self.mainWin, name="buttonbar", height=35, width=400, border=2, pady=5
+        )
+        buttonBar.pack(side=tk.TOP, fill=tk.X, expand=False)
+
+        # Create link panel
+        linkPanel = tk.Frame(
+            self.mainWin, name="link", border=2, relief="sunken", pady=5
+        )
+        linkPanel.pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+        self.linkText = sctx.ScrolledText(linkPanel, height=10)
+        self.linkText.pack(expand=1)
+        self.linkText.bind("<Key>", lambda e: "break")
+        # self.linkText.config(state=tk.DISABLED)
+
+        # Create seperator panel
+        seperator = tk.Frame(self.mainWin, name="sep1", height=35, border=2, pady=5)
+        seperator.pack(side=tk.TOP, fill=tk.BOTH, expand=False)
+
+        # Create status panel
+        statusPanel = tk.Frame(
+            self.mainWin, name="status", border=2, relief="sunken", pady=5, bg="white"
+        )
+        statusPanel.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.statusText = sctx.ScrolledText(statusPanel, height=25)
+        self.statusText.pack(expand=1)
+        self.statusText.bind("<Key>", lambda e: "break")
+
+        # Create add obj button for the linker
+        addButton = tk.Button(
+            buttonBar, text="Add\n OBJ File", command=self.addObjFile
+        )  # , height=2)
+        addButton.pack(side=tk.LEFT)
+
+        # Create remove obj button for the linker
+        remButton = tk.Button(
+            buttonBar, text="Remove\n OBJ File", command=self.remObjFile
+        )  # , height=2)
+        remButton.pack(side=tk.LEFT)
+
+        # Create link symbol button for the linker
+        linkSymbolButton = tk.Button(
+            buttonBar,
+            text="Link\n Include Symbols",
+            command=lambda: self.linkFiles(sym=sym),
+        )  # , height=2)
+        linkSymbolButton.pack(side=tk.LEFT)
+
+        # Create link logisim button for the linker
+        linkLogisimButton = tk.Button(
+            buttonBar, text="Link\n Logisim Image", command=self.linkFiles
+        )  # , height=2)
+        linkLogisimButton.pack(side=tk.LEFT)
+
+        # Create quit button for the linker
+        quitButton = tk.Button(
+            buttonBar, text="Quit\n Linker", command=self.closeCocol
+        )  # , height=2)
+        quitButton.pack(side=tk.LEFT)
+
+    def addObjFile(self, event=None) -> None:
+        global objfiles
+        # print("add file")
+        filepath = None
+        try:
+            filepath = filedialog.askopenfilename(
+                filetypes=(("CDM8 Object File", "*.obj"), ("All files", "*.*"))
+            )
+        except:  # noqa
+            pass
+        self.mainWin.lift()
+        if filepath:
+            objfiles.append(filepath)
+            # print(objfiles)
+            self.linkText.delete(1.0, tk.END)
+            for filepath in objfiles:
+                # print(filepath)
+                self.linkText.insert(tk.END, filepath + "\n")
+
+    def remObjFile(self, event=None) -> None:  # Event is never used here
+        print("rem file")
+        linno = int(float(self.linkText.index("insert linestart")))
+        # print(linno)
+        if linno <= len(objfiles):
+            del objfiles[linno - 1]
+            self.linkText.delete("insert linestart", "insert lineend +1c")
+
+    def linkFiles(
+        self, event=None, sym: bool = False
+    ) -> None:  # Event is never used here
+        options = cocol.options(sym=sym, lst=True)
+
+        # self.statusText.delete("1.0", tk.END)
+        if len(objfiles) == 0:
+            errormsg = "No files to Link!\n"
+        else:
+            errormsg, listing, image = cocol.link(
+                objfiles, termp=False, fileout=True, options=options
+            )
+        if errormsg:
+            self.statusText.insert(tk.END, errormsg)
+        else:
+            self.statusText.insert(
+                tk.END,
+                "\n\nLINKED OK! Image written to:\n " + objfiles[0][:-4] + ".img\n",
+            )
+            self.statusText.insert(
+                tk.END, "\nLINKER REPORT LISTING:\n" + listing  # noqa
+            )  # noqa
+            self.statusText.see(tk.END)
+        # while int(float(self.statusText.index("end linestart ")))>11: # Scroll
+        #    #print("link files", int(float(self.statusText.index("end linestart "))))
+        #    self.statusText.delete("1.0", "1.0 lineend +1c")# Scroll
+
+    def closeCocol(self) -> None:
+        self.mainWin.destroy()
+        if self.exitroot:
+            self.master.destroy()
+
+
+def main() -> None:
+    root = tk.Tk()
+    root.withdraw()
+    cocolGUI = CocoLink(master=root, name="cocol", exitroot=True)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# CdM8 IDE and emulator
+# (c) M L Walters and A Shafarenko June-July 2018
+
+####### CDM8 headless assemble, link and run
+# V1.0 One shot pipeline: cocas.compile_asm, cocol.link and CDM8Emu in
+#      memory (no .obj/.img files, no Tk), with a step budget, breakpoints,
+#      devices and an input script. Text or JSON report
+# V1.1 Toolchain: warm session, macro libraries parsed once, assembled
+#      sources and files cached, one emulator reused. build() returns an Image
+
+
+# Python3 and 2
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+
+import cdm8_dev
+import cdm8_emu
+import cdm8_prof
+import cocas
+import cocol
+
+STEPS = 1000000  # Default step budget
+CACHESIZE = 256  # Assembled sources kept by a Toolchain, oldest dropped
+# Device models by name, e.g. "Terminal" (see makeDevice())
+DEVICES = dict(
+    (cls.name, cls)
+    for cls in vars(cdm8_dev).values()
+    if isinstance(cls, type) and issubclass(cls, cdm8_dev.Device)
+)
+del DEVICES["Device"]
+
+
+def readSources(files, read=None):
+    # files are .asm or .obj file names, or (name, text) pairs with name
+    # ending .asm or .obj. read(filename) returns a file's text.
+    # Returns [(name, extension, text)]
+    sources = []
+    for item in files:
+        if isinstance(item, str):
+            if read:
+                item = (item, read(item))
+            else:
+                with open(item, "r") as f:
+                    item = (item, f.read())
+        name, text = item
+        base, ext = os.path.splitext(os.path.basename(name))
+        if ext not in (".asm", ".obj"):
+            raise ValueError(name + ": not an .asm or .obj file")
+        sources.append((base, ext, text))
+    return sources
+
+
+class Image:
+    """
+    Linked memory image from Toolchain.build(): data, the 256 bytes of code
+    memory, symbols {address:name}, segments, the memory allocated to code
+    and data as (start, size), and listings {source name: listing}.
+    """
+
+    def __init__(self, data, symbols, segments, listings=None, cdm8ver=4):
+        self.data = data
+        self.symbols = symbols
+        self.segments = segments
+        self.listings = listings or {}
+        self.cdm8ver = cdm8ver
+
+
+class Toolchain:
+    """
+    Warm toolchain session for repeated builds and runs. The macro
+    libraries (standard.mlb, then libraries) are parsed once, assembled
+    sources are cached by their text, files by modification time, and
+    every run() reuses one CDM8Emu:
+
+        session = Toolchain(["extra.mlb"])
+        image = session.build(["main.asm", "lib.obj"])
+        report = session.run(image, steps=10000, devices=["Terminal@0xF0"])
+    """
+
+    def __init__(self, libraries=(), cdm8ver=4):
+        self.cdm8ver = cdm8ver
+        self.macros = {}
+        self.libraries = []
+        self.version = 0  # Of the macros, part of the assembled cache keys
+        # {(text, cdm8ver, version): (obj, listing, error, err_line, ctx)}
+        self.assembled = {}
+        self.files = {}  # {filename: ((mtime, size), text)}
+        self.hits = 0
+        self.misses = 0
+        self.emu = None
+        standard = cocas.libraryPath("standard.mlb")
+        if os.path.isfile(standard):
+            self.addLibrary(standard)
+        else:
+            sys.stderr.write("WARNING: no standard.mlb found\n")
+        for filename in libraries:
+            self.addLibrary(filename)
+
+    def addLibrary(self, filename):
+        # Parse a .mlb macro library, its macros replace any of the same name.
+        # Raises IOError or ValueError
+        self.macros.update(cocas.loadMacros(filename))
+        self.libraries.append(filename)
+        self.version += 1
+
+    def readFile(self, filename):
+        # Text of a file, read again only if it has changed
+        stat = os.stat(filename)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self.files.get(filename)
+        if cached and cached[0] == key:
+            return cached[1]
+        with open(filename, "r") as f:
+            text = f.read()
+        self.files[filename] = (key, text)
+        return text
+
+    def assemble(self, text, cdm8ver=None):
+        # cocas.compile_asm() of source text with the session's macros,
+        # cached. Returns (object text, listing, error message, Context) and
+        # sets cocas.err_line, as compile_asm does. Treat as read only
+        cdm8ver = cdm8ver or self.cdm8ver
+        key = (text, cdm8ver, self.version)
+        if key in self.assembled:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if len(self.assembled) >= CACHESIZE:
+                del self.assembled[next(iter(self.assembled))]
+            ctx = cocas.Context(cdm8ver)
+            obj, listing, error = cocas.compile_asm(
+                text.splitlines(), cdm8ver, ctx, self.macros
+            )
+            self.assembled[key] = (obj, listing, error, cocas.err_line, ctx)
+        obj, listing, error, cocas.err_line, ctx = self.assembled[key]
+        return obj, listing, error, ctx
+
+    def build(self, files, rel=False, cdm8ver=None):
+        # Assemble the .asm sources and link them with the .obj ones, in
+        # memory (see readSources()). rel: load starting with rsect main
+        # (cocol -r). Returns an Image, raises ValueError with the assembler
+        # or linker error message
+        cdm8ver = cdm8ver or self.cdm8ver
+        objtexts = []
+        contexts = []
+        listings = {}
+        for name, ext, text in readSources(files, self.readFile):
+            if ext == ".asm":
+                obj, listing, err, ctx = self.assemble(text, cdm8ver)
+                if err:
+                    raise ValueError("%s.asm: %s" % (name, err.strip()))
+                contexts.append(ctx)
+                listings[name] = listing
+                text = obj
+            objtexts.append((name, text))
+        if not objtexts:
+            raise ValueError("Nothing to build")
+        err, listing, img = cocol.link(
+            objtexts=objtexts,
+            termp=False,
+            fileout=False,
+            options=cocol.options(rel=rel),
+        )
+        if err:
+            raise ValueError(err.strip())
+        symbols = {}
+        for ctx in contexts:
+            # Labels of the placed relocatable sections, then absolute and entries
+            for sect in ctx.rsects:
+                start = cocol.sects.get(sect, {}).get("start")
+                if start is not None:
+                    for name, offset in ctx.labels.get(sect, {}).items():
+                        if name[0] not in "!>":
+                            symbols[(start + offset) % 256] = name
+            symbols.update(cdm8_prof.asmSymbols(ctx, cocol.sects))
+        return Image(list(img), symbols, cocol.allocated(), listings, cdm8ver)
+
+    def emulator(self, cdm8ver=None):
+        # The session's CDM8Emu, in its power on state
+        options = cdm8_emu.options(v3=((cdm8ver or self.cdm8ver) == 3))
+        if self.emu is None:
+            self.emu = cdm8_emu.CDM8Emu(options=options)
+        else:
+            self.emu.options = options
+            self.emu.powerUp()
+        return self.emu
+
+    def run(self, image, steps=STEPS, script=None, breakpoints=(), devices=()):
+        # Run image on the session's emulator, see run() for the arguments
+        # and the report
+        report = {"status": "error", "error": None, "steps": 0, "cycles": 0}
+        emu = self.emulator(image.cdm8ver)
+        models = []
+        try:
+            for device in devices:
+                if isinstance(device, str):
+                    device = makeDevice(device)
+                device.attach(emu)
+                models.append(device)
+            if script is not None:
+                inputs = [device for device in models if takesInput(device)]
+                if not inputs:
+                    raise ValueError("No device for the input script")
+                inputs[0].play(script)
+            stops = set(breakAddress(bp, image.symbols) for bp in breakpoints)
+        except (ValueError, IOError) as e:
+            report["error"] = str(e)
+        else:
+            emu.memory[0][0] = list(image.data)
+            emu.setStackGuard(image.segments, page=0)
+            status, count = emu.runFor(steps, stops)
+            for device in models:
+                if isinstance(device, cdm8_dev.Terminal):
+                    device.flush()
+            page = emu.mm[emu.curPage]
+            pc = emu.PC
+            if status == "halt" and emu.IR == 0xD4:
+                pc = (pc - 1) % 256  # The halt instruction, not the one after
+            report.update(
+                status=status,
+                steps=count,
+                cycles=emu.cycles,
+                pc=pc,
+                symbol=image.symbols.get(pc),
+                registers=list(emu.regs),
+                flags=emu.CVZN,
+                sp=emu.getSP(),
+                page=emu.curPage,
+                stackPeak=emu.stackPeak[page],
+                stackFaults=[list(fault) for fault in emu.stackFaults],
+                devices=[deviceState(device) for device in models],
+            )
+        finally:
+            # The emulator is reused, leave no device mapped on it
+            for device in models:
+                device.detach()
+        return report
+
+
+session = None  # Toolchain shared by build() and run()
+
+
+def toolchain():
+    global session
+    if session is None:
+        session = Toolchain()
+    return session
+
+
+def build(files, cdm8ver=4, rel=False):
+    # Build an Image with the shared Toolchain, see Toolchain.build()
+    return toolchain().build(files, rel, cdm8ver)
+
+
+def makeDevice(spec, emu=None):
+    # Device from "Name" or "Name@address", e.g. "Terminal@0xF0"
+    name, sep, adr = spec.partition("@")
+    if name not in DEVICES:
+        raise ValueError(
+            "Unknown device %s, one of: %s" % (name, ", ".join(sorted(DEVICES)))
+        )
+    try:
+        adr = int(adr, 0) if sep else 0xF0
+    except ValueError:
+        raise ValueError("Bad device address: " + spec)
+    try:
+        return DEVICES[name](portAdr=adr, emu=emu)
+    except ValueError as e:  # Ports past 0xFF
+        raise ValueError("Bad device address: %s, %s" % (spec, e))
+
+
+def takesInput(device):
+    return type(device).input is not cdm8_dev.Device.input
+
+
+def breakAddress(bp, symbols):
+    # Breakpoint address from a number or a label
+    if isinstance(bp, int):
+        return bp & 0xFF
+    labels = dict((name, adr) for adr, name in symbols.items())
+    if bp in labels:
+        return labels[bp]
+    try:
+        return int(bp, 0) & 0xFF
+    except ValueError:
+        raise ValueError("Unknown breakpoint: " + bp)
+
+
+def deviceState(device):
+    state = {"name": device.name, "address": device.portAdr}
+    state["outputs"] = dict(("%02x" % a, v) for a, v in device.portOPvals.items())
+    if hasattr(device, "text"):
+        state["text"] = device.text()
+    if isinstance(device, cdm8_dev.Terminal):
+        state["output"] = device.takeOutput()
+    return state
+
+
+def run(
+    files, steps=STEPS, script=None, breakpoints=(), devices=(), cdm8ver=4, rel=False
+):
+    """
+    Assemble, link and run files (see readSources()) from reset until the
+    processor halts, reaches a breakpoint (address or label) or has run
+    steps instructions. devices are device specs (see makeDevice()) or
+    cdm8_dev models; script (see cdm8_dev.readScript()) is played into the
+    first device that takes input. rel: load starting with rsect main.
+
+    Returns a report dict (JSON serialisable): status "halt", "break",
+    "steps" or "error" (error holds the message), steps, cycles, pc (of
+    the halt instruction, after a halt), registers, flags, sp, stack peak
+    and overflows, and the state of each device (output port values, text
+    and terminal output).
+    """
+    try:
+        image = build(files, cdm8ver, rel)
+    except (ValueError, IOError) as e:
+        return {"status": "error", "error": str(e), "steps": 0, "cycles": 0}
+    return toolchain().run(image, steps, script, breakpoints, devices)
+
+
+def textReport(report):
+    if report["status"] == "error":
+        return "Error: " + report["error"] + "\n"
+    stops = {
+        "halt": "Halted",
+        "break": "Breakpoint",
+        "steps": "Step budget used up",
+    }
+    lines = [
+        "%s at %02X%s after %d steps, %d cycles"
+        % (
+            stops[report["status"]],
+            report["pc"],
+            " (%s)" % report["symbol"] if report["symbol"] else "",
+            report["steps"],
+            report["cycles"],
+        ),
+        "r0=%02X r1=%02X r2=%02X r3=%02X" % tuple(report["registers"])
+        + " CVZN=%s SP=%02X page %d"
+        % (format(report["flags"] & 0xF, "04b"), report["sp"], report["page"]),
+        "Peak stack depth %d bytes" % report["stackPeak"],
+    ]
+    for page, adr, pc in report["stackFaults"]:
+        lines.append(
+            "Stack overflow: page %d write at %02X overwrites code/data (PC=%02X)"
+            % (page, adr, pc)
+        )
+    for device in report["devices"]:
+        values = " ".join(
+            "%s=%02X" % (adr.upper(), val) for adr, val in device["outputs"].items()
+        )
+        lines.append("%s@%02X %s" % (device["name"], device["address"], values))
+        if "text" in device:
+            lines.append("  " + repr(device["text"]))
+        if device.get("output"):
+            lines.append("  " + repr(device["output"]))
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="CdM-8 assemble, link and run v1.0",
+        epilog="Exit status: 0 halt or breakpoint, 1 error, 2 step budget used up."
+        " Devices: " + ", ".join(sorted(DEVICES)),
+    )
+    parser.add_argument("files", nargs="+", help="source.asm or object.obj files")
+    parser.add_argument(
+        "-n", dest="steps", type=int, default=STEPS, help="step budget (instructions)"
+    )
+    parser.add_argument(
+        "-b",
+        dest="breakpoints",
+        action="append",
+        default=[],
+        help="stop at address or label (repeatable)",
+    )
+    parser.add_argument(
+        "-d",
+        dest="devices",
+        action="append",
+        default=[],
+        help="attach device Name[@address], e.g. Terminal@0xF0 (repeatable)",
+    )
+    parser.add_argument(
+        "-i", dest="script", help="input script file for the first input device"
+    )
+    parser.add_argument(
+        "-r",
+        dest="rel",
+        action="store_const",
+        const=True,
+        default=False,
+        help="load starting with rsect main",
+    )
+    parser.add_argument(
+        "-v3",
+        dest="v3",
+        action="store_const",
+        const=True,
+        default=False,
+        help="assume CdM-8 Mark 3 instruction set",
+    )
+    parser.add_argument(
+        "-f",
+        dest="format",
+        choices=["text", "json"],
+        default="text",
+        help="report format",
+    )
+    args = parser.parse_args(argv)
+    for spec in args.devices:
+        try:
+            makeDevice(spec)
+        except ValueError as e:
+            parser.error(str(e))
+    report = run(
+        args.files,
+        steps=args.steps,
+        script=args.script,
+        breakpoints=args.breakpoints,
+        devices=args.devices,
+        cdm8ver=3 if args.v3 else 4,
+        rel=args.rel,
+    )
+    if args.format == "json":
+        print(json.dumps(report, indent=2))
+    else:
+        sys.stdout.write(textReport(report))
+    return {"halt": 0, "break": 0, "error": 1, "steps": 2}[report["status"]]
+
+
+if __name__ == "__main__":
+    sys.exit(main())